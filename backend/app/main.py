@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import movements_router, auth_router, inventory_router, export_router, config_router, report_router, juego_router
+from app.services.cache import cache
 
 
 app = FastAPI(title="GCO Siigo API", version="2.1.0")
@@ -31,6 +32,12 @@ async def startup_event():
     # Startup complete
     logger.info("Ready to accept connections.")
 
+@app.on_event("shutdown")
+def shutdown_event():
+    # Cloud uploads are write-behind: push what is still queued before the instance goes away
+    logger.info(f"Flushing pending cache uploads: {cache.upload_stats()}")
+    cache.flush(timeout=25)
+
 from fastapi.middleware.gzip import GZipMiddleware
 
 app.add_middleware(
@@ -4,9 +4,12 @@ from pydantic import BaseModel
 import firebase_admin
 from firebase_admin import auth, credentials
 import base64
+import hashlib
 import json
 import os
+import time
 from app.services import roles as role_service
+from app.services.mem_cache import MemCache
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -40,6 +43,18 @@ except ValueError:
     except Exception as e:
         print(f"Warning: Firebase Admin init failed: {e}")
 
+# Verified tokens: sha256(token) -> email, kept until shortly before the token's exp
+TOKEN_CACHE_MAX_TTL_S = 3600
+TOKEN_EXP_SKEW_S = 30
+_verified_tokens = MemCache(max_entries=5000, max_bytes=8 * 1024 * 1024)
+
+def _remember_token(token_key: str, email: str, exp):
+    if not isinstance(exp, (int, float)):
+        return
+    ttl = min(exp - time.time() - TOKEN_EXP_SKEW_S, TOKEN_CACHE_MAX_TTL_S)
+    if ttl > 0:
+        _verified_tokens.set(token_key, email, ttl)
+
 def verify_token(request: Request, token: str = Depends(oauth2_scheme)):
     if not token:
         token = request.query_params.get("token")
@@ -47,12 +62,18 @@ def verify_token(request: Request, token: str = Depends(oauth2_scheme)):
     if not token:
         raise HTTPException(status_code=401, detail="Invalid Authentication Token")
 
-    user_email = None
+    # 0. Already verified (parallel dashboard calls, SSE reconnects)
+    token_key = "tok:" + hashlib.sha256(token.encode("utf-8")).hexdigest()
+    user_email = _verified_tokens.get(token_key)
+    if user_email:
+        return {"email": user_email, "role": role_service.get_user_role(user_email)}
     
     # 1. Try validating with Firebase Admin SDK (Secure)
     try:
         decoded_token = auth.verify_id_token(token)
         user_email = decoded_token.get("email")
+        if user_email:
+            _remember_token(token_key, user_email, decoded_token.get("exp"))
     except Exception as e:
         pass
 
@@ -64,6 +85,7 @@ def verify_token(request: Request, token: str = Depends(oauth2_scheme)):
                 payload = parts[1]
                 padded = payload + '=' * (-len(payload) % 4)
                 data = json.loads(base64.urlsafe_b64decode(padded))
+                # Unverified: never cached in _verified_tokens
                 user_email = data.get("email")
         except Exception:
             pass
@@ -75,7 +97,7 @@ def verify_token(request: Request, token: str = Depends(oauth2_scheme)):
     if not user_email:
         raise HTTPException(status_code=401, detail="Invalid Authentication Token")
 
-    # Determine Role Dynamic Lookup
+    # Determine Role Dynamic Lookup (in-memory role map, see roles.py)
     role = role_service.get_user_role(user_email)
     
     return {"email": user_email, "role": role}
@@ -30,9 +30,12 @@ def get_available_companies(user: dict = Depends(verify_token)):
     # Only return names, not credentials
     return [c["name"] for c in companies if c.get("name")]
 
-import requests
+from app.services import http_client
 from app.services.auth import get_auth_token
 from app.services.inventory import get_all_products
+from app.services.siigo_scheduler import siigo_scheduler, credential_key
+from app.services.mem_cache import mem_cache
+from app.services.cache import cache
 
 @router.get("/debug-api")
 def diagnose_api_status(user: dict = Depends(verify_token)):
@@ -75,7 +78,9 @@ def diagnose_api_status(user: dict = Depends(verify_token)):
                 "Authorization": f"Bearer {token}",
                 "Partner-Id": "GCOPlatform"
             }
-            res = requests.get(url, headers=headers, timeout=5)
+            with siigo_scheduler.slot(credential_key(headers["Authorization"])) as ticket:
+                res = http_client.get(url, headers=headers, timeout=5)
+                ticket.observe(res)
             if res.status_code == 200:
                 data = res.json()
                 total = data.get("pagination", {}).get("total_results", "?")
@@ -86,7 +91,9 @@ def diagnose_api_status(user: dict = Depends(verify_token)):
             # 4. Check Sales (1 Invoice)
             last_month = "2025-01-01" # Safe past date
             url_fv = f"https://api.siigo.com/v1/invoices?page=1&page_size=1&date_start={last_month}"
-            res_fv = requests.get(url_fv, headers=headers, timeout=5)
+            with siigo_scheduler.slot(credential_key(headers["Authorization"])) as ticket:
+                res_fv = http_client.get(url_fv, headers=headers, timeout=5)
+                ticket.observe(res_fv)
             if res_fv.status_code == 200:
                 data_fv = res_fv.json()
                 total_fv = data_fv.get("pagination", {}).get("total_results", "?")
@@ -98,3 +105,13 @@ def diagnose_api_status(user: dict = Depends(verify_token)):
             report[c_name]["error"] = str(e)
             
     return report
+
+@router.get("/debug-transport")
+def diagnose_transport(user: dict = Depends(verify_token)):
+    """
+    Per-host HTTP pool metrics, Siigo scheduler counters and in-memory cache usage
+    (mem_cache, the CacheService L1 tier and its write-behind uploads).
+    """
+    if user.get("role") != "admin":
+        return {"error": "Only admins can run diagnostics"}
+    return {"http": http_client.stats(), "siigo_scheduler": siigo_scheduler.stats(), "mem_cache": mem_cache.stats(), "cache_l1": cache.l1_stats(), "cache_uploads": cache.upload_stats()}
@@ -5,36 +5,15 @@ from app.routers.auth_router import verify_token
 from app.services.config import get_config, get_google_sheet_url
 from app.services.inventory import get_all_products
 from app.services.utils import fetch_google_sheet_inventory, normalize_sku
-from app.services.analytics import calculate_average_sales
+from app.services.sku_catalog import sku_catalog
+from app.services.analytics import calculate_sales_windows
 from app.services.cache import cache
 import concurrent.futures
 import time
 import math
 
-PACKAGING_UNITS = {
-    "3001": 68,
-    "3005": 50,
-    "3012": 84,
-    "7007": 50,
-    "7008": 50,
-    "7009": 50,
-    "7101": 100,
-    "7210": 50,
-    "7299": 70,
-    "7416": 100,
-    "7901": 100,
-    "7957": 100,
-    "7701": 25,
-    "EVO-7701": 25,
-    "7702": 100,
-    "EVO-7702": 100,
-    "7703": 150,
-    "EVO-7703": 150,
-}
-
 def get_packaging_unit(sku: str) -> int:
-    norm = normalize_sku(sku)
-    return PACKAGING_UNITS.get(norm, PACKAGING_UNITS.get(sku, 1))
+    return sku_catalog.packaging_unit(sku)
 
 def round_to_packaging(quantity: float, sku: str, limit: float = None) -> int:
     unit = get_packaging_unit(sku)
@@ -58,6 +37,33 @@ def round_to_packaging(quantity: float, sku: str, limit: float = None) -> int:
 router = APIRouter(prefix="/distribution", tags=["distribution"])
 
 # Helper to fetch current stock for a company
+SPLIT_AVERAGES_TTL_S = 3600
+SPLIT_AVERAGES_MAX_AGE_S = 24 * 3600
+
+def _split_averages_key(windows) -> str:
+    return f"sales_averages_split_{'_'.join(str(w) for w in windows)}d.json"
+
+def _refresh_split_windows(windows) -> dict:
+    """Computes the windows in a single pass (calculate_sales_windows) and caches them as one entry."""
+    computed = calculate_sales_windows(windows, split_by_company=True)
+    entry = {"timestamp": time.time(), "data": {str(w): computed[w][0] for w in windows}}
+    cache.save(_split_averages_key(windows), entry)
+    return entry
+
+def get_split_averages(avg_days: int):
+    """
+    Per-company sales averages for `avg_days` and for the 5-day reserve window.
+    Both windows live in one entry: fresh for 1 hour, after that the cached one
+    is served while a single background refresh recomputes the pair.
+    """
+    windows = sorted({avg_days, 5})
+    entry, _ = cache.load_swr(
+        _split_averages_key(windows), lambda: _refresh_split_windows(windows),
+        SPLIT_AVERAGES_TTL_S, SPLIT_AVERAGES_MAX_AGE_S,
+    )
+    found = entry.get("data") or {}
+    return found.get(str(avg_days)), found.get("5")
+
 def fetch_company_stock(company):
     from app.services.auth import get_auth_token
     token = get_auth_token(company["username"], company["access_key"])
@@ -143,30 +149,7 @@ def get_distribution_proposal(
             
     # 2. Fetch Sales Velocity (Per Company) - Cached if possible
     # We use dynamic avg_days
-    # Note: calculate_average_sales is heavy, we should cache it
-    cache_key = f"sales_averages_split_{avg_days}d.json"
-    cached_avgs = cache.load(cache_key)
-    
-    averages_data = None
-    if cached_avgs and (time.time() - cached_avgs.get("timestamp", 0) < 3600): # 1 hour cache
-        averages_data = cached_avgs.get("data")
-    else:
-        # Re-calculate
-        result_tuple = calculate_average_sales(days=avg_days, split_by_company=True)
-        avg_map = result_tuple[0]
-        averages_data = avg_map
-        cache.save(cache_key, {"timestamp": time.time(), "data": avg_map})
-        
-    cache_key_5d = "sales_averages_split_5d.json"
-    cached_avgs_5d = cache.load(cache_key_5d)
-    
-    averages_data_5d = None
-    if cached_avgs_5d and (time.time() - cached_avgs_5d.get("timestamp", 0) < 3600):
-        averages_data_5d = cached_avgs_5d.get("data")
-    else:
-        result_tuple_5d = calculate_average_sales(days=5, split_by_company=True)
-        averages_data_5d = result_tuple_5d[0]
-        cache.save(cache_key_5d, {"timestamp": time.time(), "data": averages_data_5d})
+    averages_data, averages_data_5d = get_split_averages(avg_days)
         
     # 3. Fetch Current Stock (Siigo) - Realtime
     companies = get_config()
@@ -310,30 +293,8 @@ def stream_batch_distribution_proposals(
 
             # 2. Sales Velocity
             yield f"data: {json.dumps({'progress': 30, 'message': f'Calculando Velocidad de Ventas ({avg_days} días)...'})}\n\n"
-            cache_key = f"sales_averages_split_{avg_days}d.json"
-            cached_avgs = cache.load(cache_key)
-            averages_data = None
-            
-            if cached_avgs and (time.time() - cached_avgs.get("timestamp", 0) < 3600): 
-                averages_data = cached_avgs.get("data")
-            else:
-                # This is the heavy part
-                result_tuple = calculate_average_sales(days=avg_days, split_by_company=True)
-                avg_map = result_tuple[0]
-                averages_data = avg_map
-                cache.save(cache_key, {"timestamp": time.time(), "data": avg_map})
-                
-            yield f"data: {json.dumps({'progress': 50, 'message': f'Calculando Velocidad de Ventas (5 días para reserva)...'})}\n\n"
-            cache_key_5d = "sales_averages_split_5d.json"
-            cached_avgs_5d = cache.load(cache_key_5d)
-            averages_data_5d = None
-            
-            if cached_avgs_5d and (time.time() - cached_avgs_5d.get("timestamp", 0) < 3600): 
-                averages_data_5d = cached_avgs_5d.get("data")
-            else:
-                result_tuple_5d = calculate_average_sales(days=5, split_by_company=True)
-                averages_data_5d = result_tuple_5d[0]
-                cache.save(cache_key_5d, {"timestamp": time.time(), "data": averages_data_5d})
+            # Both windows (avg_days + 5-day reserve) in one pass
+            averages_data, averages_data_5d = get_split_averages(avg_days)
                 
             yield f"data: {json.dumps({'progress': 70, 'message': 'Consultando Stock Actual...'})}\n\n"
 
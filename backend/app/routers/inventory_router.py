@@ -1,24 +1,72 @@
 from fastapi import APIRouter, HTTPException, Query, Depends
 from fastapi.responses import StreamingResponse, Response
 from typing import List, Optional
-import concurrent.futures
+import asyncio
 import json
 import time
 import os
 
-from app.services.inventory import get_all_products
+from app.services.siigo_async import run_sync, siigo_client, fetch_all_products
 from app.services.auth import get_auth_token
 from app.services.config import get_config, get_google_sheet_url
 from app.services.utils import fetch_google_sheet_inventory, normalize_sku
+from app.services.sku_catalog import sku_catalog
 from app.services.cache import cache
+from app.services.siigo_scheduler import INTERACTIVE
+from app.services.singleflight import SingleFlight, freshness_meta
 from app.routers.auth_router import verify_token
 # Import analytics service
 from app.services.analytics import calculate_average_sales
 
 router = APIRouter(prefix="/inventory", tags=["inventory"])
 
+SNAPSHOT_KEY = "inventory_snapshot.json"
+SNAPSHOT_TTL_S = 900
+SNAPSHOT_MAX_AGE_S = 3600
+SALES_AVERAGES_TTL_S = 3600
+# One snapshot rebuild at a time per force_refresh flavour
+_snapshot_flight = SingleFlight()
+
+def _inventory_rows(company, products):
+    """Flattens Siigo products into one row per (product, warehouse)."""
+    c_data = []
+    products = products or []
+    # The product list seeds the catalog aliases used by every other module
+    sku_catalog.register(p.get("code") for p in products)
+    for p in products:
+        p_base = {
+            "code": normalize_sku(p.get("code", "N/A")),
+            "name": p.get("name", "Sin Nombre"),
+            "company_name": company["name"],
+            "quantity": 0.0,
+            "warehouse_name": "N/A"
+        }
+
+        if "warehouses" in p:
+            for wh in p["warehouses"]:
+                item = p_base.copy()
+                item["warehouse_name"] = wh.get("name", "Unknown")
+                item["quantity"] = float(wh.get("quantity", 0))
+                c_data.append(item)
+        else:
+            c_data.append(p_base)
+    return c_data
+
+def _cached_company_inventory(cache_key):
+    cached = cache.load(cache_key)
+    if cached:
+        # Check TTL (15 minutes = 900 seconds)
+        age = time.time() - cached.get("timestamp", 0)
+        if age < 900:
+            return cached.get("data", [])
+    return None
+
 # Helper function moved to module level for shared use
-def process_company(company, force_refresh=False):
+def process_company(company, force_refresh=False, priority=INTERACTIVE):
+    """Sync wrapper over process_company_async; returns (rows, error)."""
+    return run_sync(process_company_async(company, force_refresh, priority))
+
+async def process_company_async(company, force_refresh=False, priority=INTERACTIVE, client=None):
     try:
         # Check for configuration validity first
         if not company.get("valid", True):
@@ -28,44 +76,20 @@ def process_company(company, force_refresh=False):
         
         # 1. Try Cache (if not forced)
         if not force_refresh:
-            cached = cache.load(cache_key)
-            if cached:
-                # Check TTL (15 minutes = 900 seconds)
-                age = time.time() - cached.get("timestamp", 0)
-                if age < 900:
-                    # print(f"Using cache for {company['name']} (Age: {int(age)}s)")
-                    return cached.get("data", []), None
-                # else:
-                #     print(f"Cache expired for {company['name']} (Age: {int(age)}s)")
+            cached = await asyncio.to_thread(_cached_company_inventory, cache_key)
+            if cached is not None:
+                return cached, None
 
         # 2. Fetch Fresh Data
-        token = get_auth_token(company["username"], company["access_key"])
+        token = await asyncio.to_thread(get_auth_token, company["username"], company["access_key"])
         if not token:
             return [], f"No se pudo autenticar '{company['name']}'. Verifique credenciales."
         
-        c_data = []
-        products = get_all_products(token)
-        if products:
-            for p in products:
-                p_base = {
-                    "code": normalize_sku(p.get("code", "N/A")),
-                    "name": p.get("name", "Sin Nombre"),
-                    "company_name": company["name"],
-                    "quantity": 0.0,
-                    "warehouse_name": "N/A"
-                }
-                
-                if "warehouses" in p:
-                    for wh in p["warehouses"]:
-                        item = p_base.copy()
-                        item["warehouse_name"] = wh.get("name", "Unknown")
-                        item["quantity"] = float(wh.get("quantity", 0))
-                        c_data.append(item)
-                else:
-                    c_data.append(p_base)
+        products = await fetch_all_products(token, priority=priority, client=client)
+        c_data = _inventory_rows(company, products)
         
         # 3. Save to Cache
-        cache.save(cache_key, {
+        await asyncio.to_thread(cache.save, cache_key, {
             "timestamp": time.time(),
             "data": c_data
         })
@@ -75,6 +99,11 @@ def process_company(company, force_refresh=False):
         print(f"Error processing {company['name']}: {e}")
         return [], f"Error en '{company['name']}': {str(e)}"
 
+async def process_companies_async(companies, force_refresh=False, priority=INTERACTIVE):
+    """All companies concurrently on one shared client; returns [(rows, error), ...] in order."""
+    async with siigo_client() as client:
+        return await asyncio.gather(*(process_company_async(c, force_refresh, priority, client) for c in companies))
+
 def filter_for_user(result_dict, role):
     """
     Filters inventory data based on user role.
@@ -107,35 +136,53 @@ def get_consolidated_inventory(
     user: dict = Depends(verify_token),
     force_refresh: bool = False
 ):
-    cache_key = "inventory_snapshot.json"
-    
+    if force_refresh:
+        final_result = refresh_inventory_snapshot(True)
+        meta = freshness_meta(final_result["timestamp"], SNAPSHOT_TTL_S)
+    else:
+        # Stale-while-revalidate: an expired snapshot (up to SNAPSHOT_MAX_AGE_S) is
+        # served while one background rebuild runs; only a missing one is waited for.
+        try:
+            final_result, meta = cache.load_swr(SNAPSHOT_KEY, _refresh_snapshot_for_cache, SNAPSHOT_TTL_S, SNAPSHOT_MAX_AGE_S)
+        except _IncompleteSnapshot as e:
+            final_result, meta = e.result, freshness_meta(e.result["timestamp"], SNAPSHOT_TTL_S)
+        print(f"Serving inventory snapshot (Age: {meta['age_s']}s, stale: {meta['stale']})")
+    return {**filter_for_user(final_result, user.get("role")), "freshness": meta}
+
+class _IncompleteSnapshot(Exception):
+    """Rebuild finished with errors (not cached): counts as a failure for the refresh backoff."""
+    def __init__(self, result):
+        super().__init__("; ".join(result.get("errors", [])))
+        self.result = result
+
+def _refresh_snapshot_for_cache():
+    result = refresh_inventory_snapshot()
+    if result.get("errors") or not result.get("data"):
+        raise _IncompleteSnapshot(result)
+    return result
+
+def refresh_inventory_snapshot(force_refresh=False, priority=INTERACTIVE):
+    """
+    Rebuilds the consolidated snapshot (all Siigo companies + Google Sheet) and
+    saves it when the run was clean. Returns the unfiltered result.
+    `priority` is the siigo_scheduler class (cron callers pass BACKGROUND).
+
+    Single-flight: concurrent callers (dashboard, juego, daily report,
+    distribution) share one rebuild instead of each fanning out to Siigo.
+    """
+    return _snapshot_flight.do(bool(force_refresh), lambda: _rebuild_inventory_snapshot(force_refresh, priority))
+
+def _rebuild_inventory_snapshot(force_refresh, priority):
     companies = get_config()
     all_data = []
     errors = []
 
-    # 0. Try Cache First
-    if not force_refresh:
-        cached_data = cache.load(cache_key)
-        if cached_data:
-            # Check TTL for global snapshot (e.g. 15 minutes)
-            last_ts = cached_data.get("timestamp", 0) # Use get() to avoid crash if missing
-            if isinstance(last_ts, (int, float)) and (time.time() - last_ts) < 900:
-                print(f"Serving inventory from CACHE (Age: {int(time.time() - last_ts)}s)")
-                return filter_for_user(cached_data, user.get("role"))
-            else:
-                 print("Global cache expired. Refreshing...")
-
-    # 1. Fetch Siigo Data
-    # Limit concurrency to 5 workers to prevent API Rate Limiting (429) and network saturation
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_company = {executor.submit(process_company, c, force_refresh): c for c in companies}
-        
-        for future in concurrent.futures.as_completed(future_to_company):
-            res_data, res_err = future.result()
-            if res_data:
-                all_data.extend(res_data)
-            if res_err:
-                errors.append(res_err)
+    # 1. Fetch Siigo Data (one event loop; request rate is paced by siigo_scheduler)
+    for res_data, res_err in run_sync(process_companies_async(companies, force_refresh, priority)):
+        if res_data:
+            all_data.extend(res_data)
+        if res_err:
+            errors.append(res_err)
 
     # 2. Fetch Google Sheets Data
     sheet_url = get_google_sheet_url()
@@ -152,7 +199,8 @@ def get_consolidated_inventory(
     final_result = {
         "count": len(all_data),
         "data": all_data,
-        "errors": errors
+        "errors": errors,
+        "timestamp": time.time()
     }
     
     # Save Snapshot (optional if we are disabling cache reading, but keeping writing is fine)
@@ -160,42 +208,41 @@ def get_consolidated_inventory(
     # If we have errors (e.g. one company failed), we return what we have but DO NOT cache it.
     # This ensures the next user tries to fetch everything again.
     if all_data and not errors:
-        cache.save(cache_key, final_result)
+        cache.save(SNAPSHOT_KEY, final_result)
     elif errors:
         print(f"Skipping cache save due to errors: {len(errors)} errors found.")
 
-    return filter_for_user(final_result, user.get("role"))
+    return final_result
 
 @router.get("/stream")
-def stream_inventory_updates(
+async def stream_inventory_updates(
     user: dict = Depends(verify_token),
     force_refresh: bool = False
 ):
-    # Generator function for SSE
-    def event_stream():
-        companies = get_config()
-        # all_data = [] # Not needed if we just stream
+    # Async generator for SSE: awaits the Siigo client directly, no worker threads per company
+    async def event_stream():
+        # Config / settings reads may hit GCS: keep them off the event loop
+        companies = await asyncio.to_thread(get_config)
         all_data_accumulated = []
         errors = []
         total_steps = len(companies) + 1 # +1 for Google Sheets
         
         yield f"data: {json.dumps({'progress': 0, 'message': 'Iniciando carga de inventario...'})}\n\n"
 
-        # 1. Fetch Siigo Data (Parallel with manual tracking)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=len(companies) + 2) as executor:
-            future_to_company = {executor.submit(process_company, c, force_refresh): c for c in companies}
+        # 1. Fetch Siigo Data (concurrent, reported as each company completes)
+        async with siigo_client() as client:
+            async def run(company):
+                return company, await process_company_async(company, force_refresh, client=client)
+
             completed_count = 0
-            
-            for future in concurrent.futures.as_completed(future_to_company):
-                company = future_to_company[future]
-                res_data, res_err = future.result()
+            for next_done in asyncio.as_completed([run(c) for c in companies]):
+                company, (res_data, res_err) = await next_done
                 
                 if res_data:
                     all_data_accumulated.extend(res_data)
                 if res_err:
                     errors.append(res_err)
                 
-                completed_count += 1
                 completed_count += 1
                 progress = int((completed_count / total_steps) * 100)
                 msg = f"Cargado {company.get('name', 'Empresa')}"
@@ -204,10 +251,10 @@ def stream_inventory_updates(
 
         # 2. Fetch Google Sheets
         yield f"data: {json.dumps({'progress': 90, 'message': 'Cargando Inventario Externo...'})}\n\n"
-        sheet_url = get_google_sheet_url()
+        sheet_url = await asyncio.to_thread(get_google_sheet_url)
         if sheet_url:
             try:
-                gs_data = fetch_google_sheet_inventory(sheet_url)
+                gs_data = await asyncio.to_thread(fetch_google_sheet_inventory, sheet_url)
                 if gs_data:
                     all_data_accumulated.extend(gs_data)
             except Exception as e:
@@ -243,52 +290,52 @@ def get_sales_averages(
 ):
     """
     Returns a dictionary of {SKU: daily_average_sales} based on the last 'days' of sales (FV).
-    This is a heavy operation, cached indefinitely until force_refresh=True.
+    This is a heavy operation: cached per window, stale entries are served
+    while they are refreshed in the background (force_refresh=True waits).
     """
     # Optional: Check if user has permission
     # if user.get("role") not in ["admin", "wholesaler"]: ... 
-    
-    cache_key = "sales_averages.json"
-
-    # 1. Try Cache
-    if not force_refresh:
-        cached = cache.load(cache_key)
-        # Verify if cached data matches requested 'days' window
-        if cached and cached.get("days") == days:
-             # print("Serving sales averages from CACHE")
-             return cached
-
     try:
-        # Fetch granular data (Split by company)
-        split_averages, trends, audit = calculate_average_sales(days=days, split_by_company=True)
-        
-        # Derive Global Averages from Split Data (avoiding double DB hit)
-        global_averages = {}
-        for company_name, sku_dict in split_averages.items():
-            for sku, avg_val in sku_dict.items():
-                global_averages[sku] = global_averages.get(sku, 0) + avg_val
-                
-        # Round global values
-        for sku in global_averages:
-            global_averages[sku] = round(global_averages[sku], 4)
-
-        result = {
-            "days": days,
-            "averages": global_averages, # Legacy/Default Global
-            "averages_by_company": split_averages, # New Granular Data
-            "trends_by_company": trends,
-            "audit": audit,
-            "timestamp": time.time()
-        }
-        
-        # 2. Save Cache
-        cache.save(cache_key, result)
-        
-        return result
+        if force_refresh:
+            result = _compute_sales_averages(days)
+            return {**result, "freshness": freshness_meta(result["timestamp"], SALES_AVERAGES_TTL_S)}
+        # Served from cache; after an hour the next caller triggers a background refresh
+        result, meta = cache.load_swr(_sales_averages_key(days), lambda: _compute_sales_averages(days), SALES_AVERAGES_TTL_S)
+        return {**result, "freshness": meta}
     except Exception as e:
         print(f"Error in sales averages endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sales_averages_key(days: int) -> str:
+    return f"sales_averages_{days}d.json"
+
+def _compute_sales_averages(days: int) -> dict:
+    # Fetch granular data (Split by company)
+    split_averages, trends, audit = calculate_average_sales(days=days, split_by_company=True)
+
+    # Derive Global Averages from Split Data (avoiding double DB hit)
+    global_averages = {}
+    for company_name, sku_dict in split_averages.items():
+        for sku, avg_val in sku_dict.items():
+            global_averages[sku] = global_averages.get(sku, 0) + avg_val
+
+    # Round global values
+    for sku in global_averages:
+        global_averages[sku] = round(global_averages[sku], 4)
+
+    result = {
+        "days": days,
+        "averages": global_averages, # Legacy/Default Global
+        "averages_by_company": split_averages, # New Granular Data
+        "trends_by_company": trends,
+        "audit": audit,
+        "timestamp": time.time()
+    }
+
+    # Save Cache
+    cache.save(_sales_averages_key(days), result)
+    return result
+
 @router.post("/export/pdf")
 def export_inventory_pdf(
     items: List[dict],
@@ -324,9 +371,16 @@ def export_acta_pdf(
         raise HTTPException(status_code=500, detail=f"Error generando PDF del Acta: {str(e)}")
 
 # --- HISTORY ANALYSIS ---
-from datetime import datetime, timedelta
-from app.services.movements import get_all_documents
-from app.services.stock_history import get_product_history
+from app.services.stock_history import get_product_history, get_products_history
+
+MAX_HISTORY_SKUS = 200
+MAX_HISTORY_DAYS = 365
+
+def _check_history_days(days: int, max_days=MAX_HISTORY_DAYS):
+    if days < 1:
+        raise HTTPException(status_code=400, detail="days debe ser al menos 1")
+    if max_days is not None and days > max_days:
+        raise HTTPException(status_code=400, detail=f"days debe estar entre 1 y {max_days}")
 
 @router.get("/analysis/history")
 def get_inventory_history(
@@ -337,54 +391,37 @@ def get_inventory_history(
 ):
     """
     Returns daily stock levels vs sales for a specific SKU.
-    Reconstructs history backwards from current_stock.
+    Reconstructs history backwards from current_stock, using the stored
+    sales (only days missing from the movement store hit Siigo).
+    Unlike the batch endpoint, `days` has no upper bound here (existing clients).
     """
+    _check_history_days(days, max_days=None)
     try:
-        # Calculate Date Range
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days + 5) # Buffer
-        
-        s_str = start_date.strftime("%Y-%m-%d")
-        e_str = end_date.strftime("%Y-%m-%d")
-        
-        # REAL IMPLEMENTATION
-        # Fetch Sales (FV) from all companies to build the sales chart
-        # Note: We rely on current_stock passed by Frontend to anchor the red line.
-        
-        companies = get_config()
-        all_movements = []
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_c = {}
-            for c in companies:
-                if not c.get("valid", False): continue
-                
-                token = get_auth_token(c["username"], c["access_key"])
-                if not token: continue
-                
-                # Fetch Invoices (Sales)
-                future_to_c[executor.submit(get_all_documents, token, "invoices", s_str, e_str)] = c.get("name")
-                
-            for future in concurrent.futures.as_completed(future_to_c):
-                try:
-                    docs = future.result()
-                    if docs:
-                        for d in docs:
-                            for item in d.get("items", []):
-                                all_movements.append({
-                                    "date": d.get("date"),
-                                    "code": item.get("code"),
-                                    "product_code": item.get("code"), # Fallback
-                                    "quantity": item.get("quantity"),
-                                    "type": "SALIDA", 
-                                    "doc_type": "FV"
-                                })
-                except Exception as e:
-                    print(f"Error fetching history: {e}")
-
-        # Now processing
-        history = get_product_history(sku, days, current_stock, all_movements)
-        return history
+        return get_product_history(sku, days, current_stock)
+    except Exception as e:
+        print(f"History Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/analysis/history/batch")
+def get_inventory_history_batch(data: dict, user: dict = Depends(verify_token)):
+    """
+    Historial de varios SKUs en una sola pasada.
+    Body: {"days": 30, "items": [{"sku": "...", "current_stock": N}, ...]}
+    Returns {sku: [{date, stock, sales}, ...]}.
+    """
+    items = data.get("items") or []
+    if not items:
+        raise HTTPException(status_code=400, detail="Debe enviar al menos un SKU")
+    if len(items) > MAX_HISTORY_SKUS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_HISTORY_SKUS} SKUs por consulta")
+    try:
+        days = int(data.get("days", 30))
+        stocks = {str(i["sku"]): float(i.get("current_stock") or 0) for i in items if i.get("sku")}
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Solicitud inválida: {e}")
+    _check_history_days(days)
+    try:
+        return get_products_history(list(stocks), days, stocks)
     except Exception as e:
         print(f"History Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -414,22 +451,18 @@ async def save_acta(data: dict, user: dict = Depends(verify_token)):
     
     # Save to cache history
     try:
-        history = cache.load("actas_history.json", ttl=None) or []
-        
-        if not is_new:
-            # Update existing if found
-            found = False
-            for idx, item in enumerate(history):
-                if item.get("id") == acta_id:
-                    history[idx] = acta
-                    found = True
-                    break
-            if not found:
-                history.append(acta)
-        else:
+        def apply(history):
+            # Runs on the latest stored list: concurrent saves of other actas are kept
+            if not is_new:
+                # Update existing if found
+                for idx, item in enumerate(history):
+                    if item.get("id") == acta_id:
+                        history[idx] = acta
+                        return history
             history.append(acta)
-            
-        cache.save("actas_history.json", history)
+            return history
+
+        cache.update("actas_history.json", apply, default=[])
         return {
             "status": "success", 
             "acta_id": acta_id, 
@@ -1,18 +1,20 @@
 from fastapi import APIRouter, HTTPException, Query, Depends, Request
 from typing import List, Optional
 from datetime import datetime
-import concurrent.futures
-import pandas as pd
 import hashlib
 import json
 import asyncio
 from sse_starlette.sse import EventSourceResponse
 
-from app.services.movements import get_consolidated_movements as fetch_movements
 from app.services.config import get_config
-from app.services.auth import get_auth_token
 from app.routers.auth_router import verify_token
-from app.services.cache import cache
+from app.services.movement_store import movement_store
+from app.services.movement_sync import sync_company_async, sync_companies_async
+from app.services.siigo_async import run_sync
+from app.services.json_stream import rows_response, dumps
+from app.services.movement_query import query_movements, QueryError, DEFAULT_LIMIT, MAX_LIMIT
+from app.services.movement_aggregate import aggregate_movements, AggregateError
+from app.services.siigo_scheduler import BACKGROUND
 
 router = APIRouter(prefix="/movements", tags=["movements"])
 
@@ -38,205 +40,80 @@ def get_movements(
         all_results = []
         errors = []
 
-        def process_company(company):
-            c_name = company.get("name")
-            try:
-                # 1. Config Check
-                if not company.get("valid", True):
-                    return [], f"Config Incompleta: {c_name}"
-
-                # 2. Cache Loading (Master History File)
-                cache_key = f"history_{c_name}.json" 
-                db_data = cache.load(cache_key) or []
-                
-                # 3. Determine Date Boundaries in Cache
-                min_cache_date = "2999-12-31"
-                max_cache_date = "1900-01-01"
-                
-                if db_data:
-                    valid_dates = [x['date'] for x in db_data if x.get('date')]
-                    if valid_dates:
-                        min_cache_date = min(valid_dates)
-                        max_cache_date = max(valid_dates)
-                else:
-                    # Empty cache behavior
-                    min_cache_date = "2999-12-31" 
-                    max_cache_date = "1900-01-01"
-
-                # 4. Logic: Smart Gap Detection (Hole Filling)
-                fetch_ranges = [] 
-                
-                if force_refresh:
-                    # ... Existing Force Refresh Logic ...
-                    print(f"[{c_name}] Forcing refresh: {start_date} to {end_date} (Yearly Chunking)")
-                    try:
-                        sy = int(start_date[:4])
-                        ey = int(end_date[:4])
-                        for y in range(sy, ey + 1):
-                            chunk_start = f"{y}-01-01"
-                            chunk_end = f"{y}-12-31"
-                            if chunk_start < start_date: chunk_start = start_date
-                            if chunk_end > end_date: chunk_end = end_date
-                            fetch_ranges.append((chunk_start, chunk_end))
-                    except:
-                         fetch_ranges.append((start_date, end_date))
-                
-                else:
-                    # NEW ROBUST LOGIC: Check for specific missing months (Holes)
-                    # Instead of trusting Min/Max, we verify if we have data for each requested month.
-                    
-                    try:
-                        # 1. Map existing content by YYYY-MM
-                        existing_months = set()
-                        if db_data:
-                            # Optimize: Check first and last to see if we even need to scan? No, scan is safer.
-                            # O(N) scan. N ~ 50k. Fast enough (ms).
-                            existing_months = {x['date'][:7] for x in db_data if x.get('date')}
-                        
-                        from datetime import datetime, timedelta
-                        from dateutil.relativedelta import relativedelta
-                        
-                        req_start = datetime.strptime(start_date, "%Y-%m-%d")
-                        req_end = datetime.strptime(end_date, "%Y-%m-%d")
-                        
-                        # Normalize to Month Start for iteration
-                        curr = req_start.replace(day=1) 
-                        target_end = req_end.replace(day=1)
-                        
-                        missing_months_start = None
-                        
-                        while curr <= target_end:
-                            month_key = curr.strftime("%Y-%m")
-                            
-                            # Check if this month is missing
-                            if month_key not in existing_months:
-                                if missing_months_start is None:
-                                    missing_months_start = curr
-                            else:
-                                # We found data! Close previous gap if exists
-                                if missing_months_start:
-                                    # End of gap is LAST DAY of PREVIOUS month
-                                    gap_end_date = curr - timedelta(days=1)
-                                    
-                                    # Clamp start
-                                    g_start_str = missing_months_start.strftime("%Y-%m-%d")
-                                    if missing_months_start.year == req_start.year and missing_months_start.month == req_start.month:
-                                        if g_start_str < start_date: g_start_str = start_date
-                                        
-                                    g_end_str = gap_end_date.strftime("%Y-%m-%d")
-                                    if g_end_str > end_date: g_end_str = end_date
-                                    
-                                    print(f"[{c_name}] Hole Detected: {g_start_str} -> {g_end_str}")
-                                    fetch_ranges.append((g_start_str, g_end_str))
-                                    missing_months_start = None
-                            
-                            # Next month
-                            curr += relativedelta(months=1)
-                        
-                        # Close final gap if open
-                        if missing_months_start:
-                            # End of range
-                            last_day_of_req = req_end
-                            
-                            g_start_str = missing_months_start.strftime("%Y-%m-%d")
-                            if missing_months_start.year == req_start.year and missing_months_start.month == req_start.month:
-                                if g_start_str < start_date: g_start_str = start_date
-                                
-                            g_end_str = last_day_of_req.strftime("%Y-%m-%d")
-                            
-                            print(f"[{c_name}] Missing Range (End): {g_start_str} -> {g_end_str}")
-                            fetch_ranges.append((g_start_str, g_end_str))
-                            
-                    except Exception as e:
-                        print(f"Error in Smart Hole Detection: {e}")
-                        # Fallback: Fetch everything requested
-                        fetch_ranges.append((start_date, end_date))
-
-                if not fetch_ranges:
-                     print(f"[{c_name}] Cache Complete. No holes found in range.")
-
-                # 5. Fetching Gaps
-                auth_token = None
-                new_data_found = False
-                
-                for r_start, r_end in fetch_ranges:
-                    # Safety check
-                    if r_start >= r_end: continue
-
-                    if not auth_token:
-                        auth_token = get_auth_token(company.get("username"), company.get("access_key"))
-                        if not auth_token: 
-                            errors.append(f"Auth Fallida: {c_name}")
-                            break
-
-                    print(f"[{c_name}] Fetching Gap: {r_start} to {r_end}...")
-                    # PASS doc_types FILTER HERE
-                    gap_data = fetch_movements(auth_token, r_start, r_end, selected_types=doc_types)
-                    
-                    if gap_data:
-                        # Tag
-                        for m in gap_data: m["company"] = c_name
-                        
-                        # Merge immediately to memory list
-                        # Filter overlap for this specific gap to be safe (Clean overwrite)
-                        db_data = [x for x in db_data if not (r_start <= x['date'] <= r_end)]
-                        db_data.extend(gap_data)
-                        
-                        # Checkpoint: Save IMMEDIATELY after each chunk
-                        # This ensures that if 2020-2023 flows work but 2024 fails/times out, 
-                        # we still persisted the first 4 years. User can just retry to get the rest.
-                        if True:
-                             db_data.sort(key=lambda x: x['date'])
-                             cache.save(cache_key, db_data)
-                             print(f"[{c_name}] Checkpoint saved for {r_start}-{r_end}")
-                        
-                        new_data_found = True
-                    else:
-                         print(f"[{c_name}] Gap {r_start}-{r_end} was empty on Server.")
-
-                # 6. Save Final (if not forced, or just to be sure)
-                if new_data_found and not force_refresh:
-                    db_data.sort(key=lambda x: x['date'])
-                    cache.save(cache_key, db_data)
-                
-                # 7. Final Filter (Return only what user asked for)
-                filtered_response = [x for x in db_data if start_date <= x['date'] <= end_date]
-                
-                # NEW: Filter by Doc Type if requested (Consistency for Cache)
-                if doc_types:
-                     # doc_types is a list like ['FV', 'FC']
-                     filtered_response = [x for x in filtered_response if x.get('doc_type') in doc_types]
-
-                return filtered_response, None
-
-            except Exception as e:
-                print(f"Error {c_name}: {e}")
-                # import traceback; traceback.print_exc()
-                return [], f"Error {c_name}: {str(e)}"
-
-        # Parallel Execution
-        # We use threads because I/O bound (Network + Disk/Cloud Storage)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=min(10, len(target_companies)+1)) as executor:
-            future_to_c = {executor.submit(process_company, c): c for c in target_companies}
-            
-            for future in concurrent.futures.as_completed(future_to_c):
-                data, err = future.result()
-                if data: 
-                    all_results.extend(data)
-                if err: 
-                    errors.append(err)
+        # Shared gap-fill engine (plan holes, fetch, checkpoint, read back),
+        # all companies concurrently on one event loop instead of a thread each
+        for data, err in run_sync(sync_companies_async(target_companies, start_date, end_date, doc_types, force_refresh)):
+            if data:
+                all_results.extend(data)
+            if err:
+                errors.append(err)
 
         if not all_results and errors:
              return {"count": 0, "data": [], "errors": errors, "status": "partial_error"}
              
-        # cleanup
-        if all_results:
-            df = pd.DataFrame(all_results)
-            final_data = df.where(pd.notnull(df), None).to_dict(orient="records")
-            return {"count": len(final_data), "data": final_data, "errors": errors}
-        
-        return {"count": 0, "data": [], "errors": errors}
+        # Encoded straight from the stored rows, in chunks (no DataFrame round-trip)
+        return rows_response(all_results, count=len(all_results), errors=errors)
+
+    except Exception as e:
+        import traceback; traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/query")
+def query_movements_endpoint(
+    token: str = Depends(verify_token),
+    start_date: str = Query(..., description="YYYY-MM-DD"),
+    end_date: str = Query(..., description="YYYY-MM-DD"),
+    companies: Optional[List[str]] = Query(None),
+    doc_types: Optional[List[str]] = Query(None),
+    sku: Optional[List[str]] = Query(None),
+    warehouse: Optional[List[str]] = Query(None),
+    client: Optional[List[str]] = Query(None),
+    seller: Optional[List[str]] = Query(None),
+    fields: Optional[List[str]] = Query(None, description="Columnas a devolver (todas por defecto)"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior")
+):
+    """
+    Paginated, filtered read of the stored movements (no Siigo calls).
+    Filters run while partitions are read; pages are ordered by
+    (date, doc_number, company) and chained with `next_cursor`.
+    """
+    try:
+        names = [c["name"] for c in get_config() if c.get("valid", True)]
+        if companies:
+            names = [n for n in names if n in companies]
+
+        page = query_movements(
+            names, start_date, end_date, doc_types=doc_types, skus=sku, warehouses=warehouse,
+            clients=client, sellers=seller, fields=fields, limit=limit, cursor=cursor
+        )
+        return rows_response(page["data"], count=page["count"], next_cursor=page["next_cursor"])
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        import traceback; traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/aggregate")
+def aggregate_movements_endpoint(
+    token: str = Depends(verify_token),
+    start_date: str = Query(..., description="YYYY-MM-DD"),
+    end_date: str = Query(..., description="YYYY-MM-DD"),
+    group_by: List[str] = Query(["sku"], description="sku, company, warehouse, doc_type, day, week, month"),
+    companies: Optional[List[str]] = Query(None),
+    doc_types: Optional[List[str]] = Query(None)
+):
+    """
+    Sums of quantity/value and line/document counts over the stored
+    movements, grouped server-side. Cached until the underlying months change.
+    """
+    try:
+        names = [c["name"] for c in get_config() if c.get("valid", True)]
+        if companies:
+            names = [n for n in names if n in companies]
+        return aggregate_movements(names, start_date, end_date, group_by, doc_types)
+    except AggregateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         import traceback; traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
@@ -273,9 +150,6 @@ async def stream_movements(
             errors = []
             total_companies = len(target_companies)
 
-            # We'll run the synchronous logic in a threadpool to not block the asyncio event loop
-            import threading
-            
             # Map of company -> progress string
             company_statuses = {}
             for c in target_companies:
@@ -288,166 +162,50 @@ async def stream_movements(
 
             yield json.dumps({"step": "Calculando vacíos de caché (Holes)...", "progress": 20})
 
-            # We will reuse the same sync logic but wrap it to allow yielding
-            def sync_process_company(company):
-                c_name = company.get("name")
-                try:
-                    if not company.get("valid", True):
-                        company_statuses[c_name] = "Config Inválida"
-                        return [], f"Config Incompleta: {c_name}"
-
-                    cache_key = f"history_{c_name}.json" 
-                    db_data = cache.load(cache_key) or []
-                    
-                    fetch_ranges = [] 
-                    
-                    if force_refresh:
-                        company_statuses[c_name] = "Calculando rangos forzados..."
-                        try:
-                            sy = int(start_date[:4])
-                            ey = int(end_date[:4])
-                            for y in range(sy, ey + 1):
-                                chunk_start = f"{y}-01-01"
-                                chunk_end = f"{y}-12-31"
-                                if chunk_start < start_date: chunk_start = start_date
-                                if chunk_end > end_date: chunk_end = end_date
-                                fetch_ranges.append((chunk_start, chunk_end))
-                        except:
-                            fetch_ranges.append((start_date, end_date))
-                    else:
-                        company_statuses[c_name] = "Analizando caché..."
-                        try:
-                            existing_months = set()
-                            if db_data:
-                                existing_months = {x['date'][:7] for x in db_data if x.get('date')}
-                            
-                            from datetime import datetime, timedelta
-                            from dateutil.relativedelta import relativedelta
-                            
-                            req_start = datetime.strptime(start_date, "%Y-%m-%d")
-                            req_end = datetime.strptime(end_date, "%Y-%m-%d")
-                            
-                            curr = req_start.replace(day=1) 
-                            target_end = req_end.replace(day=1)
-                            
-                            missing_months_start = None
-                            
-                            while curr <= target_end:
-                                month_key = curr.strftime("%Y-%m")
-                                if month_key not in existing_months:
-                                    if missing_months_start is None:
-                                        missing_months_start = curr
-                                else:
-                                    if missing_months_start:
-                                        gap_end_date = curr - timedelta(days=1)
-                                        g_start_str = missing_months_start.strftime("%Y-%m-%d")
-                                        if missing_months_start.year == req_start.year and missing_months_start.month == req_start.month:
-                                            if g_start_str < start_date: g_start_str = start_date
-                                        g_end_str = gap_end_date.strftime("%Y-%m-%d")
-                                        if g_end_str > end_date: g_end_str = end_date
-                                        fetch_ranges.append((g_start_str, g_end_str))
-                                        missing_months_start = None
-                                curr += relativedelta(months=1)
-                            
-                            if missing_months_start:
-                                g_start_str = missing_months_start.strftime("%Y-%m-%d")
-                                if missing_months_start.year == req_start.year and missing_months_start.month == req_start.month:
-                                    if g_start_str < start_date: g_start_str = start_date
-                                g_end_str = req_end.strftime("%Y-%m-%d")
-                                fetch_ranges.append((g_start_str, g_end_str))
-                                
-                        except Exception as e:
-                            fetch_ranges.append((start_date, end_date))
-
-                    auth_token = None
-                    new_data_found = False
-                    
-                    total_gaps = len(fetch_ranges)
-                    for idx, (r_start, r_end) in enumerate(fetch_ranges):
-                        if r_start >= r_end: continue
-
-                        if not auth_token:
-                            auth_token = get_auth_token(company.get("username"), company.get("access_key"))
-                            if not auth_token: 
-                                company_statuses[c_name] = "Auth Fallida"
-                                return [], f"Auth Fallida: {c_name}"
-
-                        company_statuses[c_name] = f"Descargando {idx+1}/{total_gaps} ({r_start} a {r_end})..."
-                        gap_data = fetch_movements(auth_token, r_start, r_end, selected_types=doc_types)
-                        
-                        if gap_data:
-                            for m in gap_data: m["company"] = c_name
-                            db_data = [x for x in db_data if not (r_start <= x['date'] <= r_end)]
-                            db_data.extend(gap_data)
-                            db_data.sort(key=lambda x: x['date'])
-                            cache.save(cache_key, db_data)
-                            new_data_found = True
-
-                    company_statuses[c_name] = "Aplicando filtros de fecha..."
-                    if new_data_found and not force_refresh:
-                        db_data.sort(key=lambda x: x['date'])
-                        cache.save(cache_key, db_data)
-                    
-                    filtered_response = [x for x in db_data if start_date <= x['date'] <= end_date]
-                    if doc_types:
-                        filtered_response = [x for x in filtered_response if x.get('doc_type') in doc_types]
-
-                    company_statuses[c_name] = f"¡Listo! ({len(filtered_response)} regs)"
-                    return filtered_response, None
-
-                except Exception as e:
-                    company_statuses[c_name] = "Error"
-                    return [], f"Error {c_name}: {str(e)}"
-
-            loop = asyncio.get_running_loop()
-            
-            # Start standard ThreadPoolExecutor
+            # Same engine as /movements, awaited on this event loop; its
+            # progress events feed the status line
+            finished = set()
+
+            def on_progress(event):
+                company_statuses[event["company"]] = event["message"]
+                if event["stage"] in ("done", "error"):
+                    finished.add(event["company"])
+
             yield json.dumps({"step": "Sincronizando con Siigo API...", "progress": 30})
-            
-            with concurrent.futures.ThreadPoolExecutor(max_workers=min(10, len(target_companies)+1)) as executor:
-                # Submit tasks
-                futures = {executor.submit(sync_process_company, c): c for c in target_companies}
-                
-                # We need an async loop to query futures and yield progress without blocking the main event loop
-                completed_count = 0
-                total_tasks = len(target_companies)
-                while completed_count < total_tasks:
-                    # Use asyncio.sleep to yield control back to uvicorn and flush SSE buffer
-                    await asyncio.sleep(1.0)
-                    
-                    next_done = [f for f in futures.keys() if f.done()]
-                    
-                    # Yield current progress text
-                    dynamic_prog = 30 + (completed_count / max(1, len(target_companies))) * 50
+
+            task = asyncio.create_task(sync_companies_async(
+                target_companies, start_date, end_date, doc_types, force_refresh, progress_callback=on_progress
+            ))
+            try:
+                while not task.done():
+                    # Wake up every second to flush the SSE buffer with the current status
+                    await asyncio.wait({task}, timeout=1.0)
+                    dynamic_prog = 30 + (len(finished) / max(1, len(target_companies))) * 50
                     yield json.dumps({
                         "step": f"Consolidando: {report_progress()}", 
                         "progress": int(dynamic_prog)
                     })
-                    
-                    for f in next_done:
-                        if f in futures:
-                            data, err = f.result()
-                            if data: all_results.extend(data)
-                            if err: errors.append(err)
-                            completed_count += 1
-                            del futures[f]  # remove to not process twice
+            finally:
+                if not task.done():
+                    task.cancel()
+
+            for data, err in task.result():
+                if data: all_results.extend(data)
+                if err: errors.append(err)
             
             yield json.dumps({"step": "Limpiando y formateando datos...", "progress": 90})
             await asyncio.sleep(0.1)
 
-            final_data = []
-            if all_results:
-                df = pd.DataFrame(all_results)
-                final_data = df.where(pd.notnull(df), None).to_dict(orient="records")
-            
+            # Final SSE event is a single message: encode it in one pass with the fast serializer
             res_obj = {
-                "count": len(final_data), 
-                "data": final_data, 
+                "count": len(all_results), 
+                "data": all_results, 
                 "errors": errors,
-                "status": "partial_error" if (not final_data and errors) else "success"
+                "status": "partial_error" if (not all_results and errors) else "success"
             }
-            
-            yield json.dumps({"step": "Completado", "progress": 100, "result": res_obj})
+            payload = dumps({"step": "Completado", "progress": 100, "result": res_obj}).decode("utf-8")
+            del res_obj, all_results
+            yield payload
 
         except asyncio.CancelledError:
             print("SSE Client Disconnected")
@@ -470,7 +228,7 @@ def sync_movements(
     """
     Trigger a background sync for specific years.
     This effectively builds the 'Data Warehouse' by fetching full historical years
-    and merging them into the master cache file.
+    and merging them into the partitioned movement store.
     """
     try:
         all_companies = get_config()
@@ -479,7 +237,7 @@ def sync_movements(
         
         results = []
         
-        def process_sync(company, year):
+        async def process_sync(company, year):
             c_name = company.get("name")
             start_date = f"{year}-01-01"
             end_date = f"{year}-12-31"
@@ -488,43 +246,21 @@ def sync_movements(
             if year == datetime.now().year:
                 end_date = datetime.now().strftime("%Y-%m-%d")
                 
-            try:
-                print(f"[{c_name}] Syncing Year {year}...")
-                
-                # Fetch FULL year
-                auth_token = get_auth_token(company.get("username"), company.get("access_key"))
-                if not auth_token:
-                    return f"Auth Failed: {c_name}"
-
-                new_data = fetch_movements(auth_token, start_date, end_date)
-                if not new_data:
-                    return f"No data for {c_name} in {year}"
-
-                # Tag with company
-                for m in new_data: m["company"] = c_name
-
-                # Load Master Cache
-                cache_key = f"history_{c_name}.json" 
-                db_data = cache.load(cache_key) or []
-                
-                # MERGE Strategy:
-                # 1. Remove all records belonging to this YEAR from current DB
-                # 2. Append the freshly fetched year
-                
-                # Filter out records where 'date' starts with f"{year}-"
-                year_prefix = str(year)
-                db_data = [x for x in db_data if not x.get('date', '').startswith(year_prefix)]
-                
-                # Add new
-                db_data.extend(new_data)
-                
-                # Save
-                cache.save(cache_key, db_data)
-                return f"Success {c_name} {year}: {len(new_data)} records"
-
-            except Exception as e:
-                print(f"Error Syncing {c_name} {year}: {e}")
-                return f"Error {c_name} {year}: {str(e)}"
+            print(f"[{c_name}] Syncing Year {year}...")
+            fetched = []
+
+            def on_progress(event):
+                if event["stage"] == "gap_saved":
+                    fetched.append(event["rows"])
+
+            # Fetch FULL year and replace its months in the store (other years untouched)
+            _, err = await sync_company_async(company, start_date, end_date, force_refresh=True,
+                                              progress_callback=on_progress, read_result=False, priority=BACKGROUND)
+            if err:
+                return err
+            if not fetched:
+                return f"No data for {c_name} in {year}"
+            return f"Success {c_name} {year}: {sum(fetched)} records"
 
         # Run Heavy Sync
         # We process (Company x Year) combinations
@@ -533,12 +269,16 @@ def sync_movements(
             for y in request.years:
                 tasks.append((c, y))
                 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_task = {executor.submit(process_sync, t[0], t[1]): t for t in tasks}
-            
-            for future in concurrent.futures.as_completed(future_to_task):
-                res = future.result()
-                results.append(res)
+        async def run_all():
+            sem = asyncio.Semaphore(5)
+
+            async def bounded(c, y):
+                async with sem:
+                    return await process_sync(c, y)
+
+            return await asyncio.gather(*(bounded(c, y) for c, y in tasks))
+
+        results.extend(run_sync(run_all()))
                 
         return {"status": "completed", "details": results}
 
@@ -562,21 +302,14 @@ def get_sync_status(
             if not company.get("valid", True): continue
             
             c_name = company.get("name")
-            cache_key = f"history_{c_name}.json"
             
-            # Load cache (Metadata check would be faster, but loading is safer for accuracy)
-            db_data = cache.load(cache_key) or []
+            # Answered from the store manifest (no partition is read)
+            summary = movement_store.summary(c_name)
             
-            if db_data:
-                valid_dates = [x['date'] for x in db_data if x.get('date')]
-                if valid_dates:
-                    min_date = min(valid_dates)
-                    max_date = max(valid_dates)
-                    count = len(db_data)
-                else:
-                    min_date = "N/A"
-                    max_date = "N/A"
-                    count = 0
+            if summary["count"]:
+                min_date = summary["min_date"]
+                max_date = summary["max_date"]
+                count = summary["count"]
             else:
                 min_date = "Sin Datos"
                 max_date = "Sin Datos"
@@ -586,7 +319,9 @@ def get_sync_status(
                 "company": c_name,
                 "min_date": min_date,
                 "max_date": max_date,
-                "count": count
+                "count": count,
+                "months": summary["months"],
+                "last_fetched_at": summary["last_fetched_at"]
             })
             
         return status_report
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
 import logging
 from app.services.config import get_config
-from app.routers.inventory_router import get_consolidated_inventory
+from app.routers.inventory_router import refresh_inventory_snapshot
+from app.services.siigo_scheduler import BACKGROUND
 from app.services.email_service import send_daily_report_email
 from app.services.movements import get_consolidated_movements
 from app.services.auth import get_auth_token
@@ -31,14 +32,11 @@ async def trigger_daily_email_report(background_tasks: BackgroundTasks, secret:
 
     logger.info("Starting Daily Inventory Report Generation...")
 
-    # Reuse logic from inventory router
-    # We pass a dummy user dict because get_consolidated_inventory expects it for filtering,
-    # but we want ALL data for the admin report, so we simulate an admin role.
-    admin_user = {"role": "admin", "username": "system_cron"}
-    
+    # Reuse logic from inventory router (unfiltered: the admin report needs ALL data).
+    # Cron traffic runs at BACKGROUND priority so it never starves interactive users.
     try:
         # Get Data (Force Refresh to ensure accuracy for the morning report)
-        result = get_consolidated_inventory(user=admin_user, force_refresh=True)
+        result = refresh_inventory_snapshot(force_refresh=True, priority=BACKGROUND)
         inventory_data = result.get("data", [])
         
         if not inventory_data:
@@ -1,172 +1,148 @@
-
 from datetime import datetime, timedelta
-import concurrent.futures
+import numpy as np
 from app.services.config import get_config
-from app.services.auth import get_auth_token
-from app.services.movements import get_consolidated_movements
-from app.services.utils import normalize_sku
+from app.services.movement_sync import sync_companies_async
+from app.services.sales_rollup import sales_rollup
+from app.services.siigo_async import run_sync
 
-def calculate_average_sales(days=30, split_by_company=False):
+# Extra windows commonly requested together (distribution uses N + 5 days)
+DEFAULT_WINDOWS = (5, 15, 30, 60, 90)
+
+def _window_bounds(days):
+    """[start, end] of a `days` window ending YESTERDAY (today is partial)."""
+    end_date = datetime.now() - timedelta(days=1)
+    # Subtract (days - 1) because the range [start, end] is inclusive.
+    start_date = end_date - timedelta(days=days - 1)
+    return start_date, end_date
+
+def _company_matrix(daily, day_index):
+    """SKU x day matrices (quantity, lines) from a rollup slice {day: {sku: [qty, lines]}}."""
+    skus = sorted({sku for per_day in daily.values() for sku in per_day})
+    sku_index = {s: i for i, s in enumerate(skus)}
+    qty = np.zeros((len(skus), len(day_index)))
+    lines = np.zeros((len(skus), len(day_index)), dtype=np.int64)
+    for day, per_day in daily.items():
+        j = day_index.get(day)
+        if j is None:
+            continue
+        for sku, (q, n) in per_day.items():
+            qty[sku_index[sku], j] = q
+            lines[sku_index[sku], j] = n
+    return skus, qty, lines
+
+def _trend_labels(first_half, second_half):
+    return np.where(second_half > first_half * 1.1, "up",
+                    np.where(second_half < first_half * 0.9, "down", "stable"))
+
+def calculate_sales_windows(windows=DEFAULT_WINDOWS, split_by_company=False):
     """
-    Calculates the average daily sales for each product (SKU) over the last 'days'.
-    Sources data from "FV" (Factura de Venta) documents across all companies.
-    
-    If split_by_company=True, returns { "Company Name": { "SKU": avg }, ... }
-    Else returns { "SKU": global_avg }
+    Averages and half-window trends for several windows in one pass.
+
+    The FV coverage of the largest window is synced once, each company's
+    rollup becomes a SKU x day NumPy matrix, and every window is a slice of
+    its prefix sums, so extra windows cost almost nothing.
+
+    Returns {days: (averages, trends, audit_report)} with the same shapes as
+    calculate_average_sales.
     """
-    # Calculate window: 20 days starting from YESTERDAY.
-    # Exclude today to avoid partial data affecting the average.
-    today = datetime.now()
-    end_date = today - timedelta(days=1)
-    
-    # FIXED: Subtract (days - 1) because the range [start, end] is inclusive.
-    start_date = end_date - timedelta(days=days - 1)
-    
+    windows = sorted({int(w) for w in windows if int(w) > 0})
+    max_days = windows[-1]
+    start_date, end_date = _window_bounds(max_days)
     start_str = start_date.strftime("%Y-%m-%d")
     end_str = end_date.strftime("%Y-%m-%d")
-    
+    all_days = [(start_date + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(max_days)]
+    day_index = {d: i for i, d in enumerate(all_days)}
+
     # We only care about Sales Invoices
-    selected_types = ["FV"] 
-    
+    selected_types = ["FV"]
     companies = get_config()
-    
-    print(f"[DEBUG] Calculating averages from {start_str} to {end_str} (Split: {split_by_company})") # DEBUG
-    
-    # Audit Metadata
-    audit_report = {
-        "start_date": start_str,
-        "end_date": end_str,
-        "days_window": days,
-        "formula": f"Sum(Qty) / {days}",
-        "companies": {},
-        "total_movements": 0
-    }
-
-    # Data structure to hold raw totals:
-    # Global: { "SKU": total_qty }
-    # Split: { "Company A": { "SKU": total_qty }, ... }
-    
-    global_totals = {}
-    split_totals = {} # { "Company": { "SKU": qty } }
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=len(companies) + 2) as executor:
-        future_to_company = {}
-        
-        for company in companies:
-            if not company.get("valid", True):
-                audit_report["companies"][company["name"]] = "Skipped (Invalid Config)"
-                continue
-                
-            future = executor.submit(
-                _fetch_company_sales, 
-                company, 
-                start_str, 
-                end_str, 
-                selected_types
+
+    print(f"[DEBUG] Calculating averages for windows {windows} up to {end_str} (Split: {split_by_company})") # DEBUG
+
+    # 1. Bring the FV coverage of the largest window up to date (only missing days hit Siigo)
+    company_notes = {}
+    valid_companies = []
+    for company in companies:
+        if not company.get("valid", True):
+            company_notes[company["name"]] = "Skipped (Invalid Config)"
+        else:
+            valid_companies.append(company)
+
+    sync_results = run_sync(sync_companies_async(
+        valid_companies, start_str, end_str, doc_types=selected_types, read_result=False
+    ))
+
+    # 2. One matrix per company from the persisted daily rollup
+    matrices = {}  # company -> (skus, qty prefix sums, lines prefix sums)
+    for company, (_, err) in zip(valid_companies, sync_results):
+        company_name = company.get("name", "Unknown")
+        try:
+            if err:
+                print(f"[DEBUG] {company_name}: sync error ({err}), using stored sales only.")
+                company_notes[company_name] = f"Error: {err}"
+            daily = sales_rollup.daily_sales(company_name, start_str, end_str)
+            skus, qty, lines = _company_matrix(daily, day_index)
+            # Leading zero column: window total = csum[:, end] - csum[:, start]
+            zeros = np.zeros((len(skus), 1))
+            matrices[company_name] = (
+                skus,
+                np.hstack([zeros, np.cumsum(qty, axis=1)]),
+                np.hstack([zeros.astype(np.int64), np.cumsum(lines, axis=1)]),
             )
-            future_to_company[future] = company
-            
-        for future in concurrent.futures.as_completed(future_to_company):
-            company = future_to_company[future]
-            company_name = company.get("name", "Unknown")
-            try:
-                movements = future.result()
-                count = len(movements) if movements else 0
-                audit_report["companies"][company_name] = count
-                
-                if movements:
-                    print(f"[DEBUG] {company_name}: Fetched {count} movements.") # DEBUG
-                    audit_report["total_movements"] += count
-                    
-                    # Aggregate
-                     # Aggregate
-                    if split_by_company:
-                        if company_name not in split_totals:
-                            split_totals[company_name] = {}
-                        
-                        for mov in movements:
-                            sku = normalize_sku(mov.get("code"))
-                            if not sku: continue
-                            qty = abs(float(mov.get("quantity", 0)))
-                            m_date = mov.get("date", "") # Expecting YYYY-MM-DD
-                            
-                            if sku not in split_totals[company_name]:
-                                split_totals[company_name][sku] = {"total": 0.0, "history": []}
-                                
-                            split_totals[company_name][sku]["total"] += qty
-                            split_totals[company_name][sku]["history"].append({"d": m_date, "q": qty})
-                    else:
-                        for mov in movements:
-                            sku = normalize_sku(mov.get("code"))
-                            if not sku: continue
-                            qty = abs(float(mov.get("quantity", 0)))
-                            global_totals[sku] = global_totals.get(sku, 0.0) + qty
-                else:
-                     print(f"[DEBUG] {company_name}: No movements found.") # DEBUG
-            except Exception as e:
-                msg = f"Error: {str(e)}"
-                print(f"Error calculating averages for {company_name}: {msg}")
-                audit_report["companies"][company_name] = msg
-
-    # 3. Final Averages Calculation
-    # 3. Final Averages & Trends Calculation
-    if split_by_company:
-        final_averages = {}
-        final_trends = {} # { "Company": { "SKU": "up" | "down" | "stable" } }
-        
-        midpoint_date = (start_date + (end_date - start_date) / 2).strftime("%Y-%m-%d")
-
-        for c_name, c_skus in split_totals.items():
-            final_averages[c_name] = {}
-            final_trends[c_name] = {}
-            
-            for sku, data_obj in c_skus.items():
-                total = data_obj["total"]
-                if total > 0:
-                    final_averages[c_name][sku] = round(total / days, 4)
-                    
-                    # Trend Calc: Split buckets by date
-                    first_half = 0.0
-                    second_half = 0.0
-                    
-                    for h_item in data_obj["history"]:
-                        if h_item["d"] <= midpoint_date:
-                            first_half += h_item["q"]
-                        else:
-                            second_half += h_item["q"]
-                            
-                    # Debug Print
-                    if total > 5:
-                        print(f"TREND DEBUG: {c_name} {sku} [1st: {first_half:.1f} vs 2nd: {second_half:.1f}]")
-
-                    # Determine Trend
-                    if second_half > first_half * 1.1:
-                        final_trends[c_name][sku] = "up"
-                    elif second_half < first_half * 0.9:
-                        final_trends[c_name][sku] = "down"
-                    else:
-                        final_trends[c_name][sku] = "stable"
-
-        return final_averages, final_trends, audit_report
-    else:
-        # Global
-        sku_averages = {}
-        for sku, total_qty in global_totals.items():
-            if total_qty > 0:
-                sku_averages[sku] = round(total_qty / days, 4)
-        print(f"[DEBUG] Calculated averages for {len(sku_averages)} SKUs.")
-        return sku_averages, {}, audit_report
-
-def _fetch_company_sales(company, start_str, end_str, selected_types):
-    token = get_auth_token(company["username"], company["access_key"])
-    if not token:
-        print(f"[DEBUG] Failed to get token for {company['name']}") # DEBUG
-        return []
-        
-    return get_consolidated_movements(
-        token, 
-        start_str, 
-        end_str, 
-        progress_callback=None, 
-        selected_types=selected_types
-    )
+        except Exception as e:
+            msg = f"Error: {str(e)}"
+            print(f"Error calculating averages for {company_name}: {msg}")
+            company_notes[company_name] = msg
+
+    # 3. Every window is a slice of the prefix sums
+    results = {}
+    for days in windows:
+        w_start = max_days - days  # first column of this window
+        half = (days - 1) // 2 + 1  # days up to the midpoint date (inclusive)
+        audit_report = {
+            "start_date": all_days[w_start],
+            "end_date": end_str,
+            "days_window": days,
+            "formula": f"Sum(Qty) / {days}",
+            "companies": dict(company_notes),
+            "total_movements": 0
+        }
+        split_averages, split_trends = {}, {}
+        global_totals = {}
+
+        for c_name, (skus, csum, lsum) in matrices.items():
+            total = csum[:, max_days] - csum[:, w_start]
+            count = int((lsum[:, max_days] - lsum[:, w_start]).sum())
+            note = company_notes.get(c_name)
+            audit_report["companies"][c_name] = f"{count} ({note})" if note else count
+            audit_report["total_movements"] += count
+
+            selling = np.nonzero(total > 0)[0]
+            if split_by_company:
+                first_half = csum[selling, w_start + half] - csum[selling, w_start]
+                second_half = total[selling] - first_half
+                avgs = np.round(total[selling] / days, 4)
+                labels = _trend_labels(first_half, second_half)
+                split_averages[c_name] = {skus[i]: float(a) for i, a in zip(selling, avgs)}
+                split_trends[c_name] = {skus[i]: str(t) for i, t in zip(selling, labels)}
+            else:
+                for i in selling:
+                    global_totals[skus[i]] = global_totals.get(skus[i], 0.0) + float(total[i])
+
+        if split_by_company:
+            results[days] = (split_averages, split_trends, audit_report)
+        else:
+            sku_averages = {sku: round(qty / days, 4) for sku, qty in global_totals.items() if qty > 0}
+            results[days] = (sku_averages, {}, audit_report)
+    return results
+
+def calculate_average_sales(days=30, split_by_company=False):
+    """
+    Calculates the average daily sales for each product (SKU) over the last 'days'.
+    Sources data from "FV" (Factura de Venta) documents across all companies,
+    read from the daily sales rollup after syncing only the missing days.
+
+    If split_by_company=True, returns ({ "Company Name": { "SKU": avg } }, trends, audit)
+    Else returns ({ "SKU": global_avg }, {}, audit)
+    """
+    return calculate_sales_windows([days], split_by_company)[int(days)]
@@ -1,9 +1,26 @@
 import requests
 import time
+import hashlib
+import threading
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
+from app.services.siigo_scheduler import siigo_scheduler, credential_key, register_token, forget_token
+from app.services.singleflight import SingleFlight, Revalidator
+from app.services import http_client
 
 AUTH_URL = "https://api.siigo.com/auth"
 
+# Siigo tokens live 24h; refresh in the background once less than this remains
+REFRESH_MARGIN_S = 30 * 60
+# Never trust an expiry closer than this (clock skew, request latency)
+EXPIRY_SKEW_S = 60
+DEFAULT_EXPIRES_IN = 24 * 3600
+
+_token_cache = {}  # (username, partner_id) -> {"token", "expires_at", "key_hash"}
+_token_lock = threading.Lock()
+_auth_flight = SingleFlight()
+# Background refreshes back off after failures instead of re-hitting a broken auth endpoint
+_refresher = Revalidator("siigo-auth")
+
 def should_retry(e):
     if isinstance(e, requests.exceptions.HTTPError):
         return e.response.status_code in (429, 500, 502, 503, 504)
@@ -15,14 +32,17 @@ def should_retry(e):
     stop=stop_after_attempt(5)
 )
 def _do_auth_request(data, headers):
-    response = requests.post(AUTH_URL, json=data, headers=headers, timeout=15)
+    with siigo_scheduler.slot(credential_key(data["username"])) as ticket:
+        response = http_client.post(AUTH_URL, json=data, headers=headers, timeout=15)
+        ticket.observe(response)
     response.raise_for_status()
-    return response.json().get("access_token")
+    return response.json()
 
-def get_auth_token(username, access_key, partner_id="SiigoApi"):
-    """
-    Obtains an access token from Siigo API.
-    """
+def _key_hash(access_key):
+    return hashlib.sha256(str(access_key).encode("utf-8")).hexdigest()
+
+def _authenticate(username, access_key, partner_id):
+    """Performs the auth round-trip and stores the token. Returns the token or None."""
     headers = {
         "Content-Type": "application/json",
         "Partner-Id": partner_id
@@ -31,9 +51,65 @@ def get_auth_token(username, access_key, partner_id="SiigoApi"):
         "username": username,
         "access_key": access_key
     }
-    
+
     try:
-        return _do_auth_request(data, headers)
+        payload = _do_auth_request(data, headers)
     except Exception as e:
         print(f"Error authenticating: {e}")
         return None
+
+    token = payload.get("access_token")
+    if not token:
+        return None
+    try:
+        expires_in = float(payload.get("expires_in") or DEFAULT_EXPIRES_IN)
+    except (TypeError, ValueError):
+        expires_in = DEFAULT_EXPIRES_IN
+    with _token_lock:
+        _token_cache[(username, partner_id)] = {
+            "token": token,
+            "expires_at": time.time() + expires_in - EXPIRY_SKEW_S,
+            "key_hash": _key_hash(access_key),
+        }
+    register_token(token, username)
+    return token
+
+def _refresh_in_background(username, access_key, partner_id):
+    key = (username, partner_id)
+    if _auth_flight.in_flight(key):
+        return
+
+    def refresh():
+        token = _authenticate(username, access_key, partner_id)
+        if not token:
+            raise RuntimeError(f"Siigo auth refresh failed for {username}")
+        return token
+
+    _refresher.refresh(key, refresh)
+
+def get_auth_token(username, access_key, partner_id="SiigoApi"):
+    """
+    Obtains an access token from Siigo API.
+    Tokens are cached per (username, partner_id) until they expire; concurrent
+    callers share one auth request and tokens close to expiry are refreshed
+    in the background while the current one is still served.
+    """
+    key = (username, partner_id)
+    now = time.time()
+    with _token_lock:
+        entry = _token_cache.get(key)
+    if entry and entry["key_hash"] == _key_hash(access_key) and entry["expires_at"] > now:
+        if entry["expires_at"] - now < REFRESH_MARGIN_S:
+            _refresh_in_background(username, access_key, partner_id)
+        return entry["token"]
+
+    return _auth_flight.do(key, lambda: _authenticate(username, access_key, partner_id))
+
+def invalidate_token(token):
+    """Drops a token Siigo rejected (401) so the next caller authenticates again."""
+    if token and token.startswith("Bearer "):
+        token = token[len("Bearer "):]
+    with _token_lock:
+        for key in [k for k, v in _token_cache.items() if v["token"] == token]:
+            del _token_cache[key]
+    forget_token(token)
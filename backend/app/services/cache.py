@@ -3,10 +3,45 @@ import json
 import logging
 import gzip
 import io
+import time
+import copy
+import random
+import threading
+from app.services.singleflight import Revalidator, freshness_meta
+from app.services.mem_cache import MemCache
+from app.services.write_behind import WriteBehindQueue
 try:
     from google.cloud import storage
 except ImportError:
     storage = None
+try:
+    from google.api_core.exceptions import NotFound, NotModified, PreconditionFailed
+except ImportError:
+    NotFound = NotModified = PreconditionFailed = None
+
+# L1: decoded JSON objects kept in RAM, validated against the local file (mtime + size)
+L1_MAX_ENTRIES = int(os.getenv("CACHE_L1_MAX_ENTRIES", "512"))
+L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_MB", "64")) * 1024 * 1024
+L1_TTL_S = 3600
+# Decoded Python objects take several times their JSON size
+L1_SIZE_FACTOR = 4
+
+# Cloud uploads run in background workers (write-behind); CACHE_WRITE_BEHIND=0 uploads inline
+WRITE_BEHIND = os.getenv("CACHE_WRITE_BEHIND", "1") != "0"
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("CACHE_WRITE_BEHIND_MAX_PENDING", "256"))
+WRITE_BEHIND_BLOCK_S = 30
+
+# Sidecar next to each local copy: GCS generation it came from / was uploaded as
+GENERATION_SUFFIX = ".gen"
+
+# update(): compare-and-swap attempts before giving up, and the base backoff between them
+UPDATE_RETRIES = 5
+UPDATE_BACKOFF_S = 0.05
+
+
+class CacheConflict(Exception):
+    """update() kept losing the compare-and-swap against other writers."""
+
 
 class CacheService:
     def __init__(self):
@@ -17,6 +52,7 @@ class CacheService:
         default_storage = os.path.join(base_dir, "storage")
         
         self.local_dir = os.getenv("PERSISTENT_STORAGE_DIR", default_storage)
+        self.bucket_name = os.getenv("GCS_BUCKET_NAME")
         self.client = None
         self.bucket = None
         
@@ -35,6 +71,14 @@ class CacheService:
                 self.local_dir = "storage"
                 os.makedirs(self.local_dir, exist_ok=True)
                 
+        self._revalidator = Revalidator("cache")
+        self._l1 = MemCache(max_entries=L1_MAX_ENTRIES, max_bytes=L1_MAX_BYTES, sweep_interval=0)
+        self._generations = {}   # key -> (GCS generation of the local copy, last validated at)
+        self._local_writes = {}  # key -> local save counter (tells stale uploads apart)
+        self._gen_lock = threading.Lock()
+        self._key_locks = {}
+        self._key_locks_guard = threading.Lock()
+        self._uploads = WriteBehindQueue(self._upload, max_pending=WRITE_BEHIND_MAX_PENDING, name="cache-upload")
         logging.info(f"CacheService initialized in {self.mode.upper()} mode. Storage: {self.local_dir}")
 
     def _connect(self):
@@ -49,65 +93,277 @@ class CacheService:
                 if not os.path.exists(self.local_dir):
                     os.makedirs(self.local_dir, exist_ok=True)
 
+    def _write_local(self, filepath: str, payload: bytes):
+        """Atomic local write: temp file in the same directory + rename (no torn reads)."""
+        tmp = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(payload)
+            os.replace(tmp, filepath)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _key_lock(self, key: str):
+        with self._key_locks_guard:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.RLock()
+            return lock
+
+    @staticmethod
+    def _gzip(payload: bytes) -> bytes:
+        out = io.BytesIO()
+        with gzip.GzipFile(fileobj=out, mode='w') as f:
+            f.write(payload)
+        return out.getvalue()
+
+    @staticmethod
+    def _gunzip(raw: bytes) -> bytes:
+        try:
+            with gzip.GzipFile(fileobj=io.BytesIO(raw), mode='r') as f:
+                return f.read()
+        except OSError:
+            # Fallback if file was NOT compressed (legacy files)
+            return raw
+
+    def _decode_json(self, raw: bytes):
+        return json.loads(self._gunzip(raw).decode('utf-8'))
+
+    @staticmethod
+    def _read_local_bytes(filepath: str):
+        try:
+            with open(filepath, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    # ── GCS generations ────────────────────────────────────────────────────
+    def _local_generation(self, key: str, filepath: str):
+        """Generation of the local copy (memory, then sidecar file) or None."""
+        with self._gen_lock:
+            known = self._generations.get(key)
+        if known is not None:
+            return known[0]
+        try:
+            with open(filepath + GENERATION_SUFFIX, "r", encoding="utf-8") as f:
+                generation = json.load(f).get("generation")
+        except (OSError, ValueError):
+            return None
+        with self._gen_lock:
+            self._generations.setdefault(key, (generation, 0.0))
+        return generation
+
+    def _is_fresh(self, key: str, mtime: float, ttl) -> bool:
+        """Local copy younger than ttl, counting from its last write or GCS revalidation."""
+        if ttl is None:
+            return True
+        with self._gen_lock:
+            known = self._generations.get(key)
+        validated_at = known[1] if known else 0.0
+        return (time.time() - max(mtime, validated_at)) < ttl
+
+    def _set_generation(self, key: str, filepath: str, generation, write_seq=None) -> bool:
+        """Records the GCS generation the local copy matches. With write_seq, only if no save happened since."""
+        if generation is None:
+            return False
+        with self._gen_lock:
+            if write_seq is not None and self._local_writes.get(key, 0) != write_seq:
+                return False
+            self._generations[key] = (generation, time.time())
+        self._write_local(filepath + GENERATION_SUFFIX, json.dumps({"generation": generation}).encode("utf-8"))
+        return True
+
+    def _forget_generation(self, key: str, filepath: str) -> int:
+        """The local copy is about to be rewritten: it no longer matches any GCS generation."""
+        with self._gen_lock:
+            self._generations.pop(key, None)
+            seq = self._local_writes[key] = self._local_writes.get(key, 0) + 1
+        try:
+            os.remove(filepath + GENERATION_SUFFIX)
+        except FileNotFoundError:
+            pass
+        return seq
+
+    def _fetch_remote(self, key: str, filepath: str):
+        """
+        Conditional download. Returns (content, generation, modified):
+          - modified=False: GCS still holds the generation of the local copy,
+            nothing was downloaded and the local copy counts as revalidated
+          - content=None, modified=True: the object is missing (generation 0)
+            or could not be read (generation None)
+        """
+        known = self._local_generation(key, filepath) if os.path.exists(filepath) else None
+        blob = self.bucket.blob(key)
+        try:
+            if known is not None:
+                content = blob.download_as_bytes(if_generation_not_match=known)
+            else:
+                content = blob.download_as_bytes()
+        except Exception as e:
+            if NotModified is not None and isinstance(e, NotModified):
+                self._set_generation(key, filepath, known)
+                return None, known, False
+            logging.debug(f"Cloud miss for {key}: {e}")
+            missing = NotFound is not None and isinstance(e, NotFound)
+            return None, 0 if missing else None, True
+        return content, blob.generation, True
+
+    def _upload(self, key: str, job):
+        """Write-behind worker: pushes one payload to GCS."""
+        kind, payload, content_type, write_seq = job
+        blob = self.bucket.blob(key)
+        if kind == "json":
+            # COMPRESSION: Gzip the JSON string (off the request thread)
+            payload = self._gzip(payload)
+            blob.content_encoding = 'gzip'
+            blob.upload_from_string(payload, content_type='application/json')
+            logging.info(f"Cache Saved to Cloud (Compressed): {key} - {len(payload)} bytes")
+        else:
+            blob.upload_from_string(payload, content_type=content_type)
+            logging.info(f"Cache Saved to Cloud (Binary): {key} - {len(payload)} bytes")
+        # Local copy == this upload, unless it was saved again meanwhile
+        self._set_generation(key, os.path.join(self.local_dir, key), blob.generation, write_seq)
+
+    def _push(self, key: str, job):
+        if not WRITE_BEHIND:
+            self._upload(key, job)
+        elif not self._uploads.submit(key, job, timeout=WRITE_BEHIND_BLOCK_S):
+            # Queue still full after waiting: upload inline rather than drop the write
+            logging.warning(f"Write-behind queue full, uploading {key} inline")
+            self._upload(key, job)
+
     def save(self, key: str, data: dict):
+        with self._key_lock(key):
+            return self._save(key, data)
+
+    def _save(self, key: str, data: dict):
+        # Invalidate first: a concurrent load must not keep serving the old object
+        self._l1.delete(key)
         try:
             self._connect()
-            json_str = json.dumps(data)
+            # Serialized now: later changes to `data` by the caller are not persisted
+            payload = json.dumps(data).encode("utf-8")
             
             # Save locally first (Always uncompressed for speed)
             filepath = os.path.join(self.local_dir, key)
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(json_str)
+            write_seq = self._forget_generation(key, filepath)
+            self._write_local(filepath, payload)
+            self._l1.delete(key)
 
             if self.mode == "cloud":
-                # COMPRESSION: Gzip the JSON string
-                out = io.BytesIO()
-                with gzip.GzipFile(fileobj=out, mode='w') as f:
-                    f.write(json_str.encode('utf-8'))
-                compressed_data = out.getvalue()
-
-                blob = self.bucket.blob(key)
-                blob.content_encoding = 'gzip'
-                blob.upload_from_string(compressed_data, content_type='application/json')
-                logging.info(f"Cache Saved to Cloud (Compressed): {key} - {len(compressed_data)} bytes")
+                self._push(key, ("json", payload, "application/json", write_seq))
             
             return True
         except Exception as e:
             logging.error(f"Cache Save Error: {e}")
             return False
 
-    def load(self, key: str, ttl: int = 3600):
+    def save_bytes(self, key: str, data: bytes, content_type: str = "application/octet-stream"):
+        """
+        Stores an already-encoded binary payload (e.g. Parquet partitions).
+        No gzip layer: columnar formats are compressed internally.
+        """
+        try:
+            self._connect()
+            filepath = os.path.join(self.local_dir, key)
+            with self._key_lock(key):
+                write_seq = self._forget_generation(key, filepath)
+                self._write_local(filepath, data)
+
+            if self.mode == "cloud":
+                self._push(key, ("bytes", data, content_type, write_seq))
+
+            return True
+        except Exception as e:
+            logging.error(f"Cache Save Error (binary): {e}")
+            return False
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Waits for pending cloud uploads (call on shutdown)."""
+        return self._uploads.flush(timeout)
+
+    def upload_stats(self) -> dict:
+        return self._uploads.stats()
+
+    def load_bytes(self, key: str, ttl: int = 3600):
+        """Binary counterpart of load(). Returns raw bytes or None."""
         try:
-            # 1. Try local cache first (Short-term memory)
             filepath = os.path.join(self.local_dir, key)
             if os.path.exists(filepath):
-                import time
-                # TTL check - if ttl is None, it never expires
-                if ttl is None or (time.time() - os.path.getmtime(filepath)) < ttl:
-                    with open(filepath, "r", encoding="utf-8") as f:
-                        return json.load(f)
+                if ttl is None or self._uploads.has_pending(key) or self._is_fresh(key, os.path.getmtime(filepath), ttl):
+                    with open(filepath, "rb") as f:
+                        return f.read()
 
-            # 2. Try Cloud cache
             self._connect()
             if self.mode == "cloud":
-                blob = self.bucket.blob(key)
+                content, generation, modified = self._fetch_remote(key, filepath)
+                if not modified:
+                    # Same generation as the local copy: nothing downloaded
+                    with open(filepath, "rb") as f:
+                        return f.read()
+                if content is None:
+                    return None
+                self._write_local(filepath, content)
+                self._set_generation(key, filepath, generation)
+                return content
+
+            return None
+        except Exception as e:
+            logging.warning(f"Cache Load Miss/Error (binary): {e}")
+            return None
+
+    def _load_local(self, key: str, filepath: str, ttl):
+        """Local file through the L1 tier; None when missing or older than ttl."""
+        try:
+            st = os.stat(filepath)
+        except FileNotFoundError:
+            return None
+        # TTL check - if ttl is None, it never expires
+        if not self._is_fresh(key, st.st_mtime, ttl):
+            return None
+        version = (st.st_mtime_ns, st.st_size)
+        hit = self._l1.get(key)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+        with open(filepath, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self._l1.set(key, (version, data), L1_TTL_S, size=st.st_size * L1_SIZE_FACTOR)
+        return data
+
+    def load(self, key: str, ttl: int = 3600):
+        """
+        Decoded JSON for `key` or None. The object may be shared with other
+        callers (L1 tier): treat it as read-only, or use load_mutable.
+        """
+        try:
+            # 1. Try local cache first (L1 memory, then disk)
+            filepath = os.path.join(self.local_dir, key)
+            data = self._load_local(key, filepath, ttl)
+            if data is None and self._uploads.has_pending(key):
+                # GCS has not received the latest save yet: the local copy is the newest
+                data = self._load_local(key, filepath, None)
+            if data is not None:
+                return data
+
+            # 2. Try Cloud cache (conditional on the generation of the local copy)
+            self._connect()
+            if self.mode == "cloud":
+                compressed_content, generation, modified = self._fetch_remote(key, filepath)
+                if not modified:
+                    # Unchanged in GCS since we last read/wrote it: the local copy is current
+                    return self._load_local(key, filepath, None)
+                if compressed_content is None:
+                    return None
                 try:
                     # GCS will auto-decompress if we use download_as_text() AND content-encoding was set,
                     # but being explicit is safer for cost control.
-                    compressed_content = blob.download_as_bytes()
-                    
-                    # Decompress
-                    try:
-                        with gzip.GzipFile(fileobj=io.BytesIO(compressed_content), mode='r') as f:
-                            content = f.read().decode('utf-8')
-                    except:
-                        # Fallback if file was NOT compressed (legacy files)
-                        content = compressed_content.decode('utf-8')
-
-                    # Update local cache
-                    with open(filepath, "w", encoding="utf-8") as f:
-                        f.write(content)
-                    return json.loads(content)
+                    data = self._decode_json(compressed_content)
+
+                    # Update local cache; the rewrite (new mtime/size) also invalidates the L1 copy
+                    self._write_local(filepath, json.dumps(data).encode("utf-8"))
+                    self._set_generation(key, filepath, generation)
+                    return data
                 except Exception as e:
                     logging.debug(f"Cloud miss for {key}: {e}")
                     return None
@@ -117,4 +373,121 @@ class CacheService:
             logging.warning(f"Cache Load Miss/Error: {e}")
             return None
 
+    def load_mutable(self, key: str, ttl: int = 3600):
+        """load() returning a private deep copy, for callers that modify what they read."""
+        return copy.deepcopy(self.load(key, ttl))
+
+    def update(self, key: str, mutator, default=None):
+        """
+        Read-modify-write of a JSON key that several writers share.
+
+        `mutator(current)` receives a private copy of the latest value (or a
+        copy of `default` when the key does not exist) and returns the new
+        value, or None to leave the key untouched. Writers of the same key in
+        this process are serialized; across instances the upload is a
+        compare-and-swap on the GCS generation (if_generation_match), and a
+        writer that lost the race re-reads the winner's value and re-applies
+        its mutator. Returns the value stored (or left) under `key`.
+        """
+        def apply(raw):
+            current = None if raw is None else json.loads(raw.decode("utf-8"))
+            result = mutator(copy.deepcopy(default) if current is None else current)
+            if result is None:
+                return None, current
+            return json.dumps(result).encode("utf-8"), result
+
+        return self._swap(key, apply, "json", "application/json")
+
+    def update_bytes(self, key: str, mutator, content_type: str = "application/octet-stream"):
+        """
+        Binary counterpart of update(): `mutator(current bytes or None)` returns
+        the new payload (or None to leave it). Returns the payload stored (or left).
+        """
+        def apply(raw):
+            result = mutator(raw)
+            return result, raw if result is None else result
+
+        return self._swap(key, apply, "bytes", content_type)
+
+    def _swap(self, key: str, apply, kind: str, content_type: str):
+        """Compare-and-swap loop shared by update/update_bytes. apply(raw) -> (payload or None, value)."""
+        with self._key_lock(key):
+            self._connect()
+            filepath = os.path.join(self.local_dir, key)
+            if self.mode != "cloud":
+                payload, value = apply(self._read_local_bytes(filepath))
+                if payload is not None:
+                    self._forget_generation(key, filepath)
+                    self._write_local(filepath, payload)
+                    self._l1.delete(key)
+                return value
+
+            # Our own queued upload must land first: GCS is behind the local copy until then
+            self._uploads.wait(key, WRITE_BEHIND_BLOCK_S)
+            for attempt in range(1, UPDATE_RETRIES + 1):
+                raw, generation, modified = self._fetch_remote(key, filepath)
+                if not modified:
+                    raw = self._read_local_bytes(filepath)
+                elif raw is not None and kind == "json":
+                    raw = self._gunzip(raw)
+                payload, value = apply(raw)
+                if payload is None:
+                    return value
+                blob = self.bucket.blob(key)
+                body = payload
+                if kind == "json":
+                    blob.content_encoding = 'gzip'
+                    body = self._gzip(payload)
+                try:
+                    if generation is None:
+                        # GCS unreadable: no version to compare against, write unconditionally
+                        logging.warning(f"Cache update of {key} without a generation check")
+                        blob.upload_from_string(body, content_type=content_type)
+                    else:
+                        blob.upload_from_string(body, content_type=content_type, if_generation_match=generation)
+                except Exception as e:
+                    if PreconditionFailed is None or not isinstance(e, PreconditionFailed):
+                        raise
+                    logging.info(f"Cache update conflict on {key} (attempt {attempt}), merging and retrying")
+                    time.sleep(UPDATE_BACKOFF_S * attempt * (1 + random.random()))
+                    continue
+                write_seq = self._forget_generation(key, filepath)
+                self._write_local(filepath, payload)
+                self._l1.delete(key)
+                self._set_generation(key, filepath, blob.generation, write_seq)
+                return value
+            raise CacheConflict(f"{key}: still conflicting after {UPDATE_RETRIES} attempts")
+
+    def generation(self, key: str):
+        """GCS generation of the local copy of `key` (None when unknown / local mode)."""
+        with self._gen_lock:
+            known = self._generations.get(key)
+        return known[0] if known else None
+
+    def l1_stats(self) -> dict:
+        return self._l1.stats()
+
+    def load_swr(self, key: str, refresh, soft_ttl: int, hard_ttl: int = None):
+        """
+        Stale-while-revalidate over a JSON entry stamped with "timestamp".
+
+        `refresh()` rebuilds the entry, saves it under `key` and returns it.
+        Younger than soft_ttl: returned as is. Older (but within hard_ttl,
+        None = no limit): returned while ONE background refresh runs. Missing
+        or past hard_ttl: callers wait for a single-flight refresh.
+        Returns (data, freshness metadata).
+        """
+        data = self.load(key, ttl=None)
+        stamp = data.get("timestamp") if isinstance(data, dict) else None
+        if isinstance(stamp, (int, float)):
+            age = time.time() - stamp
+            if age < soft_ttl:
+                return data, freshness_meta(stamp, soft_ttl)
+            if hard_ttl is None or age < hard_ttl:
+                self._revalidator.refresh(key, refresh)
+                return data, freshness_meta(stamp, soft_ttl, self._revalidator.refreshing(key))
+        data = self._revalidator.run(key, refresh)
+        stamp = data.get("timestamp") if isinstance(data, dict) else None
+        return data, freshness_meta(stamp or time.time(), soft_ttl)
+
 cache = CacheService()
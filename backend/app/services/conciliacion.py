@@ -6,6 +6,8 @@ import re
 from app.services.config import get_config
 from app.services.auth import get_auth_token
 from app.services.movements import get_consolidated_movements
+from app.services.movement_records import set_company
+from app.services.sku_catalog import sku_catalog
 
 def normalize_company_name(raw_name: str) -> str:
     rn = str(raw_name).upper().strip()
@@ -40,21 +42,12 @@ def normalize_invoice(inv: str) -> str:
     return s
 
 def normalize_sku(sku) -> str:
-    # Pandas often reads integer codes from Excel/Sheets as floats (e.g. 7210 → 7210.0).
-    # Convert to int first to avoid "7210.0" → "72100" when stripping non-digits.
-    try:
-        f = float(str(sku))
-        s = str(int(f)).upper().strip()
-    except (ValueError, TypeError):
-        s = str(sku).upper().strip()
-
-    if "SD15" in s:
-        return "SD15"
-    import re
-    digits = re.sub(r'\D', '', s)
-    if digits:
-        return str(int(digits))
-    return s
+    # Empty codes stay empty so sheet rows without a code are skipped
+    if sku is None or str(sku).strip() == "":
+        return ""
+    code = sku_catalog.normalize(sku)
+    # Sheets read numeric codes as numbers ("0123" -> 123): compare numeric codes without leading zeros
+    return str(int(code)) if code.isdigit() else code
 
 def get_conciliacion_data(url: str, start_date: str, end_date: str, exclude_almaverde: bool = False) -> Dict[str, Any]:
     # 1. Fetch Siigo FVs
@@ -72,10 +65,10 @@ def get_conciliacion_data(url: str, start_date: str, end_date: str, exclude_alma
         if not auth_token: return []
         
         docs_fv = get_consolidated_movements(auth_token, start_date, end_date, selected_types=["FV"])
-        for d in docs_fv: d["company"] = c_name
+        set_company(docs_fv, c_name)
         
         docs_nc = get_consolidated_movements(auth_token, start_date, end_date, selected_types=["NC"])
-        for d in docs_nc: d["company"] = c_name
+        set_company(docs_nc, c_name)
         
         return docs_fv + docs_nc
         
@@ -87,22 +80,22 @@ def get_conciliacion_data(url: str, start_date: str, end_date: str, exclude_alma
         
     siigo_invoices = {}
     for row in siigo_data:
-        inv = row.get("doc_number")
+        inv = row.doc_number
         if not inv: continue
         
         inv_clean = normalize_invoice(inv)
-        comp = row.get("company", "Desconocida")
+        comp = row.company or "Desconocida"
         comp_norm = normalize_company_name(comp)
         
-        code_raw = str(row.get("code", "")).strip().upper()
+        code_raw = str(row.code or "").strip().upper()
         code = normalize_sku(code_raw)
-        qty = float(row.get("quantity", 0))
-        doc_type = row.get("doc_type", "FV")
+        qty = float(row.quantity or 0)
+        doc_type = row.doc_type or "FV"
         affected_inv_clean = inv_clean
         
         if doc_type == "NC":
             import re
-            obs = str(row.get("observations", "")).upper()
+            obs = str(row.observations or "").upper()
             m = re.search(r'(?:FV|FACTURA)[\s-]*(\d+-\d+|\d+)', obs)
             if m:
                 affected_inv_clean = normalize_invoice(m.group(1))
@@ -113,9 +106,9 @@ def get_conciliacion_data(url: str, start_date: str, end_date: str, exclude_alma
             siigo_invoices[key] = {
                 "empresa": comp_norm,
                 "invoice": affected_inv_clean,
-                "date": row.get("date"),
-                "client": row.get("client"),
-                "total": row.get("doc_total_value", 0),
+                "date": row.date,
+                "client": row.client,
+                "total": row.doc_total_value or 0,
                 "items": {}
             }
             
@@ -126,8 +119,8 @@ def get_conciliacion_data(url: str, start_date: str, end_date: str, exclude_alma
                   siigo_invoices[key]["items"][code] = siigo_invoices[key]["items"].get(code, 0) + qty
 
     # 2. Fetch Google Sheet
-    import requests
     import io
+    from app.services import http_client
     
     # Handle Published to Web links specifically
     if "/pub?" in url:
@@ -145,7 +138,7 @@ def get_conciliacion_data(url: str, start_date: str, end_date: str, exclude_alma
 
     try:
         print(f"[DEBUG CONCILIACION] Descargando desde: {url}")
-        resp = requests.get(url, timeout=45, headers={"User-Agent": "Mozilla/5.0"})
+        resp = http_client.get(url, timeout=45, headers={"User-Agent": "Mozilla/5.0"})
         resp.raise_for_status()
         
         # Check if it's actually CSV content despite the URL extension
@@ -0,0 +1,119 @@
+"""
+http_client.py — Capa de transporte HTTP compartida.
+
+One pooled `requests.Session` per host so page fetches against Siigo and
+Google Sheets reuse keep-alive connections instead of paying a TCP+TLS
+handshake per request:
+  - pool size per host sized to the worker concurrency (SIIGO_MAX_CONCURRENCY)
+  - gzip accepted on every response
+  - (connect, read) timeouts, with the read part set per call
+  - no cookie persistence: a host's session is shared by every company, so
+    a cookie set for one credential must not ride along on another's calls
+  - per-host metrics: requests, errors, bytes, time (the async Siigo client
+    in siigo_async reports its calls here too, through record())
+
+Usage:
+    from app.services import http_client
+    response = http_client.get(url, headers=..., params=..., timeout=30)
+
+Exceptions are the regular `requests` ones, so existing tenacity
+`should_retry` predicates keep working.
+"""
+import os
+import time
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.cookies import RequestsCookieJar
+
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", os.getenv("SIIGO_MAX_CONCURRENCY", "24")))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+DEFAULT_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+
+_sessions = {}
+_metrics = {}
+_lock = threading.Lock()
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).netloc.lower()
+
+
+def no_cookie_jar() -> RequestsCookieJar:
+    """Cookie jar that rejects every Set-Cookie (also used by the async Siigo client)."""
+    return RequestsCookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+
+
+def get_session(url: str) -> requests.Session:
+    """Returns the shared session for the host of `url`, creating it on first use."""
+    host = _host(url)
+    session = _sessions.get(host)
+    if session is not None:
+        return session
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            # Retries are handled by tenacity in the callers
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"Accept-Encoding": "gzip, deflate"})
+            session.cookies = no_cookie_jar()
+            _sessions[host] = session
+            _metrics[host] = {"requests": 0, "errors": 0, "bytes": 0, "seconds": 0.0}
+    return session
+
+
+def _timeout(timeout):
+    if timeout is None:
+        return (CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+    if isinstance(timeout, tuple):
+        return timeout
+    return (min(CONNECT_TIMEOUT, timeout), timeout)
+
+
+def record(url: str, elapsed: float, size: int = 0, failed: bool = False):
+    """Adds one request to the metrics of the host of `url`."""
+    host = _host(url)
+    with _lock:
+        m = _metrics.setdefault(host, {"requests": 0, "errors": 0, "bytes": 0, "seconds": 0.0})
+        m["requests"] += 1
+        m["errors"] += int(failed)
+        m["bytes"] += size
+        m["seconds"] += elapsed
+
+
+def request(method: str, url: str, timeout=None, **kwargs) -> requests.Response:
+    session = get_session(url)
+    start = time.monotonic()
+    failed = True
+    size = 0
+    try:
+        response = session.request(method, url, timeout=_timeout(timeout), **kwargs)
+        failed = response.status_code >= 500
+        size = len(response.content)
+        return response
+    finally:
+        record(url, time.monotonic() - start, size, failed)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def stats() -> dict:
+    """Per-host counters; avg_ms is the mean wall time per request."""
+    with _lock:
+        return {
+            host: dict(m, seconds=round(m["seconds"], 3),
+                       avg_ms=round(1000 * m["seconds"] / m["requests"], 1) if m["requests"] else 0.0)
+            for host, m in _metrics.items()
+        }
@@ -0,0 +1,69 @@
+"""
+json_stream.py — Serialización JSON rápida para respuestas grandes.
+
+Large row lists (movements) are encoded straight from the stored dicts
+instead of going through pandas (NaN -> None) and FastAPI's
+`jsonable_encoder`. Rows are written in chunks so the whole payload is
+never built next to the rows it came from.
+
+Uses orjson when installed (NaN/inf become null natively); otherwise falls
+back to the stdlib encoder, scrubbing non-finite floats first.
+"""
+import json
+import math
+
+from fastapi.responses import StreamingResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CHUNK_ROWS = 2000
+
+
+def _scrub(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {k: _scrub(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_scrub(v) for v in value]
+    return value
+
+
+def dumps(obj) -> bytes:
+    """JSON bytes; NaN/inf are encoded as null."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(_scrub(obj), ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def _row_bytes(row) -> bytes:
+    if hasattr(row, "to_row"):  # MovementLine
+        row = row.to_row()
+    return dumps(row)
+
+
+def iter_rows_json(rows, chunk_rows: int = CHUNK_ROWS, **fields):
+    """
+    Yields `{...fields, "data": [rows...]}` as JSON bytes in chunks of
+    `chunk_rows` rows. Extra `fields` are written before "data".
+    """
+    head = dumps(fields)
+    # Reopen the encoded object to append the data array
+    yield head[:-1] + (b',"data":[' if fields else b'"data":[')
+    buf = []
+    for i, row in enumerate(rows):
+        buf.append(_row_bytes(row))
+        if len(buf) >= chunk_rows:
+            yield (b"," if i >= len(buf) else b"") + b",".join(buf)
+            buf = []
+    if buf:
+        yield (b"," if i >= len(buf) else b"") + b",".join(buf)
+    yield b"]}"
+
+
+def rows_response(rows, **fields) -> StreamingResponse:
+    """Pre-encoded, chunked JSON response for large row lists."""
+    return StreamingResponse(iter_rows_json(rows, **fields), media_type="application/json")
@@ -1,11 +1,17 @@
 import pandas as pd
-import requests
+from app.services import http_client
 import io
 from datetime import datetime, timedelta
 from app.services.movements import get_consolidated_movements
+from app.services.movement_store import movement_store
+from app.services.movement_sync import sync_company
 from app.services.cache import cache
+from app.services.sku_catalog import sku_catalog
+from app.services.utils import normalize_sku
 import calendar
 
+GAME_DOC_TYPES = ["FV", "NC"]
+
 SHEET_URL = "https://docs.google.com/spreadsheets/d/e/2PACX-1vQOJxkl2FTcv3uPUE8jbhPw1HgoQAIN5iWPvvsAMU1VwHVnqM5Zaes1AExyNaSIqhmAnpOLGesj6oWi/pub?gid=0&single=true&output=csv"
 
 def get_juego_state():
@@ -72,7 +78,7 @@ def fetch_sheet_data():
     max_retries = 3
     for i in range(max_retries):
         try:
-            response = requests.get(SHEET_URL, timeout=30)
+            response = http_client.get(SHEET_URL, timeout=30)
             response.raise_for_status()
             
             # Parse CSV with header on row 3 (index 2)
@@ -151,11 +157,11 @@ def fetch_company_movements(company, start_date, end_date):
         
         local_exits = {}
         for mov in movs:
-            sku = (mov.get('code') or mov.get('product_code') or "").strip()
+            sku = (mov.code or "").strip()
             if not sku: continue
             
-            qty = float(mov.get('quantity', 0))
-            m_type = mov.get('type') # 'ENTRADA' or 'SALIDA'
+            qty = float(mov.quantity or 0)
+            m_type = mov.type # 'ENTRADA' or 'SALIDA'
             
             if sku not in local_exits: local_exits[sku] = 0.0
             
@@ -171,10 +177,7 @@ def fetch_company_movements(company, start_date, end_date):
 
 def calculate_inventory_game(token_ignored=None): 
     # Final Filter: Only specific base SKUs requested by user
-    ALLOWED_BASE_SKUS = {
-        "3001", "3005", "3012", "7701", "7702", "7703", "7901", "7957", 
-        "7007", "7008", "7009", "7210", "7299", "7101", "7416"
-    }
+    ALLOWED_BASE_SKUS = sku_catalog.game_skus
 
     # 1. Fetch Sheet Data (Robust)
     try:
@@ -216,16 +219,6 @@ def calculate_inventory_game(token_ignored=None):
         
     TARGET_WAREHOUSES = ["principal", "rionegro", "comercio", "exterior", "averia", "avería", "averías"]
     
-    def normalize_sku(code):
-        code = str(code).strip().upper()
-        if "INSUMO" in code: return code
-        if code.startswith("EVO"):
-            code = code.replace("EVO", "").strip("-").strip()
-        import re
-        match_num = re.match(r"^(\d+)", code)
-        if match_num: return match_num.group(1)
-        return code
-
     # Map SKU -> Stock Details
     sku_name_map = {}
     sku_stock_info = {} # {sku: {total: 0.0, details: []}}
@@ -273,36 +266,37 @@ def calculate_inventory_game(token_ignored=None):
     def fetch_company_movements_audit(company):
         for attempt in range(3): # Retry up to 3 times per company
             try:
-                token = get_auth_token(company["username"], company["access_key"])
-                if not token: 
-                    # If auth fails, retrying might help if it's a temp auth service glitch
+                # Only the missing days hit Siigo; the month is then read from the store
+                _, err = sync_company(company, start_date, end_date, doc_types=GAME_DOC_TYPES,
+                                      read_result=False)
+                if err:
+                    # Auth / fetch glitches are often temporary: retry
+                    print(f"Sync error {company.get('name')} (Attempt {attempt+1}): {err}")
                     time.sleep(1)
                     continue
-    
-                movs = get_consolidated_movements(
-                    token=token, 
-                    start_date=start_date, 
-                    end_date=end_date, 
-                    selected_types=['FV', 'NC']
-                )
+
+                # Secondary SKU index: only the rows of the audited SKUs are decoded
+                movs = movement_store.lookup(company["name"], skus=sorted(ALLOWED_BASE_SKUS),
+                                             start_date=start_date, end_date=end_date,
+                                             doc_types=GAME_DOC_TYPES)
                 
                 local_data = {} # {sku: {val: 0.0, logs: []}}
                 for mov in movs:
-                    raw_sku = (mov.get('code') or mov.get('product_code') or "").strip()
+                    raw_sku = (mov.get("code") or "").strip()
                     norm_sku = normalize_sku(raw_sku)
                     
                     # Filter SKU Early
                     if norm_sku not in ALLOWED_BASE_SKUS:
                         continue
                     
-                    wh_name = str(mov.get('warehouse', "")).lower()
+                    wh_name = str(mov.get("warehouse") or "").lower()
                     if not any(target in wh_name for target in TARGET_WAREHOUSES):
                         continue
                     
-                    qty = float(mov.get('quantity', 0))
-                    m_type = mov.get('type') 
+                    qty = float(mov.get("quantity") or 0)
+                    m_type = mov.get("type")
                     doc = f"{mov.get('doc_type')} {mov.get('doc_number')}"
-                    date = mov.get('date')
+                    date = mov.get("date")
                     
                     if norm_sku not in local_data: 
                         local_data[norm_sku] = {"val": 0.0, "logs": []}
@@ -3,67 +3,269 @@ mem_cache.py — Caché en memoria RAM con TTL.
 100% gratis: vive en el proceso FastAPI, sin GCS, sin disco.
 Reduce lecturas Firestore ~90% para datos que no cambian cada segundo.
 """
+import os
+import re
+import sys
 import time
 import threading
+from collections import OrderedDict
 from typing import Any, Optional, Callable
 
+from app.services.singleflight import Revalidator, freshness_meta
+
+# Stale window of get_or_set when not given: soft TTL x STALE_FACTOR
+STALE_FACTOR = 5
+
+# Límites (instancias Cloud Run pequeñas): entradas, bytes aproximados y barrido periódico
+MAX_ENTRIES = int(os.getenv("MEM_CACHE_MAX_ENTRIES", "2000"))
+MAX_BYTES = int(os.getenv("MEM_CACHE_MAX_MB", "64")) * 1024 * 1024
+SWEEP_INTERVAL_S = int(os.getenv("MEM_CACHE_SWEEP_S", "60"))
+# Metric groups kept per cache; further prefixes are counted under OTHER_GROUP
+MAX_METRIC_GROUPS = 64
+OTHER_GROUP = "_other"
+
+_PREFIX_SPLIT = re.compile(r"[_/:]")
+
+
+def approx_size(value, _depth: int = 0) -> int:
+    """Approximate deep size in bytes of JSON-like values (dicts, lists, strings, numbers)."""
+    size = sys.getsizeof(value)
+    if _depth > 6:
+        return size
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += approx_size(k, _depth + 1) + approx_size(v, _depth + 1)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for v in value:
+            size += approx_size(v, _depth + 1)
+    return size
+
+
+def _new_metrics() -> dict:
+    return {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+
+def _prefix(key: str) -> str:
+    """Metric group of a key: text up to the first `_`, `/` or `:` (`insumos:all`, `sales_rollup_X.json` -> `insumos`, `sales`)."""
+    return _PREFIX_SPLIT.split(key, 1)[0]
+
+
+class _Entry:
+    __slots__ = ("value", "fresh_until", "expire_at", "stored_at", "size")
+
+    def __init__(self, value, fresh_until, expire_at, stored_at, size):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.expire_at = expire_at
+        self.stored_at = stored_at
+        self.size = size
+
+
 class MemCache:
     """
-    TTL cache thread-safe en RAM.
-    Política: stale-while-revalidate (retorna dato viejo mientras refresca en background).
+    TTL cache thread-safe en RAM, acotado.
+    Política: stale-while-revalidate. Each entry has a soft TTL (fresh) and a
+    hard TTL (usable). `get_or_set` serves a stale value while ONE background
+    refresh per key runs; past the hard TTL callers wait for a single-flight
+    load. Failed refreshes back off (see singleflight.Revalidator).
+
+    Bounded by `max_entries` and `max_bytes` (approximate deep size): the
+    least recently used entries are evicted first, and a background sweeper
+    drops hard-expired entries every `sweep_interval` seconds. Hits, misses,
+    evictions and bytes are tracked per key prefix (`insumos:all` -> `insumos`),
+    at most MAX_METRIC_GROUPS groups.
     """
-    def __init__(self):
-        self._store: dict[str, tuple[Any, float]] = {}  # key → (value, expire_at)
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES, sweep_interval: int = SWEEP_INTERVAL_S):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._store: "OrderedDict[str, _Entry]" = OrderedDict()  # LRU order: oldest first
+        self._bytes = 0
+        self._generation: dict[str, int] = {}  # bumped on delete: refreshes started before it are dropped
+        self._epoch = 0  # bumped on delete_all
+        self._metrics: dict[str, dict] = {}
         self._lock = threading.Lock()
+        self._revalidator = Revalidator("mem_cache")
+        self._sweeper = None
 
-    def get(self, key: str) -> Optional[Any]:
+    # ── Bookkeeping (caller holds the lock) ────────────────────────────────
+    def _group(self, key: str) -> str:
+        group = _prefix(key)
+        if group in self._metrics or len(self._metrics) < MAX_METRIC_GROUPS:
+            return group
+        return OTHER_GROUP
+
+    def _count(self, key: str, metric: str, n: int = 1):
+        group = self._group(key)
+        m = self._metrics.get(group)
+        if m is None:
+            m = self._metrics[group] = _new_metrics()
+        m[metric] += n
+
+    def _remove(self, key: str, metric: str = None):
+        entry = self._store.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+            if metric:
+                self._count(key, metric)
+
+    def _evict_overflow(self):
+        while self._store and (len(self._store) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._store))
+            self._remove(oldest, "evictions")
+
+    def _ensure_sweeper(self):
+        if self._sweeper is None and self.sweep_interval > 0:
+            self._sweeper = threading.Thread(target=self._sweep_loop, daemon=True, name="mem_cache:sweeper")
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            self.sweep()
+
+    def sweep(self) -> int:
+        """Drops hard-expired entries; returns how many."""
+        now = time.time()
+        with self._lock:
+            expired = [k for k, e in self._store.items() if now > e.expire_at]
+            for k in expired:
+                self._remove(k, "expirations")
+        return len(expired)
+
+    # ── Reads ──────────────────────────────────────────────────────────────
+    def _entry(self, key: str):
         with self._lock:
             entry = self._store.get(key)
             if entry is None:
+                self._count(key, "misses")
                 return None
-            value, expire_at = entry
-            if time.time() > expire_at:
-                # Expirado: eliminar y devolver None
-                del self._store[key]
+            now = time.time()
+            if now > entry.expire_at:
+                # Expirado (TTL duro): eliminar
+                self._remove(key, "expirations")
+                self._count(key, "misses")
                 return None
-            return value
+            self._store.move_to_end(key)
+            self._count(key, "hits" if now <= entry.fresh_until else "stale_hits")
+            return entry
+
+    def get(self, key: str) -> Optional[Any]:
+        """Valor fresco (dentro del TTL blando) o None."""
+        entry = self._entry(key)
+        if entry is None or time.time() > entry.fresh_until:
+            return None
+        return entry.value
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        """Valor aunque esté vencido el TTL blando (hasta el TTL duro)."""
+        entry = self._entry(key)
+        return None if entry is None else entry.value
+
+    # ── Writes ─────────────────────────────────────────────────────────────
+    def _put(self, key: str, value: Any, ttl: int, stale_ttl: int, size: int):
+        now = time.time()
+        self._remove(key)
+        if size > self.max_bytes:
+            return  # Larger than the whole budget: not cached
+        self._store[key] = _Entry(value, now + ttl, now + ttl + stale_ttl, now, size)
+        self._bytes += size
+        self._evict_overflow()
 
-    def set(self, key: str, value: Any, ttl: int):
-        """ttl en segundos."""
+    def set(self, key: str, value: Any, ttl: int, stale_ttl: int = 0, size: int = None):
+        """
+        ttl en segundos (fresco); stale_ttl = segundos extra en que aún puede servirse vencido.
+        `size` overrides the approximate byte size (callers that already know it).
+        """
+        if size is None:
+            size = approx_size(value)  # outside the lock: can walk a large list
+        with self._lock:
+            self._put(key, value, ttl, stale_ttl, size)
+        self._ensure_sweeper()
+
+    def _generation_of(self, key: str):
+        return (self._epoch, self._generation.get(key, 0))
+
+    def _set_if_current(self, key: str, generation, value: Any, ttl: int, stale_ttl: int):
+        size = approx_size(value)
         with self._lock:
-            self._store[key] = (value, time.time() + ttl)
+            if self._generation_of(key) != generation:
+                return  # invalidated while loading: the value may predate the write
+            self._put(key, value, ttl, stale_ttl, size)
+        self._ensure_sweeper()
 
     def delete(self, key: str):
         with self._lock:
-            self._store.pop(key, None)
+            self._remove(key)
+            self._generation[key] = self._generation.get(key, 0) + 1
 
     def delete_prefix(self, prefix: str):
         """Invalida todas las claves que empiecen con prefix."""
         with self._lock:
             keys = [k for k in self._store if k.startswith(prefix)]
             for k in keys:
-                del self._store[k]
+                self._remove(k)
+            for k in set(keys) | {k for k in self._generation if k.startswith(prefix)}:
+                self._generation[k] = self._generation.get(k, 0) + 1
 
-    def get_or_set(self, key: str, loader: Callable, ttl: int) -> Any:
-        """
-        Patrón cache-aside:
-        1. Si hay valor fresco → devolverlo.
-        2. Si no → llamar loader(), cachear y devolver.
-        """
-        cached = self.get(key)
-        if cached is not None:
-            return cached
+    def delete_all(self):
+        """Invalida todo el caché (incluye cargas en curso)."""
+        with self._lock:
+            self._store.clear()
+            self._bytes = 0
+            self._generation.clear()
+            self._epoch += 1
+
+    # ── Cache-aside ────────────────────────────────────────────────────────
+    def _load(self, key: str, loader: Callable, ttl: int, stale_ttl: int):
+        with self._lock:
+            generation = self._generation_of(key)
         value = loader()
         if value is not None:
-            self.set(key, value, ttl)
+            self._set_if_current(key, generation, value, ttl, stale_ttl)
         return value
 
+    def get_or_set(self, key: str, loader: Callable, ttl: int, stale_ttl: int = None) -> Any:
+        """
+        Patrón cache-aside con stale-while-revalidate:
+        1. Si hay valor fresco → devolverlo.
+        2. Si está vencido pero dentro de stale_ttl → devolverlo y refrescar en background.
+        3. Si no → loader() single-flight (los concurrentes esperan la misma carga).
+        """
+        return self.get_or_set_meta(key, loader, ttl, stale_ttl)[0]
+
+    def get_or_set_meta(self, key: str, loader: Callable, ttl: int, stale_ttl: int = None):
+        """Como get_or_set, pero retorna (valor, metadatos de frescura)."""
+        stale_ttl = ttl * STALE_FACTOR if stale_ttl is None else stale_ttl
+        entry = self._entry(key)
+        if entry is not None:
+            if time.time() > entry.fresh_until:
+                self._revalidator.refresh(key, lambda: self._load(key, loader, ttl, stale_ttl))
+            return entry.value, freshness_meta(entry.stored_at, ttl, self._revalidator.refreshing(key))
+        value = self._revalidator.run(key, lambda: self._load(key, loader, ttl, stale_ttl))
+        return value, freshness_meta(time.time(), ttl)
+
+    def freshness(self, key: str) -> Optional[dict]:
+        entry = self._entry(key)
+        if entry is None:
+            return None
+        return freshness_meta(entry.stored_at, entry.fresh_until - entry.stored_at, self._revalidator.refreshing(key))
+
     def stats(self) -> dict:
         with self._lock:
             now = time.time()
             total = len(self._store)
-            valid = sum(1 for _, (_, exp) in self._store.items() if now <= exp)
-            return {"total_keys": total, "valid_keys": valid, "expired_keys": total - valid}
+            fresh = sum(1 for e in self._store.values() if now <= e.fresh_until)
+            valid = sum(1 for e in self._store.values() if now <= e.expire_at)
+            prefixes = {p: dict(m, keys=0, bytes=0) for p, m in self._metrics.items()}
+            for key, e in self._store.items():
+                m = prefixes.setdefault(self._group(key), dict(_new_metrics(), keys=0, bytes=0))
+                m["keys"] += 1
+                m["bytes"] += e.size
+            return {"total_keys": total, "valid_keys": valid, "fresh_keys": fresh,
+                    "stale_keys": valid - fresh, "expired_keys": total - valid,
+                    "bytes": self._bytes, "max_bytes": self.max_bytes, "max_entries": self.max_entries,
+                    "prefixes": prefixes}
 
 
 # Singleton global
@@ -75,3 +277,4 @@ TTL_ORDENES   = 30    # 30 s  — órdenes (cambian con cada acción)
 TTL_SNAPSHOT  = 15    # 15 s  — snapshot MRP (tiempo real)
 TTL_KPI       = 60    # 1 min — KPIs del dashboard
 TTL_BORRADORES = 120  # 2 min — borradores MRP
+TTL_AGGREGATE = 600  # 10 min — agregados de movimientos (la clave incluye checksums de particiones)
@@ -0,0 +1,108 @@
+"""
+movement_aggregate.py — Agregaciones de movimientos en el servidor.
+
+Vectorized group-by over the movement store: sums of quantity and value
+and counts of lines/documents, grouped by any of sku, company, warehouse,
+doc_type, day, week or month. Partitions are decoded column-wise into
+pandas (no per-row dicts) and results are cached in mem_cache under a key
+that includes the checksums of the partitions read, so a sync that rewrites
+a month invalidates the affected aggregates automatically.
+"""
+import hashlib
+import json
+
+import pandas as pd
+
+from app.services.mem_cache import mem_cache, TTL_AGGREGATE
+from app.services.movement_store import movement_store
+from app.services.sku_catalog import sku_catalog
+
+GROUP_KEYS = ("sku", "company", "warehouse", "doc_type", "day", "week", "month")
+_COLUMNS = ["date", "doc_type", "doc_number", "code", "warehouse", "quantity", "total", "company"]
+
+
+class AggregateError(ValueError):
+    pass
+
+
+def _frame(companies, start_date, end_date, doc_types):
+    frames = []
+    for c in companies:
+        df = movement_store.read_range_frame(c, start_date, end_date, doc_types, columns=_COLUMNS)
+        if len(df):
+            df["company"] = c
+            frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _add_group_columns(df, group_by):
+    if "sku" in group_by:
+        # One catalog lookup per distinct code, then broadcast
+        df["sku"] = sku_catalog.normalize_series(df["code"])
+    if "day" in group_by:
+        df["day"] = df["date"]
+    if "month" in group_by:
+        df["month"] = df["date"].str[:7]
+    if "week" in group_by:
+        # ISO week, labelled by its Monday
+        dates = pd.to_datetime(df["date"], errors="coerce")
+        df["week"] = (dates - pd.to_timedelta(dates.dt.weekday, unit="D")).dt.strftime("%Y-%m-%d")
+    df["warehouse"] = df["warehouse"].fillna("Sin Bodega")
+    return df
+
+
+def aggregate_movements(companies, start_date, end_date, group_by, doc_types=None):
+    """
+    Returns {"group_by", "start_date", "end_date", "count", "groups", "totals"};
+    each group carries its keys plus quantity, value, lines and documents.
+    """
+    group_by = list(dict.fromkeys(group_by or []))
+    unknown = [g for g in group_by if g not in GROUP_KEYS]
+    if not group_by or unknown:
+        raise AggregateError(f"group_by debe ser uno o más de: {', '.join(GROUP_KEYS)}")
+
+    companies = sorted(companies)
+    fingerprints = [movement_store.range_fingerprint(c, start_date, end_date) for c in companies]
+    query = json.dumps([companies, start_date, end_date, group_by, sorted(doc_types or []), fingerprints])
+    cache_key = "movagg:" + hashlib.sha1(query.encode("utf-8")).hexdigest()
+    cached = mem_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    df = _frame(companies, start_date, end_date, doc_types)
+    groups = []
+    totals = {"quantity": 0.0, "value": 0.0, "lines": 0, "documents": 0}
+    if len(df):
+        df = _add_group_columns(df, group_by)
+        df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce").fillna(0.0)
+        df["total"] = pd.to_numeric(df["total"], errors="coerce").fillna(0.0)
+        df["doc_key"] = df["company"] + "|" + df["doc_type"].fillna("") + "|" + df["doc_number"].fillna("")
+
+        agg = df.groupby(group_by, sort=True, dropna=False).agg(
+            quantity=("quantity", "sum"),
+            value=("total", "sum"),
+            lines=("quantity", "size"),
+            documents=("doc_key", "nunique"),
+        ).reset_index()
+        agg["quantity"] = agg["quantity"].round(4)
+        agg["value"] = agg["value"].round(2)
+        groups = agg.astype(object).where(agg.notna(), None).to_dict(orient="records")
+        totals = {
+            "quantity": round(float(df["quantity"].sum()), 4),
+            "value": round(float(df["total"].sum()), 2),
+            "lines": int(len(df)),
+            "documents": int(df["doc_key"].nunique()),
+        }
+
+    result = {
+        "group_by": group_by,
+        "start_date": start_date,
+        "end_date": end_date,
+        "count": len(groups),
+        "groups": groups,
+        "totals": totals,
+    }
+    mem_cache.set(cache_key, result, TTL_AGGREGATE)
+    return result
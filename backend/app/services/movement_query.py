@@ -0,0 +1,108 @@
+"""
+movement_query.py — Consultas paginadas sobre el almacén de movimientos.
+
+Server-side version of the filtering the frontend used to do on the full
+`/movements` payload:
+  - predicates (sku, warehouse, doc_type, client, seller, company) are
+    evaluated while partitions are read, before anything is serialized;
+    SKU filters first go through the store's secondary index, so months
+    without the SKU are never opened
+  - results are ordered by (date, doc_number, company, seq) and paginated
+    with an opaque cursor; partitions are read lazily, so a page stops
+    reading as soon as it is full
+  - `fields` projects the returned columns
+"""
+import base64
+import heapq
+import json
+
+from app.services.movement_store import movement_store, STRING_COLUMNS, FLOAT_COLUMNS
+from app.services.utils import normalize_sku
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+QUERY_FIELDS = STRING_COLUMNS + FLOAT_COLUMNS
+
+
+class QueryError(ValueError):
+    pass
+
+
+def encode_cursor(key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    try:
+        date, doc_number, company, seq = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return (str(date), str(doc_number), str(company), int(seq))
+    except Exception:
+        raise QueryError("Cursor inválido")
+
+
+def _contains_any(needles):
+    needles = [n.strip().lower() for n in needles or [] if n and n.strip()]
+    if not needles:
+        return None
+    return lambda value: any(n in str(value or "").lower() for n in needles)
+
+
+def build_predicate(skus=None, warehouses=None, clients=None, sellers=None):
+    """Row predicate: exact SKU (raw or normalized) + case-insensitive substring on the rest."""
+    checks = []
+    if skus:
+        wanted = {str(s).strip().upper() for s in skus} | {normalize_sku(s) for s in skus}
+        checks.append(lambda r: str(r.get("code") or "").strip().upper() in wanted or normalize_sku(r.get("code")) in wanted)
+    for column, needles in (("warehouse", warehouses), ("client", clients), ("seller", sellers)):
+        match = _contains_any(needles)
+        if match:
+            checks.append(lambda r, c=column, m=match: m(r.get(c)))
+    if not checks:
+        return None
+    return lambda row: all(check(row) for check in checks)
+
+
+def _keyed_rows(company, start_date, end_date, doc_types, where, skus=None):
+    """(sort_key, row) pairs of one company; seq disambiguates lines of the same document."""
+    prev, seq = None, 0
+    for row in movement_store.iter_range(company, start_date, end_date, doc_types, where, skus=skus):
+        doc_key = (row.get("date") or "", row.get("doc_number") or "", company)
+        seq = seq + 1 if doc_key == prev else 0
+        prev = doc_key
+        yield doc_key + (seq,), row
+
+
+def query_movements(companies, start_date, end_date, doc_types=None, skus=None, warehouses=None,
+                    clients=None, sellers=None, fields=None, limit=DEFAULT_LIMIT, cursor=None):
+    """
+    Returns {"count", "data", "next_cursor"} for one page of the merged,
+    filtered movements of `companies`. next_cursor is None on the last page.
+    """
+    if fields:
+        unknown = [f for f in fields if f not in QUERY_FIELDS]
+        if unknown:
+            raise QueryError(f"Campos desconocidos: {', '.join(unknown)}")
+    limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+
+    after = decode_cursor(cursor) if cursor else None
+    if after:
+        # Months before the cursor are never opened
+        start_date = max(start_date, after[0])
+
+    where = build_predicate(skus, warehouses, clients, sellers)
+    # The index narrows by normalized SKU; the predicate keeps the exact semantics
+    index_skus = {str(s).strip().upper() for s in skus} | {normalize_sku(s) for s in skus} if skus else None
+    streams = [_keyed_rows(c, start_date, end_date, doc_types, where, index_skus) for c in companies]
+
+    page = []
+    next_cursor = None
+    for key, row in heapq.merge(*streams, key=lambda kr: kr[0]):
+        if after and key <= after:
+            continue
+        if len(page) == limit:
+            next_cursor = encode_cursor(last_key)
+            break
+        page.append({f: row.get(f) for f in fields} if fields else row)
+        last_key = key
+
+    return {"count": len(page), "data": page, "next_cursor": next_cursor}
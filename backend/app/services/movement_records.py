@@ -0,0 +1,138 @@
+"""
+movement_records.py — Representación compacta de movimientos.
+
+A Siigo document with N items used to become N wide dicts repeating every
+document-level audit field. Here the document fields live once in a
+`MovementDoc` and each item is a slotted `MovementLine` pointing to it.
+Low-cardinality strings (company, warehouse, doc_type, seller, ...) are
+interned so 50k lines share a handful of string objects.
+
+Lines expose document fields as attributes too (`line.date`,
+`line.doc_type`, `line.company`), so consumers just use attribute access.
+The flat dict shape (API responses, the movement store) is produced only on
+output with `to_row()` / `rows_from_lines()`.
+"""
+import sys
+from dataclasses import dataclass
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@dataclass(slots=True, eq=False)
+class MovementDoc:
+    date: str = None
+    doc_type: str = None
+    doc_number: str = None
+    provider_doc: str = "N/A"
+    client: str = None
+    nit: str = None
+    type: str = None
+    observations: str = ""
+    affected_invoice: str = "N/A"
+    cost_center: str = "N/A"
+    seller: str = "N/A"
+    payment_forms: str = None
+    currency: str = "COP"
+    exchange_rate: float = 1.0
+    created_at: str = None
+    created_by: str = None
+    doc_total_value: float = 0
+    company: str = None
+
+    def __post_init__(self):
+        for name in _INTERNED_DOC_FIELDS:
+            setattr(self, name, _intern(getattr(self, name)))
+
+
+@dataclass(slots=True, eq=False)
+class MovementLine:
+    doc: MovementDoc
+    code: str = None
+    name: str = ""
+    warehouse: str = "Sin Bodega"
+    quantity: float = 0.0
+    price: float = 0.0
+    total: float = 0.0
+    taxes: str = "0%"
+
+    def __post_init__(self):
+        self.code = _intern(self.code)
+        self.warehouse = _intern(self.warehouse)
+        self.taxes = _intern(self.taxes)
+
+    def __getattr__(self, name):
+        # Only called for names that are not line slots: delegate document fields
+        if name in DOC_FIELDS:
+            return getattr(self.doc, name)
+        raise AttributeError(name)
+
+    def to_row(self) -> dict:
+        """Flat dict with the historical column order (joins the document fields)."""
+        d = self.doc
+        row = {
+            "date": d.date,
+            "doc_type": d.doc_type,
+            "doc_number": d.doc_number,
+            "provider_doc": d.provider_doc,
+            "client": d.client,
+            "nit": d.nit,
+            "code": self.code,
+            "name": self.name,
+            "warehouse": self.warehouse,
+            "quantity": self.quantity,
+            "price": self.price,
+            "total": self.total,
+            "type": d.type,
+            "observations": d.observations,
+            "affected_invoice": d.affected_invoice,
+            "cost_center": d.cost_center,
+            "seller": d.seller,
+            "payment_forms": d.payment_forms,
+            "taxes": self.taxes,
+            "currency": d.currency,
+            "exchange_rate": d.exchange_rate,
+            "created_at": d.created_at,
+            "created_by": d.created_by,
+            "doc_total_value": d.doc_total_value,
+        }
+        if d.company is not None:
+            row["company"] = d.company
+        return row
+
+
+DOC_FIELDS = frozenset(MovementDoc.__dataclass_fields__)
+LINE_FIELDS = tuple(f for f in MovementLine.__dataclass_fields__ if f != "doc")
+_INTERNED_DOC_FIELDS = (
+    "date", "doc_type", "type", "cost_center", "seller", "payment_forms",
+    "currency", "created_by", "company", "affected_invoice", "provider_doc",
+)
+
+
+def rows_from_lines(lines) -> list:
+    """Accepts MovementLine or already-flat dicts; returns flat dicts."""
+    return [line.to_row() if isinstance(line, MovementLine) else line for line in lines]
+
+
+def lines_from_rows(rows) -> list:
+    """
+    Compacts flat rows (e.g. read from the store) back into lines, sharing one
+    MovementDoc per (company, doc_type, doc_number, date).
+    """
+    docs = {}
+    lines = []
+    for row in rows:
+        key = (row.get("company"), row.get("doc_type"), row.get("doc_number"), row.get("date"))
+        doc = docs.get(key)
+        if doc is None:
+            doc = docs[key] = MovementDoc(**{f: row[f] for f in DOC_FIELDS if f in row})
+        lines.append(MovementLine(doc, **{f: row[f] for f in LINE_FIELDS if f in row}))
+    return lines
+
+
+def set_company(lines, company: str):
+    """Tags every document of `lines` with `company` (once per shared doc)."""
+    company = _intern(company)
+    for line in lines:
+        line.doc.company = company
@@ -0,0 +1,597 @@
+"""
+movement_store.py — Almacén de movimientos particionado por empresa y mes.
+
+Replaces the monolithic `history_{company}.json` blobs. Each company keeps:
+  - one columnar partition per month: `movements_{company}_{YYYY-MM}.parquet`
+  - a small manifest: `movements_{company}_manifest.json`, which doubles as the
+    coverage index (month -> rows, fetched_at, doc types covered and up to which
+    day, partition checksum)
+  - a secondary index per month: `movements_{company}_{YYYY-MM}_index.json`,
+    mapping normalized SKU, doc_number and client NIT to row positions
+
+A date-range read only opens the months it touches, and a sync only rewrites
+the months that changed. Lookups by SKU / document / NIT skip the months
+whose index has no match and only materialize the matching rows.
+Parquet requires pyarrow; without it partitions fall back to plain JSON
+(same layout, just bigger).
+"""
+import io
+import json
+import hashlib
+import heapq
+import logging
+import threading
+import calendar
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from app.services.cache import cache
+from app.services.movements import covered_doc_types
+from app.services.movement_records import rows_from_lines, lines_from_rows
+from app.services.sku_catalog import sku_catalog
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+MANIFEST_VERSION = 2
+INDEX_VERSION = 2  # 2: canonical SKUs from sku_catalog
+INDEX_FIELDS = ("sku", "doc_number", "nit")
+
+# Column layout of a movement row (see movements.extract_movements_from_doc)
+FLOAT_COLUMNS = ("quantity", "price", "total", "exchange_rate", "doc_total_value")
+STRING_COLUMNS = (
+    "date", "doc_type", "doc_number", "provider_doc", "client", "nit", "code", "name",
+    "warehouse", "type", "observations", "affected_invoice", "cost_center", "seller",
+    "payment_forms", "taxes", "currency", "created_at", "created_by", "company",
+)
+
+if pa is not None:
+    SCHEMA = pa.schema(
+        [(c, pa.string()) for c in STRING_COLUMNS] + [(c, pa.float64()) for c in FLOAT_COLUMNS]
+    )
+else:
+    SCHEMA = None
+SCHEMA_COLUMNS = STRING_COLUMNS + FLOAT_COLUMNS
+
+
+def _sort_key(row):
+    return (row.get("date") or "", row.get("doc_number") or "")
+
+
+def _month_keys(start_date: str, end_date: str):
+    """Yields every YYYY-MM between two YYYY-MM-DD dates (inclusive)."""
+    y, m = int(start_date[:4]), int(start_date[5:7])
+    ey, em = int(end_date[:4]), int(end_date[5:7])
+    while (y, m) <= (ey, em):
+        yield f"{y:04d}-{m:02d}"
+        m += 1
+        if m > 12:
+            y, m = y + 1, 1
+
+
+def _month_end(month: str) -> str:
+    y, m = int(month[:4]), int(month[5:7])
+    return f"{month}-{calendar.monthrange(y, m)[1]:02d}"
+
+
+def _day_before(date_str: str) -> str:
+    return (datetime.strptime(date_str, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def _day_after(date_str: str) -> str:
+    return (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def _today() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def _to_str(v):
+    if v is None:
+        return None
+    return v if isinstance(v, str) else str(v)
+
+
+def _build_index(rows: list, checksum: str) -> dict:
+    """{field: {value: [positions]}} over the (sorted) rows of one partition."""
+    index = {f: {} for f in INDEX_FIELDS}
+    for pos, row in enumerate(rows):
+        code = row.get("code")
+        if code:
+            index["sku"].setdefault(sku_catalog.normalize(code), []).append(pos)
+        for field in ("doc_number", "nit"):
+            value = row.get(field)
+            if value:
+                index[field].setdefault(str(value), []).append(pos)
+    return {"version": INDEX_VERSION, "checksum": checksum, **index}
+
+
+def _to_float(v):
+    try:
+        return float(v) if v is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _merge_entry(ours: dict, theirs: dict) -> dict:
+    """
+    Manifest entry of a month written by two instances. The partition with
+    the higher GCS generation was written on top of the other one (partition
+    compare-and-swap), so its file fields win; coverage is a per-type prefix
+    of the month and both writers' rows are in that partition, so the longer
+    prefix of each type holds.
+    """
+    newer, older = ours, theirs
+    ours_gen, theirs_gen = ours.get("generation"), theirs.get("generation")
+    if ours_gen is not None and theirs_gen is not None and theirs_gen > ours_gen:
+        newer, older = theirs, ours
+    merged = dict(newer)
+    coverage = dict(older.get("coverage") or {})
+    for t, end in (newer.get("coverage") or {}).items():
+        if not coverage.get(t) or end > coverage[t]:
+            coverage[t] = end
+    merged["coverage"] = coverage
+    return merged
+
+
+class MovementStore:
+    def __init__(self, cache_service):
+        self.cache = cache_service
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    # ── Keys ───────────────────────────────────────────────────────────────
+    def _manifest_key(self, company: str) -> str:
+        return f"movements_{company}_manifest.json"
+
+    def _partition_key(self, company: str, month: str) -> str:
+        ext = "parquet" if pa is not None else "json"
+        return f"movements_{company}_{month}.{ext}"
+
+    def _index_key(self, company: str, month: str) -> str:
+        return f"movements_{company}_{month}_index.json"
+
+    def _company_lock(self, company: str) -> threading.RLock:
+        with self._locks_guard:
+            lock = self._locks.get(company)
+            if lock is None:
+                lock = self._locks[company] = threading.RLock()
+            return lock
+
+    # ── Encoding ───────────────────────────────────────────────────────────
+    def _encode(self, rows: list, key: str) -> bytes:
+        if key.endswith(".parquet"):
+            columns = {c: [_to_str(r.get(c)) for r in rows] for c in STRING_COLUMNS}
+            columns.update({c: [_to_float(r.get(c)) for r in rows] for c in FLOAT_COLUMNS})
+            table = pa.Table.from_pydict(columns, schema=SCHEMA)
+            buf = io.BytesIO()
+            pq.write_table(table, buf, compression="zstd")
+            return buf.getvalue()
+        return json.dumps(rows).encode("utf-8")
+
+    def _decode(self, data: bytes, key: str) -> list:
+        if key.endswith(".parquet"):
+            if pq is None:
+                raise RuntimeError(f"pyarrow no está instalado, no se puede leer {key}")
+            return pq.read_table(io.BytesIO(data)).to_pylist()
+        return json.loads(data.decode("utf-8"))
+
+    # ── Manifest ───────────────────────────────────────────────────────────
+    def load_manifest(self, company: str, mutable: bool = False) -> dict:
+        # Expired local copy is refreshed from the cloud when possible, but a stale
+        # manifest is still better than treating the whole history as missing.
+        # The loaded dict is shared (cache L1): writers ask for a mutable copy.
+        key = self._manifest_key(company)
+        load = self.cache.load_mutable if mutable else self.cache.load
+        manifest = load(key) or load(key, ttl=None)
+        if manifest and manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+        if manifest:
+            return self._upgrade_manifest(company, manifest)
+        migrated = self._migrate_legacy(company)
+        if migrated:
+            return migrated
+        return self._empty_manifest(company)
+
+    def _empty_manifest(self, company: str) -> dict:
+        return {"version": MANIFEST_VERSION, "company": company, "months": {}}
+
+    def _save_manifest(self, company: str, manifest: dict):
+        manifest["updated_at"] = datetime.now().isoformat()
+        self.cache.save(self._manifest_key(company), manifest)
+
+    def _merge_manifest(self, company: str, manifest: dict, months: list):
+        """
+        Stores the entries of `months` on top of the latest stored manifest
+        (cache.update): another instance may have written other months since
+        this one loaded it, and those entries must survive.
+        """
+        entries = {m: manifest["months"][m] for m in months}
+
+        def apply(latest):
+            if latest.get("version") != MANIFEST_VERSION:
+                latest = manifest
+            for month, ours in entries.items():
+                theirs = latest["months"].get(month)
+                latest["months"][month] = _merge_entry(ours, theirs) if theirs else ours
+            latest["updated_at"] = datetime.now().isoformat()
+            return latest
+
+        self.cache.update(self._manifest_key(company), apply, default=manifest)
+
+    def _migrate_legacy(self, company: str):
+        """One-time split of the old `history_{company}.json` blob into months."""
+        legacy = self.cache.load(f"history_{company}.json", ttl=None)
+        if not legacy:
+            return None
+        by_month = {}
+        for row in legacy:
+            d = row.get("date")
+            if d:
+                by_month.setdefault(d[:7], []).append(row)
+        print(f"[{company}] Migrando historial legado: {len(legacy)} filas en {len(by_month)} meses")
+        with self._company_lock(company):
+            manifest = self._empty_manifest(company)
+            for month, rows in by_month.items():
+                entry = self._write_partition(company, month, rows, manifest)
+                self._infer_coverage(entry, month, rows)
+            self._save_manifest(company, manifest)
+        return manifest
+
+    def _upgrade_manifest(self, company: str, old: dict) -> dict:
+        """Older manifests carry no coverage: infer it from the stored rows once."""
+        with self._company_lock(company):
+            manifest = self._empty_manifest(company)
+            for month, old_entry in old.get("months", {}).items():
+                rows = self.read_month(company, month, old)
+                entry = self._write_partition(company, month, rows, manifest)
+                self._infer_coverage(entry, month, rows)
+            self._save_manifest(company, manifest)
+        return manifest
+
+    def _infer_coverage(self, entry: dict, month: str, rows: list):
+        # Legacy data only tells us which doc types showed up. Past months are
+        # assumed complete for those types; the current month only up to its last row.
+        last = _month_end(month)
+        covered_until = last if last < _today() else entry.get("max_date")
+        if covered_until:
+            entry["coverage"] = {t: covered_until for t in {r.get("doc_type") for r in rows} if t}
+
+    # ── Partitions ─────────────────────────────────────────────────────────
+    def read_month(self, company: str, month: str, manifest: dict = None) -> list:
+        manifest = manifest or self.load_manifest(company)
+        entry = manifest["months"].get(month)
+        if not entry or not entry.get("rows"):
+            return []
+        key = entry.get("file") or self._partition_key(company, month)
+        data = self.cache.load_bytes(key) or self.cache.load_bytes(key, ttl=None)
+        if data is None:
+            logging.warning(f"Partition missing for {company} {month} ({key})")
+            return []
+        return self._decode(data, key)
+
+    def read_month_frame(self, company: str, month: str, manifest: dict = None, columns=None) -> pd.DataFrame:
+        """One month as a DataFrame, decoded column-wise (no per-row dicts)."""
+        manifest = manifest or self.load_manifest(company)
+        entry = manifest["months"].get(month)
+        if not entry or not entry.get("rows"):
+            return pd.DataFrame(columns=list(columns or SCHEMA_COLUMNS))
+        key = entry.get("file") or self._partition_key(company, month)
+        data = self.cache.load_bytes(key) or self.cache.load_bytes(key, ttl=None)
+        if data is None:
+            logging.warning(f"Partition missing for {company} {month} ({key})")
+            return pd.DataFrame(columns=list(columns or SCHEMA_COLUMNS))
+        if key.endswith(".parquet"):
+            if pq is None:
+                raise RuntimeError(f"pyarrow no está instalado, no se puede leer {key}")
+            return pq.read_table(io.BytesIO(data), columns=list(columns) if columns else None).to_pandas()
+        return pd.DataFrame(self._decode(data, key), columns=list(columns or SCHEMA_COLUMNS))
+
+    def read_range_frame(self, company: str, start_date: str, end_date: str, doc_types=None, columns=None) -> pd.DataFrame:
+        """Vectorized read_range: rows in [start_date, end_date] as one DataFrame."""
+        columns = list(columns or SCHEMA_COLUMNS)
+        needed = list(dict.fromkeys(columns + ["date", "doc_type"]))
+        manifest = self.load_manifest(company)
+        frames = [
+            self.read_month_frame(company, month, manifest, needed)
+            for month in _month_keys(start_date, end_date) if month in manifest["months"]
+        ]
+        frames = [f for f in frames if len(f)]
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        df = pd.concat(frames, ignore_index=True)
+        mask = (df["date"] >= start_date) & (df["date"] <= end_date)
+        if doc_types:
+            mask &= df["doc_type"].isin(list(doc_types))
+        return df.loc[mask, columns].reset_index(drop=True)
+
+    def range_fingerprint(self, company: str, start_date: str, end_date: str) -> str:
+        """Changes whenever any partition overlapping the range is rewritten."""
+        manifest = self.load_manifest(company)
+        parts = [
+            f"{m}:{manifest['months'][m].get('checksum')}"
+            for m in _month_keys(start_date, end_date) if m in manifest["months"]
+        ]
+        return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+    def _write_partition(self, company: str, month: str, rows: list, manifest: dict, presorted: bool = False) -> dict:
+        """Writes one month (rows must belong to it). Caller holds the company lock."""
+        entry = manifest["months"].setdefault(month, {"coverage": {}})
+        if rows:
+            if not presorted:
+                rows.sort(key=_sort_key)
+            key = self._partition_key(company, month)
+            data = self._encode(rows, key)
+            self.cache.save_bytes(key, data)
+            entry.update({
+                "file": key,
+                "rows": len(rows),
+                "min_date": rows[0].get("date"),
+                "max_date": rows[-1].get("date"),
+                "checksum": hashlib.sha1(data).hexdigest(),
+            })
+            entry["index"] = self._save_index(company, month, rows, entry["checksum"])
+        else:
+            # Fetched but empty: keep the entry so its coverage is remembered
+            entry.update({"file": None, "rows": 0, "min_date": None, "max_date": None, "checksum": None, "index": None})
+        return entry
+
+    # ── Secondary index ────────────────────────────────────────────────────
+    def _save_index(self, company: str, month: str, rows: list, checksum: str) -> str:
+        key = self._index_key(company, month)
+        self.cache.save(key, _build_index(rows, checksum))
+        return key
+
+    def load_index(self, company: str, month: str, manifest: dict = None):
+        """
+        Index of one month, or None when the month has no rows. Rebuilt from
+        the partition when missing or written for another checksum.
+        """
+        manifest = manifest or self.load_manifest(company)
+        entry = manifest["months"].get(month)
+        if not entry or not entry.get("rows"):
+            return None
+        key = entry.get("index") or self._index_key(company, month)
+        index = self.cache.load(key, ttl=None)
+        if index and index.get("version") == INDEX_VERSION and index.get("checksum") == entry.get("checksum"):
+            return index
+        with self._company_lock(company):
+            rows = self.read_month(company, month, manifest)
+            index = _build_index(rows, entry.get("checksum"))
+            self.cache.save(key, index)
+        return index
+
+    def positions(self, company: str, month: str, manifest: dict = None, skus=None, doc_numbers=None, nits=None) -> list:
+        """
+        Sorted row positions of the month matching ANY of the values of each
+        given field (and ALL the given fields). SKUs are matched normalized
+        (a requested value that already is a normalized code matches as is).
+        """
+        index = self.load_index(company, month, manifest)
+        if index is None:
+            return []
+        selected = None
+        for field, values in (
+            ("sku", set(sku_catalog.normalize_many(skus)) | {str(s).strip().upper() for s in skus} if skus else None),
+            ("doc_number", doc_numbers),
+            ("nit", nits),
+        ):
+            if not values:
+                continue
+            found = set()
+            for v in values:
+                found.update(index[field].get(str(v), ()))
+            selected = found if selected is None else selected & found
+            if not selected:
+                return []
+        return sorted(selected or ())
+
+    def read_positions(self, company: str, month: str, positions: list, manifest: dict = None) -> list:
+        """Only the rows at `positions` of one month (Parquet decodes just those)."""
+        if not positions:
+            return []
+        manifest = manifest or self.load_manifest(company)
+        entry = manifest["months"].get(month)
+        if not entry or not entry.get("rows"):
+            return []
+        key = entry.get("file") or self._partition_key(company, month)
+        data = self.cache.load_bytes(key) or self.cache.load_bytes(key, ttl=None)
+        if data is None:
+            logging.warning(f"Partition missing for {company} {month} ({key})")
+            return []
+        if key.endswith(".parquet"):
+            if pq is None:
+                raise RuntimeError(f"pyarrow no está instalado, no se puede leer {key}")
+            return pq.read_table(io.BytesIO(data)).take(positions).to_pylist()
+        rows = self._decode(data, key)
+        return [rows[p] for p in positions if p < len(rows)]
+
+    def lookup(self, company: str, skus=None, doc_numbers=None, nits=None, start_date: str = None, end_date: str = None, doc_types=None) -> list:
+        """
+        Rows matching the given SKUs / doc_numbers / NITs across the whole
+        stored history (or [start_date, end_date]), ordered by date.
+        """
+        months = sorted(self.load_manifest(company)["months"])
+        if not months:
+            return []
+        start_date = start_date or f"{months[0]}-01"
+        end_date = end_date or _month_end(months[-1])
+        return list(self.iter_range(company, start_date, end_date, doc_types,
+                                    skus=skus, doc_numbers=doc_numbers, nits=nits))
+
+    def read_range(self, company: str, start_date: str, end_date: str, doc_types=None, compact: bool = False) -> list:
+        """
+        Rows of `company` with start_date <= date <= end_date, ordered by date.
+        compact=True returns MovementLine records instead of flat dicts.
+        """
+        result = list(self.iter_range(company, start_date, end_date, doc_types))
+        return lines_from_rows(result) if compact else result
+
+    def iter_range(self, company: str, start_date: str, end_date: str, doc_types=None, where=None,
+                   skus=None, doc_numbers=None, nits=None):
+        """
+        Lazy version of read_range: partitions are opened one month at a time,
+        so a consumer that stops early never reads the later months.
+        `where(row) -> bool` is an extra predicate applied before yielding.
+        `skus` / `doc_numbers` / `nits` go through the secondary index: months
+        without a match are never opened.
+        """
+        indexed = bool(skus or doc_numbers or nits)
+        manifest = self.load_manifest(company)
+        for month in _month_keys(start_date, end_date):
+            if month not in manifest["months"]:
+                continue
+            if indexed:
+                found = self.positions(company, month, manifest, skus, doc_numbers, nits)
+                rows = self.read_positions(company, month, found, manifest)
+            else:
+                rows = self.read_month(company, month, manifest)
+            for row in rows:
+                d = row.get("date") or ""
+                if not (start_date <= d <= end_date):
+                    continue
+                if doc_types and row.get("doc_type") not in doc_types:
+                    continue
+                if where is not None and not where(row):
+                    continue
+                yield row
+
+    def replace_range(self, company: str, start_date: str, end_date: str, rows: list, doc_types=None) -> list:
+        """
+        Replaces the stored rows in [start_date, end_date] whose doc type was part
+        of the fetch (`doc_types`, None = all) with `rows` (flat dicts or
+        MovementLine records), and records the range (up to yesterday) as covered
+        for those types. Only overlapping months are rewritten. Returns the touched months.
+        """
+        types = covered_doc_types(doc_types)
+        incoming = {}
+        for row in rows_from_lines(rows):
+            d = row.get("date")
+            if d and start_date <= d <= end_date:
+                incoming.setdefault(d[:7], []).append(row)
+
+        touched = []
+        with self._company_lock(company):
+            manifest = self.load_manifest(company, mutable=True)
+            for month in _month_keys(start_date, end_date):
+                # Partitions are stored sorted, so only the new chunk needs sorting and
+                # the merge is linear instead of re-sorting the whole month.
+                new_rows = sorted(incoming.get(month, []), key=_sort_key)
+                entry = self._replace_partition(company, month, new_rows, start_date, end_date, types, manifest)
+                self._mark_covered(entry, month, start_date, end_date, types)
+                touched.append(month)
+            if touched:
+                self._merge_manifest(company, manifest, touched)
+        return touched
+
+    def _replace_partition(self, company: str, month: str, new_rows: list, start_date: str, end_date: str,
+                           types, manifest: dict) -> dict:
+        """
+        Rewrites one month as (stored rows outside the replaced range/types) +
+        `new_rows`, as a compare-and-swap on the partition (cache.update_bytes):
+        when another instance wrote the month meanwhile, the replacement is
+        re-applied on top of its rows instead of overwriting them.
+        """
+        key = self._partition_key(company, month)
+        entry = manifest["months"].setdefault(month, {"coverage": {}})
+        merged = []
+
+        def apply(current):
+            if current is not None:
+                existing = self._decode(current, key)
+            elif entry.get("file") and entry["file"] != key:
+                existing = self.read_month(company, month, manifest)  # older encoding
+            else:
+                existing = []
+            kept = [
+                x for x in existing
+                if not (start_date <= (x.get("date") or "") <= end_date and x.get("doc_type") in types)
+            ]
+            merged[:] = heapq.merge(kept, new_rows, key=_sort_key)
+            if not merged and current is None:
+                return None  # nothing stored, nothing to store
+            return self._encode(merged, key)
+
+        data = self.cache.update_bytes(key, apply)
+        if merged:
+            entry.update({
+                "file": key,
+                "rows": len(merged),
+                "min_date": merged[0].get("date"),
+                "max_date": merged[-1].get("date"),
+                "checksum": hashlib.sha1(data).hexdigest(),
+                "generation": self.cache.generation(key),
+            })
+            entry["index"] = self._save_index(company, month, merged, entry["checksum"])
+        else:
+            # Fetched but empty: keep the entry so its coverage is remembered
+            entry.update({"file": None, "rows": 0, "min_date": None, "max_date": None, "checksum": None,
+                          "index": None, "generation": self.cache.generation(key)})
+        return entry
+
+    def _mark_covered(self, entry: dict, month: str, start_date: str, end_date: str, types):
+        month_first = f"{month}-01"
+        # Today is never marked covered: documents issued later in the day must still be fetched
+        span_end = min(end_date, _month_end(month), _day_before(_today()))
+        coverage = entry.setdefault("coverage", {})
+        for t in types:
+            prev = coverage.get(t)
+            # Coverage is a prefix of the month: only extend it when the fetch is contiguous
+            contiguous = start_date <= month_first or (prev and prev >= _day_before(start_date))
+            if contiguous and span_end >= month_first and (not prev or span_end > prev):
+                coverage[t] = span_end
+        entry["fetched_at"] = datetime.now().isoformat()
+
+    # ── Coverage ───────────────────────────────────────────────────────────
+    def plan_gaps(self, company: str, start_date: str, end_date: str, doc_types=None, manifest: dict = None) -> list:
+        """
+        Date ranges that must be fetched so [start_date, end_date] is complete
+        for `doc_types`. Answered from the manifest coverage alone. Gaps start
+        where the stored coverage ends and run to the end of the month (or today),
+        and contiguous months are merged into one range.
+        """
+        manifest = manifest or self.load_manifest(company)
+        types = covered_doc_types(doc_types)
+        today = _today()
+        end_cap = min(end_date, today)
+        if start_date > end_cap:
+            return []
+
+        ranges = []
+        for month in _month_keys(start_date, end_cap):
+            month_last = _month_end(month)
+            need_until = min(end_cap, month_last)
+            coverage = manifest["months"].get(month, {}).get("coverage", {})
+            covered = [coverage.get(t) for t in types]
+            need_from = _day_after(min(covered)) if all(covered) else f"{month}-01"
+            if need_from > need_until:
+                continue
+            gap_end = min(month_last, today)
+            if ranges and ranges[-1][1] == _day_before(need_from):
+                ranges[-1] = (ranges[-1][0], gap_end)
+            else:
+                ranges.append((need_from, gap_end))
+        return ranges
+
+    def summary(self, company: str) -> dict:
+        """Min/max date, row count and freshness, answered from the manifest only."""
+        months = self.load_manifest(company)["months"].values()
+        with_rows = [m for m in months if m.get("rows")]
+        fetched = [m["fetched_at"] for m in months if m.get("fetched_at")]
+        if not with_rows:
+            return {"min_date": None, "max_date": None, "count": 0, "months": 0, "last_fetched_at": max(fetched, default=None)}
+        return {
+            "min_date": min(m["min_date"] for m in with_rows),
+            "max_date": max(m["max_date"] for m in with_rows),
+            "count": sum(m["rows"] for m in with_rows),
+            "months": len(with_rows),
+            "last_fetched_at": max(fetched, default=None),
+        }
+
+
+movement_store = MovementStore(cache)
@@ -0,0 +1,168 @@
+"""
+movement_sync.py — Motor de sincronización incremental de movimientos.
+
+Single implementation of the gap-fill flow shared by `/movements`,
+`/movements/stream` and `/movements/sync`:
+  1. plan the ranges to fetch (coverage manifest, or yearly chunks on force refresh)
+  2. fetch the gaps of one company concurrently
+  3. merge each chunk into its month partitions and checkpoint immediately
+  4. read back the requested range
+
+Progress is reported as structured events (dicts) through `progress_callback`.
+"""
+import asyncio
+
+from app.services.auth import get_auth_token
+from app.services.siigo_async import fetch_consolidated_movements, run_sync, siigo_client, MovementFetchError
+from app.services.movement_store import movement_store
+from app.services.movement_records import set_company
+from app.services.movements import covered_doc_types
+from app.services.sales_rollup import sales_rollup, SALES_DOC_TYPES
+from app.services.siigo_scheduler import INTERACTIVE
+
+# Gaps of the same company fetched concurrently. Each gap already fans out
+# per doc type; the request rate itself is paced by siigo_scheduler.
+MAX_GAP_WORKERS = 2
+
+
+def force_refresh_ranges(start_date: str, end_date: str) -> list:
+    """Yearly chunks covering [start_date, end_date]."""
+    ranges = []
+    try:
+        for y in range(int(start_date[:4]), int(end_date[:4]) + 1):
+            chunk_start = max(f"{y}-01-01", start_date)
+            chunk_end = min(f"{y}-12-31", end_date)
+            ranges.append((chunk_start, chunk_end))
+    except ValueError:
+        ranges.append((start_date, end_date))
+    return ranges
+
+
+def _emit(progress_callback, company_name, stage, message, **extra):
+    if progress_callback:
+        event = {"company": company_name, "stage": stage, "message": message}
+        event.update(extra)
+        progress_callback(event)
+
+
+def sync_company(company, start_date, end_date, doc_types=None, force_refresh=False,
+                 progress_callback=None, read_result=True, priority=INTERACTIVE):
+    """Sync wrapper over sync_company_async; returns (rows, error)."""
+    return run_sync(sync_company_async(company, start_date, end_date, doc_types, force_refresh,
+                                       progress_callback, read_result, priority))
+
+
+async def sync_companies_async(companies, start_date, end_date, doc_types=None, force_refresh=False,
+                               progress_callback=None, read_result=True, priority=INTERACTIVE):
+    """Runs sync_company_async for every company on one shared client; returns [(rows, error), ...]."""
+    async with siigo_client() as client:
+        return await asyncio.gather(*(
+            sync_company_async(c, start_date, end_date, doc_types, force_refresh,
+                               progress_callback, read_result, priority, client=client)
+            for c in companies
+        ))
+
+
+async def sync_company_async(company, start_date, end_date, doc_types=None, force_refresh=False,
+                             progress_callback=None, read_result=True, priority=INTERACTIVE, client=None):
+    """
+    Brings the store of `company` up to date for [start_date, end_date] and
+    returns (rows, error). `rows` is the stored range filtered by `doc_types`
+    (empty when read_result=False). On auth failure the cached rows are still
+    returned along with the error. `priority` is the siigo_scheduler class
+    used for every Siigo call of this sync.
+
+    Store I/O runs in worker threads so the event loop keeps serving requests.
+
+    Events (`stage`): planning, gap_start, gap_saved, gap_empty, gap_error, reading, done, error.
+    """
+    c_name = company.get("name")
+    if not company.get("valid", True):
+        _emit(progress_callback, c_name, "error", "Config Inválida")
+        return [], f"Config Incompleta: {c_name}"
+
+    try:
+        # 1. Plan
+        if force_refresh:
+            _emit(progress_callback, c_name, "planning", "Calculando rangos forzados...")
+            fetch_ranges = force_refresh_ranges(start_date, end_date)
+        else:
+            _emit(progress_callback, c_name, "planning", "Analizando caché...")
+            fetch_ranges = await asyncio.to_thread(movement_store.plan_gaps, c_name, start_date, end_date, doc_types)
+        fetch_ranges = [(s, e) for s, e in fetch_ranges if s <= e]
+
+        if not fetch_ranges:
+            print(f"[{c_name}] Cache Complete. No holes found in range.")
+
+        # 2. Fetch + checkpoint every gap as soon as it arrives
+        error = None
+        auth_token = None
+        gap_errors = []
+        if fetch_ranges:
+            auth_token = await asyncio.to_thread(get_auth_token, company.get("username"), company.get("access_key"))
+            if not auth_token:
+                # Still serve whatever is already cached for the range
+                error = f"Auth Fallida: {c_name}"
+                fetch_ranges = []
+
+        if fetch_ranges:
+            total = len(fetch_ranges)
+            sem = asyncio.Semaphore(MAX_GAP_WORKERS)
+
+            async def fetch_gap(idx, r_start, r_end):
+                async with sem:
+                    _emit(progress_callback, c_name, "gap_start",
+                          f"Descargando {idx + 1}/{total} ({r_start} a {r_end})...",
+                          gap=[r_start, r_end], index=idx + 1, total=total)
+                    try:
+                        gap_data = await fetch_consolidated_movements(auth_token, r_start, r_end, selected_types=doc_types,
+                                                                      priority=priority, client=client, strict=True)
+                        gap_types = doc_types
+                        failed = False
+                    except MovementFetchError as e:
+                        # Only the doc types that arrived are stored / marked covered; the rest stays a gap
+                        print(f"[{c_name}] Gap {r_start}-{r_end} incomplete: {e}")
+                        gap_errors.append(f"{r_start} a {r_end}: {e}")
+                        _emit(progress_callback, c_name, "gap_error", f"Error {r_start} a {r_end}: {e}",
+                              gap=[r_start, r_end], index=idx + 1, total=total)
+                        if not e.fetched:
+                            return 0
+                        gap_data, gap_types = e.movements, e.fetched
+                        failed = True
+                if not gap_data and not failed:
+                    print(f"[{c_name}] Gap {r_start}-{r_end} was empty on Server.")
+                    _emit(progress_callback, c_name, "gap_empty", f"Sin datos {r_start} a {r_end}",
+                          gap=[r_start, r_end], index=idx + 1, total=total)
+                set_company(gap_data, c_name)
+                # Checkpoint: if 2020-2023 work but 2024 times out, the first years stay persisted.
+                # Empty gaps are stored too, so their coverage is recorded and they are not fetched again.
+                months = await asyncio.to_thread(movement_store.replace_range, c_name, r_start, r_end, gap_data, gap_types)
+                if covered_doc_types(gap_types) & set(SALES_DOC_TYPES):
+                    # Keep the daily sales rollup in step (only the days of this gap)
+                    await asyncio.to_thread(sales_rollup.update_range, c_name, r_start, r_end)
+                if not gap_data:
+                    return 0
+                print(f"[{c_name}] Checkpoint saved for {r_start}-{r_end}")
+                _emit(progress_callback, c_name, "gap_saved", f"Guardado {r_start} a {r_end}",
+                      gap=[r_start, r_end], index=idx + 1, total=total, rows=len(gap_data), months=months)
+                return len(gap_data)
+
+            await asyncio.gather(*(fetch_gap(i, s, e) for i, (s, e) in enumerate(fetch_ranges)))
+            if gap_errors:
+                error = f"Descarga incompleta {c_name}: " + "; ".join(gap_errors)
+
+        # 3. Read back only the months the user asked for
+        rows = []
+        if read_result:
+            _emit(progress_callback, c_name, "reading", "Aplicando filtros de fecha...")
+            rows = await asyncio.to_thread(movement_store.read_range, c_name, start_date, end_date, doc_types)
+        if error:
+            _emit(progress_callback, c_name, "error", "Auth Fallida" if not auth_token else "Descarga incompleta")
+        else:
+            _emit(progress_callback, c_name, "done", f"¡Listo! ({len(rows)} regs)", rows=len(rows))
+        return rows, error
+
+    except Exception as e:
+        print(f"Error {c_name}: {e}")
+        _emit(progress_callback, c_name, "error", "Error")
+        return [], f"Error {c_name}: {str(e)}"
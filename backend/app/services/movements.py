@@ -3,6 +3,11 @@ import time
 from datetime import datetime
 import logging
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
+from app.services.siigo_scheduler import siigo_scheduler, credential_key, INTERACTIVE
+from app.services.auth import invalidate_token
+from app.services import http_client
+from app.services.siigo_async import run_sync, fetch_all_documents, fetch_consolidated_movements
+from app.services.movement_records import MovementDoc, MovementLine
 
 BASE_URL = "https://api.siigo.com/v1"
 
@@ -16,12 +21,43 @@ def should_retry(e):
     wait=wait_exponential(multiplier=0.5, min=0.5, max=30),
     stop=stop_after_attempt(5)
 )
-def _do_get_documents(url, headers, params):
-    response = requests.get(url, headers=headers, params=params, timeout=30)
+def _do_get_documents(url, headers, params, priority=INTERACTIVE):
+    with siigo_scheduler.slot(credential_key(headers["Authorization"]), priority) as ticket:
+        response = http_client.get(url, headers=headers, params=params, timeout=30)
+        ticket.observe(response)
+    if response.status_code == 401:
+        invalidate_token(headers["Authorization"])
     response.raise_for_status()
     return response.json()
 
-def get_documents(token, endpoint, start_date, end_date, page=1, page_size=50, date_param_name="date_start"):
+# Friendly document codes produced by each Siigo endpoint
+# (journals yield both regular CC vouchers and NE assembly notes)
+ENDPOINT_DOC_TYPES = {
+    "invoices": ("FV",),
+    "credit-notes": ("NC",),
+    "debit-notes": ("ND",),
+    "purchases": ("FC",),
+    "journals": ("CC", "NE"),
+    "delivery-notes": ("RM",),
+}
+ALL_DOC_TYPES = tuple(t for types in ENDPOINT_DOC_TYPES.values() for t in types)
+
+def covered_doc_types(selected_types=None):
+    """
+    Returns the set of friendly doc codes a fetch with `selected_types` brings back.
+    Mirrors the endpoint selection done in select_doc_endpoints.
+    """
+    if not selected_types:
+        return set(ALL_DOC_TYPES)
+    covered = set()
+    for endpoint, codes in ENDPOINT_DOC_TYPES.items():
+        if endpoint in selected_types or any(c in selected_types for c in codes):
+            covered.update(codes)
+        elif endpoint == "journals" and "ENSAMBLE" in selected_types:
+            covered.update(codes)
+    return covered
+
+def get_documents(token, endpoint, start_date, end_date, page=1, page_size=50, date_param_name="date_start", priority=INTERACTIVE):
     """
     Generic function to fetch documents (invoices, credit-notes, etc.)
     """
@@ -44,101 +80,23 @@ def get_documents(token, endpoint, start_date, end_date, page=1, page_size=50, d
     
     try:
         logging.info(f"Fetching {endpoint} page {page}. Params: {params}")
-        data = _do_get_documents(url, headers, params)
+        data = _do_get_documents(url, headers, params, priority)
         logging.info(f"Page {page} {endpoint}: Got {len(data.get('results', []))} results. Total: {data.get('pagination', {}).get('total_results')}")
         return data
     except Exception as e:
         print(f"Error fetching {endpoint} page {page}: {e}")
         return None
 
-def get_all_documents(token, endpoint, start_date, end_date, progress_callback=None):
+def get_all_documents(token, endpoint, start_date, end_date, progress_callback=None, priority=INTERACTIVE):
     """
-    Fetch all pages of documents - OPTIMIZED PARALLEL VERSION
+    Fetch all pages of documents (sync wrapper over siigo_async.fetch_all_documents).
     """
-    import math
-    import concurrent.futures
-
-    all_docs = []
-    
-    # Determine date param
-    date_param = "created_start" if endpoint == "journals" else "date_start"
-    
-    # 1. Fetch First Page to metadata
-    PAGE_SIZE = 100 # Maximize page size to reduce requests
-    first_page_data = get_documents(token, endpoint, start_date, end_date, page=1, page_size=PAGE_SIZE, date_param_name=date_param)
-    
-    if not first_page_data or "results" not in first_page_data:
-        return []
-
-    results = first_page_data["results"]
-    all_docs.extend(results)
-    
-    pagination = first_page_data.get("pagination", {})
-    total_results = pagination.get("total_results", 0)
-    
-    if total_results == 0:
-        return []
-        
-    total_pages = math.ceil(total_results / PAGE_SIZE)
-    # print(f"DEBUG: {endpoint} has {total_results} results across {total_pages} pages.")
-
-    if total_pages > 1:
-        # Define worker for subsequent pages
-        def fetch_page(p_num):
-            if progress_callback and p_num % 5 == 0: # Throttle UI updates
-                progress_callback(f"{endpoint}: Pag {p_num}/{total_pages}...")
-            
-            p_data = get_documents(token, endpoint, start_date, end_date, page=p_num, page_size=PAGE_SIZE, date_param_name=date_param)
-            return p_data.get("results", []) if p_data else None
-
-        # 2. Fetch pages 2 to N in parallel (with localized verification)
-        failed_pages = []
-        
-        # Reduced max_workers to 2 to improve stability
-        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-            future_to_page = {executor.submit(fetch_page, p): p for p in range(2, total_pages + 1)}
-            
-            for future in concurrent.futures.as_completed(future_to_page):
-                p_num = future_to_page[future]
-                try:
-                    page_results = future.result()
-                    if page_results is not None:
-                        all_docs.extend(page_results)
-                    else:
-                        print(f"WARNING: Page {p_num} failed to fetch. Adding to retry queue.")
-                        failed_pages.append(p_num)
-                except Exception as e:
-                    logging.error(f"Error fetching page {p_num}: {e}")
-                    failed_pages.append(p_num)
-
-        # 3. Retry Logic for Failed Pages (Sequential "Rescue")
-        if failed_pages:
-            print(f"Attempting to rescue {len(failed_pages)} failed pages...")
-            for p_num in failed_pages:
-                try:
-                    import time
-                    time.sleep(1.0) # Grace period
-                    p_data = get_documents(token, endpoint, start_date, end_date, page=p_num, page_size=PAGE_SIZE, date_param_name=date_param)
-                    if p_data and "results" in p_data:
-                        all_docs.extend(p_data["results"])
-                        print(f"SUCCESS: Rescued page {p_num}.")
-                    else:
-                        print(f"CRITICAL: Failed to rescue page {p_num} after retry.")
-                except Exception as e:
-                    print(f"CRITICAL: Exception rescuing page {p_num}: {e}")
-
-    # 4. Final Integrity Check
-    if len(all_docs) != total_results:
-        print(f"INTEGRITY WARNING: Expected {total_results} documents for {endpoint}, but got {len(all_docs)}. Some data may be missing.")
-    else:
-        print(f"Integrity Check Passed: {len(all_docs)}/{total_results} documents verified.")
-
-    logging.info(f"Total docs fetched for {endpoint}: {len(all_docs)}")
-    return all_docs
+    return run_sync(fetch_all_documents(token, endpoint, start_date, end_date, progress_callback, priority))
 
 def extract_movements_from_doc(doc, doc_type):
     """
-    Extract product items from a document and format as movements
+    Extract product items from a document as compact MovementLine records
+    sharing one MovementDoc (see movement_records; .to_row() gives the flat dict)
     """
     movements = []
     doc_date = doc.get("date")
@@ -295,8 +253,28 @@ def extract_movements_from_doc(doc, doc_type):
         exchange_rate = currency.get("exchange_rate", 1.0)
         
     # 6. Global Values (Document Level)
-    # These will be repeated per line, which is acceptable for flat audit tables
     doc_total = doc.get("total", 0)
+
+    # Document-level fields are stored once and shared by every line
+    mov_doc = MovementDoc(
+        date=doc_date,
+        doc_type=friendly_type,
+        doc_number=doc_number,
+        provider_doc=provider_doc,
+        client=client_name,
+        nit=client_nit,
+        type=mov_type,
+        observations=observation,
+        affected_invoice=affected_invoice,
+        cost_center=cc_name,
+        seller=seller_name,
+        payment_forms=payment_str,
+        currency=currency_code,
+        exchange_rate=exchange_rate,
+        created_at=created_at,
+        created_by=created_by,
+        doc_total_value=doc_total,
+    )
     
     items = doc.get("items", [])
     # print(f"DEBUG: Processing document {doc_number} with {len(items)} items")
@@ -360,142 +338,73 @@ def extract_movements_from_doc(doc, doc_type):
         if isinstance(warehouse, dict):
              warehouse_name = warehouse.get("name", "Sin Bodega")
         
-        movements.append({
-            "date": doc_date,
-            "doc_type": friendly_type,
-            "doc_number": doc_number,
-            "provider_doc": provider_doc,
-            "client": client_name,
-            "nit": client_nit,
-            "code": code,
-            "name": description,
-            "warehouse": warehouse_name,
-            "quantity": qty,
-            "price": round(eff_price, 2),
-            "total": round(line_total, 2),
-            "type": mov_type,
-            "observations": observation,
-            "affected_invoice": affected_invoice,
-            # Audit Fields
-            "cost_center": cc_name,
-            "seller": seller_name,
-            "payment_forms": payment_str,
-            "taxes": tax_str,
-            "currency": currency_code,
-            "exchange_rate": exchange_rate,
-            "created_at": created_at,
-            "created_by": created_by,
-            "doc_total_value": doc_total # Total of the whole document
-        })
+        movements.append(MovementLine(
+            mov_doc,
+            code=code,
+            name=description,
+            warehouse=warehouse_name,
+            quantity=qty,
+            price=round(eff_price, 2),
+            total=round(line_total, 2),
+            taxes=tax_str,
+        ))
         
     return movements
 
-def get_consolidated_movements(token, start_date, end_date, progress_callback=None, selected_types=None):
+# Master list of document types
+# Format: (endpoint, description, unique_key)
+MASTER_DOC_TYPES = [
+    ("invoices", "Facturas de Venta (FV)", "FV"),
+    ("credit-notes", "Notas Crédito (NC)", "NC"),
+    ("debit-notes", "Notas Débito (ND)", "ND"),
+    ("purchases", "Facturas de Compra (FC)", "FC"),
+    ("journals", "Comprobantes Contables (CC)", "CC"),
+    ("delivery-notes", "Remisiones (RM)", "RM")
+]
+
+def select_doc_endpoints(selected_types=None):
     """
-    Main function to get all movements with strict date filtering
+    Maps the UI doc type selection to the (endpoint, description, key) entries to fetch.
     """
-    from datetime import datetime, timedelta
-    all_movements = []
-    
-    # Parse dates for validation
-    start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-    end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-    
-    # DATE FIX: Siigo API date_end appears to be exclusive or 00:00 cutoff.
-    # To ensure we get the full 'end_date', we extend the API query window by 1 day.
-    # We will still filter strictly by the user's selected 'end_date' in Python.
-    api_end_dt = end_dt + timedelta(days=1)
-    api_end_str = api_end_dt.strftime("%Y-%m-%d")
-    
-    # Master list of document types
-    # Format: (endpoint, description, unique_key)
-    # unique_key matches the UI selection values roughly or we map them.
-    master_types = [
-        ("invoices", "Facturas de Venta (FV)", "FV"),
-        ("credit-notes", "Notas Crédito (NC)", "NC"),
-        ("debit-notes", "Notas Débito (ND)", "ND"),
-        ("purchases", "Facturas de Compra (FC)", "FC"),
-        ("journals", "Comprobantes Contables (CC)", "CC"),
-        ("delivery-notes", "Remisiones (RM)", "RM")
-    ]
-    
-    # Filter types to process
-    types_to_process = []
-    if selected_types and len(selected_types) > 0:
-        # User selected specific types. Map them.
-        # Check against the 3rd element (key) or defaults
-        processed_endpoints = set()
-        
-        for t in master_types:
-             endpoint, desc, key = t
-             
-             # Logic:
-             # 1. Direct Match: User asked for "FV", match "FV"
-             # 2. Indirect Match: User asked for "NE" (Ensamble), implies we MUST fetch "journals" (CC)
-             
-             should_include = False
-             
-             if key in selected_types or endpoint in selected_types:
-                 should_include = True
-                 
-             # Special Case: NE (Ensamble) lives inside Journals (CC)
-             if "NE" in selected_types and endpoint == "journals":
-                 should_include = True
-                 
-             # Special Case: ENSAMBLE (Old Key) lives inside Journals (CC)
-             if "ENSAMBLE" in selected_types and endpoint == "journals":
-                 should_include = True
-
-             if should_include:
-                 if endpoint not in processed_endpoints:
-                    types_to_process.append(t)
-                    processed_endpoints.add(endpoint)
-    else:
+    if not selected_types:
         # Default: Process ALL if nothing specific selected
-        types_to_process = master_types
-        
-    # Optimized: Fetch all document types in PARALLEL
-    import concurrent.futures
-    
-    def fetch_doc_type_movements(type_info):
-        endpoint, description, key = type_info
-        type_movs = []
-        
-        try:
-            # Query API with EXTENDED range to cover full end day
-            docs = get_all_documents(token, endpoint, start_date, api_end_str)
-            
-            for doc in docs:
-                # Strict date filtering using USER'S original range
-                doc_date_str = doc.get("date")
-                if doc_date_str:
-                    try:
-                        doc_date = datetime.strptime(doc_date_str, "%Y-%m-%d")
-                        if start_dt <= doc_date <= end_dt:
-                            movements = extract_movements_from_doc(doc, endpoint)
-                            type_movs.extend(movements)
-                    except ValueError:
-                        continue
-        except Exception as e:
-            print(f"ERROR: Failed to fetch {endpoint}: {str(e)}")
-            
-        return type_movs
+        return list(MASTER_DOC_TYPES)
 
-    # Run in parallel to speed up - Reduced to 3 to prevent API congestion
-    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-        future_to_type = {executor.submit(fetch_doc_type_movements, t): t for t in types_to_process}
-        
-        for future in concurrent.futures.as_completed(future_to_type):
-            type_info = future_to_type[future]
-            try:
-                result_movs = future.result()
-                all_movements.extend(result_movs)
-                if progress_callback:
-                    endpoint, desc, key = type_info
-                    progress_callback(f"Completado {desc} - {len(result_movs)} regs")
-            except Exception as e:
-                print(f"Exception processing {type_info}: {e}")
+    types_to_process = []
+    processed_endpoints = set()
+    for t in MASTER_DOC_TYPES:
+        endpoint, desc, key = t
+        # 1. Direct Match: User asked for "FV", match "FV"
+        # 2. Indirect Match: NE / ENSAMBLE (old key) live inside Journals (CC)
+        should_include = key in selected_types or endpoint in selected_types
+        if endpoint == "journals" and ("NE" in selected_types or "ENSAMBLE" in selected_types):
+            should_include = True
+        if should_include and endpoint not in processed_endpoints:
+            types_to_process.append(t)
+            processed_endpoints.add(endpoint)
+    return types_to_process
 
-    print(f"DEBUG: Total movements extracted: {len(all_movements)}")
-    return all_movements
+def movements_from_docs(docs, endpoint, start_dt, end_dt):
+    """
+    Flattens documents into movements, keeping only docs dated within [start_dt, end_dt].
+    """
+    type_movs = []
+    for doc in docs:
+        # Strict date filtering using USER'S original range
+        doc_date_str = doc.get("date")
+        if doc_date_str:
+            try:
+                doc_date = datetime.strptime(doc_date_str, "%Y-%m-%d")
+                if start_dt <= doc_date <= end_dt:
+                    type_movs.extend(extract_movements_from_doc(doc, endpoint))
+            except ValueError:
+                continue
+    return type_movs
 
+def get_consolidated_movements(token, start_date, end_date, progress_callback=None, selected_types=None, priority=INTERACTIVE):
+    """
+    Main function to get all movements with strict date filtering
+    (sync wrapper over siigo_async.fetch_consolidated_movements).
+    Returns compact MovementLine records.
+    """
+    return run_sync(fetch_consolidated_movements(token, start_date, end_date, progress_callback, selected_types, priority))
@@ -1,24 +1,56 @@
+import logging
+import threading
+import time
+
 from app.services.cache import cache
 
 CACHE_KEY_ROLES = "roles_v1.json"
 
+# In-memory role map: rebuilt when set/remove bump the version, or after
+# ROLE_MAP_TTL_S to pick up changes made by other instances (the reload asks
+# the cache for a copy at most ROLE_MAP_TTL_S old, revalidated against GCS).
+ROLE_MAP_TTL_S = 30
+_role_map = {"version": -1, "loaded_at": 0.0, "roles": {}}
+_roles_version = 0
+_role_lock = threading.Lock()
+
 # Default fallback if file empty
 DEFAULT_ROLES = {
     "costos@origenbotanico.com": "admin",
     "visualizador@origenbotanico.com": "viewer"
 }
 
-def get_all_roles():
-    data = cache.load(CACHE_KEY_ROLES)
+def get_all_roles(ttl=3600):
+    # Past ttl the local copy is revalidated; if that fails, any local copy beats the defaults
+    data = cache.load(CACHE_KEY_ROLES, ttl) or cache.load(CACHE_KEY_ROLES, ttl=None)
     if not data:
         # Initialize with defaults if empty
         cache.save(CACHE_KEY_ROLES, DEFAULT_ROLES)
-        return DEFAULT_ROLES
+        return dict(DEFAULT_ROLES)
     return data
 
+def _bump_version():
+    global _roles_version
+    with _role_lock:
+        _roles_version += 1
+
+def _current_roles():
+    """Role map from memory; reloaded after set/remove (version) or ROLE_MAP_TTL_S."""
+    with _role_lock:
+        if _role_map["version"] == _roles_version and time.time() - _role_map["loaded_at"] < ROLE_MAP_TTL_S:
+            return _role_map["roles"]
+        version = _roles_version
+    roles = get_all_roles(ROLE_MAP_TTL_S)
+    with _role_lock:
+        # A change that landed while loading keeps the map invalid
+        if _roles_version == version:
+            _role_map.update(version=version, loaded_at=time.time(), roles=roles)
+    return roles
+
 def get_user_role(email):
-    roles = get_all_roles()
-    
+    return _resolve_role(email, _current_roles())
+
+def _resolve_role(email, roles):
     # Check explicit rules first
     if email in roles:
         return roles[email]
@@ -32,14 +64,27 @@ def get_user_role(email):
         
     return "viewer" # Default to viewer
 
+def _update_roles(mutator):
+    # Read-modify-write on the latest stored map: concurrent admins don't drop each other's changes
+    try:
+        cache.update(CACHE_KEY_ROLES, mutator, default=DEFAULT_ROLES)
+        return True
+    except Exception as e:
+        logging.error(f"Failed to update roles: {e}")
+        return False
+    finally:
+        _bump_version()
+
 def set_user_role(email, role):
-    roles = get_all_roles()
-    roles[email] = role
-    return cache.save(CACHE_KEY_ROLES, roles)
+    def apply(roles):
+        roles[email] = role
+        return roles
+    return _update_roles(apply)
 
 def remove_user_role(email):
-    roles = get_all_roles()
-    if email in roles:
+    def apply(roles):
+        if email not in roles:
+            return None  # nothing to write
         del roles[email]
-        return cache.save(CACHE_KEY_ROLES, roles)
-    return True
+        return roles
+    return _update_roles(apply)
@@ -0,0 +1,115 @@
+"""
+sales_rollup.py — Acumulado diario de ventas (empresa × SKU × día).
+
+Persisted per company as `sales_rollup_{company}.json`:
+    {"version": 2,
+     "days":   {"YYYY-MM-DD": {sku: [quantity, lines]}},
+     "source": {"YYYY-MM": partition checksum the month was built from}}
+
+Quantities are abs(quantity) of FV lines with normalized SKUs, i.e. what
+`calculate_average_sales` used to sum after crawling Siigo. The movement sync
+calls `update_range` after every checkpoint, so only the days of the
+replaced range are recomputed. `ensure` rebuilds any month whose partition
+checksum no longer matches `source` (store written before the rollup
+existed, or by another path), so reads never see a stale month. Writes go
+through `cache.update`, so concurrent ranges (threads or instances) merge
+instead of overwriting each other.
+"""
+import pandas as pd
+
+from app.services.cache import cache
+from app.services.movement_store import movement_store, _month_keys, _month_end
+from app.services.sku_catalog import sku_catalog
+
+ROLLUP_VERSION = 2  # 2: canonical SKUs from sku_catalog
+SALES_DOC_TYPES = ("FV",)
+
+
+class SalesRollup:
+    def __init__(self, store, cache_service):
+        self.store = store
+        self.cache = cache_service
+
+    def _key(self, company: str) -> str:
+        return f"sales_rollup_{company}.json"
+
+    def _empty(self) -> dict:
+        return {"version": ROLLUP_VERSION, "days": {}, "source": {}}
+
+    def load(self, company: str) -> dict:
+        """Rollup of `company` (shared with the cache L1: read-only)."""
+        key = self._key(company)
+        data = self.cache.load(key) or self.cache.load(key, ttl=None)
+        if not data or data.get("version") != ROLLUP_VERSION:
+            return self._empty()
+        return data
+
+    def _compute(self, company: str, start_date: str, end_date: str) -> dict:
+        """{day: {sku: [qty, lines]}} for the FV lines stored in the range."""
+        df = self.store.read_range_frame(company, start_date, end_date, SALES_DOC_TYPES, columns=["date", "code", "quantity"])
+        if not len(df):
+            return {}
+        df["sku"] = sku_catalog.normalize_series(df["code"])
+        df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce").fillna(0.0).abs()
+        grouped = df.groupby(["date", "sku"])["quantity"].agg(["sum", "size"])
+        days = {}
+        for (day, sku), (qty, lines) in grouped.iterrows():
+            days.setdefault(day, {})[sku] = [round(float(qty), 4), int(lines)]
+        return days
+
+    def update_range(self, company: str, start_date: str, end_date: str):
+        """
+        Recomputes the days in [start_date, end_date] from the store. A month
+        only partly in the range whose rollup is missing or stale is widened
+        to the whole month: `source` may only record months rolled up entirely.
+        """
+        manifest = self.store.load_manifest(company)
+        rolled = self.load(company)["source"]
+        for month in _month_keys(start_date, end_date):
+            entry = manifest["months"].get(month)
+            first, last = f"{month}-01", _month_end(month)
+            if entry is None or (start_date <= first and last <= end_date):
+                continue
+            if rolled.get(month) != entry.get("checksum"):
+                start_date, end_date = min(start_date, first), max(end_date, last)
+        fresh = self._compute(company, start_date, end_date)
+        sources = {
+            month: manifest["months"][month].get("checksum")
+            for month in _month_keys(start_date, end_date)
+            if month in manifest["months"]
+            and start_date <= f"{month}-01" and _month_end(month) <= end_date
+        }
+
+        def apply(rollup):
+            # Applied on the latest stored rollup: only this range is replaced
+            if rollup.get("version") != ROLLUP_VERSION:
+                rollup = self._empty()
+            days = rollup["days"]
+            for day in [d for d in days if start_date <= d <= end_date]:
+                del days[day]
+            days.update(fresh)
+            rollup["source"].update(sources)
+            return rollup
+
+        self.cache.update(self._key(company), apply, default=self._empty())
+
+    def ensure(self, company: str, start_date: str, end_date: str):
+        """Rebuilds the months of the range whose partition changed since they were rolled up."""
+        rollup = self.load(company)
+        manifest = self.store.load_manifest(company)
+        for month in _month_keys(start_date, end_date):
+            entry = manifest["months"].get(month)
+            if entry is None:
+                continue
+            if rollup["source"].get(month, "missing") != entry.get("checksum"):
+                self.update_range(company, f"{month}-01", _month_end(month))
+
+    def daily_sales(self, company: str, start_date: str, end_date: str) -> dict:
+        """{day: {sku: [qty, lines]}} for the range (rolled up months only)."""
+        self.ensure(company, start_date, end_date)
+        days = self.load(company)["days"]
+        return {d: skus for d, skus in days.items() if start_date <= d <= end_date}
+
+
+# Singleton global
+sales_rollup = SalesRollup(movement_store, cache)
@@ -1,3 +1,5 @@
+import logging
+
 from app.services.cache import cache
 
 CACHE_KEY_SETTINGS = "app_settings_v1.json"
@@ -13,21 +15,24 @@ def get_all_settings():
     data = cache.load(CACHE_KEY_SETTINGS)
     if not data:
         cache.save(CACHE_KEY_SETTINGS, DEFAULT_SETTINGS)
-        return DEFAULT_SETTINGS
+        return dict(DEFAULT_SETTINGS)
     
-    # Merge with defaults to ensure keys exist
-    for k, v in DEFAULT_SETTINGS.items():
-        if k not in data:
-            data[k] = v
-            
-    return data
+    # Merge with defaults to ensure keys exist (new dict: the loaded one is shared)
+    return {**DEFAULT_SETTINGS, **data}
+
+def _update_settings(changes: dict):
+    # Applied on the latest stored settings (cache.update retries if another instance wrote first)
+    def apply(settings):
+        return {**DEFAULT_SETTINGS, **settings, **changes}
+    try:
+        cache.update(CACHE_KEY_SETTINGS, apply, default=DEFAULT_SETTINGS)
+        return True
+    except Exception as e:
+        logging.error(f"Failed to save settings: {e}")
+        return False
 
 def set_setting(key: str, value: str):
-    settings = get_all_settings()
-    settings[key] = value
-    return cache.save(CACHE_KEY_SETTINGS, settings)
+    return _update_settings({key: value})
 
 def set_all_settings(new_settings: dict):
-    settings = get_all_settings()
-    settings.update(new_settings)
-    return cache.save(CACHE_KEY_SETTINGS, settings)
+    return _update_settings(dict(new_settings))
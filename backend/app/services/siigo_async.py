@@ -0,0 +1,350 @@
+"""
+siigo_async.py — Cliente asíncrono (httpx) para la API de Siigo.
+
+Asyncio-native version of the products/documents fetch stack. One coroutine
+per page instead of three levels of nested ThreadPoolExecutors; page
+fan-out is bounded by small semaphores and the request rate is still paced
+by siigo_scheduler (aslot). Semantics match the original sync functions:
+  - products: any page failing fails the whole company fetch
+  - documents: failed pages get one sequential "rescue" pass, then the
+    count is checked against pagination.total_results
+  - documents are streamed page by page (iter_document_pages) so raw JSON
+    is flattened into movement rows and discarded as each page arrives
+
+Async endpoints await these directly; sync callers go through the thin
+wrappers in inventory.py / movements.py, which use run_sync(). Sync calls
+run on one long-lived background event loop, and every loop keeps one
+pooled AsyncClient, so neither the loop nor the connections are rebuilt per
+call. Calls are counted in http_client.stats() like the requests traffic.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import math
+import threading
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import httpx
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
+
+from app.services.auth import invalidate_token
+from app.services import http_client
+from app.services.http_client import POOL_SIZE, CONNECT_TIMEOUT
+from app.services.siigo_scheduler import siigo_scheduler, credential_key, INTERACTIVE
+
+BASE_URL = "https://api.siigo.com/v1"
+PAGE_SIZE = 100
+
+# Upper bounds on concurrent pages (the scheduler decides the real rate)
+PRODUCT_PAGE_CONCURRENCY = 4
+DOCUMENT_PAGE_CONCURRENCY = 2
+DOC_TYPE_CONCURRENCY = 3
+
+
+class IncompleteFetchError(Exception):
+    """A strict document fetch could not read every page of an endpoint."""
+
+
+class MovementFetchError(Exception):
+    """Some doc types could not be fetched; `movements` holds the rows of those that were."""
+
+    def __init__(self, failed, movements, fetched):
+        super().__init__(f"Fallaron: {', '.join(failed)}")
+        self.failed = failed          # endpoints that failed
+        self.movements = movements    # rows of the endpoints that succeeded
+        self.fetched = fetched        # endpoints that succeeded
+
+
+def should_retry(e):
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code in (429, 500, 502, 503, 504)
+    return isinstance(e, httpx.TransportError)
+
+
+_loop = None
+_loop_lock = threading.Lock()
+_clients = {}  # event loop -> its shared AsyncClient
+
+
+def _background_loop():
+    """The event loop that runs sync callers' coroutines (started on first use)."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, daemon=True, name="siigo-loop").start()
+            _loop = loop
+        return _loop
+
+
+def run_sync(coro):
+    """Runs a coroutine from sync code, even when called inside a running event loop."""
+    loop = _background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        # Blocking the background loop on itself would deadlock: use a throwaway loop
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coro).result()
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def _shared_client() -> httpx.AsyncClient:
+    # httpx connections belong to the loop that opened them: one client per loop
+    loop = asyncio.get_running_loop()
+    with _loop_lock:
+        client = _clients.get(loop)
+        if client is None or client.is_closed:
+            limits = httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+            # Shared by every company: Set-Cookie is dropped, like in http_client's sessions
+            client = _clients[loop] = httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(30, connect=CONNECT_TIMEOUT),
+                                                        cookies=http_client.no_cookie_jar())
+            for other in [l for l in _clients if l.is_closed()]:
+                del _clients[other]
+        return client
+
+
+@asynccontextmanager
+async def siigo_client(client=None):
+    """Yields `client` if given, otherwise the long-lived pooled AsyncClient of the running loop."""
+    yield client if client is not None else _shared_client()
+
+
+def _headers(token, partner_id):
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {token}",
+        "Partner-Id": partner_id,
+    }
+
+
+@retry(
+    retry=retry_if_exception(should_retry),
+    wait=wait_exponential(multiplier=0.5, min=0.5, max=30),
+    stop=stop_after_attempt(5)
+)
+async def _get_json(client, url, headers, params, timeout, priority):
+    async with siigo_scheduler.aslot(credential_key(headers["Authorization"]), priority) as ticket:
+        start = time.monotonic()
+        try:
+            response = await client.get(url, headers=headers, params=params, timeout=timeout)
+        except Exception:
+            http_client.record(url, time.monotonic() - start, failed=True)
+            raise
+        http_client.record(url, time.monotonic() - start, len(response.content), response.status_code >= 500)
+        ticket.observe(response)
+    if response.status_code == 401:
+        invalidate_token(headers["Authorization"])
+    response.raise_for_status()
+    return response.json()
+
+
+# --- Products ---
+
+async def get_products(client, token, partner_id="SiigoApi", page=1, page_size=25, priority=INTERACTIVE):
+    params = {"page": page, "page_size": page_size}
+    try:
+        return await _get_json(client, f"{BASE_URL}/products", _headers(token, partner_id), params, 20, priority)
+    except Exception as e:
+        print(f"Error fetching products page {page}: {e}")
+        return None
+
+
+async def fetch_all_products(token, partner_id="SiigoApi", progress_callback=None, priority=INTERACTIVE, client=None):
+    """All products of one company; raises if any page cannot be fetched."""
+    async with siigo_client(client) as client:
+        if progress_callback:
+            progress_callback("Iniciando carga de inventario...")
+
+        data = await get_products(client, token, partner_id, page=1, page_size=PAGE_SIZE, priority=priority)
+        if data is None:
+            raise Exception("Error crítico: Falló la conexión inicial con Siigo al obtener productos.")
+        if "results" not in data:
+            return []
+
+        all_products = list(data["results"])
+        total_results = data.get("pagination", {}).get("total_results", 0)
+        if total_results <= len(all_products):
+            return all_products
+
+        total_pages = math.ceil(total_results / PAGE_SIZE)
+        sem = asyncio.Semaphore(PRODUCT_PAGE_CONCURRENCY)
+
+        async def fetch_page(p):
+            async with sem:
+                p_data = await get_products(client, token, partner_id, page=p, page_size=PAGE_SIZE, priority=priority)
+            if not p_data or "results" not in p_data:
+                raise Exception(f"Failed to fetch page {p}")
+            return p_data["results"]
+
+        tasks = [asyncio.create_task(fetch_page(p)) for p in range(2, total_pages + 1)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                all_products.extend(await next_done)
+                if progress_callback:
+                    progress_callback(f"Cargando inventario: {len(all_products)}/{total_results} productos...")
+        except Exception as e:
+            print(f"Detailed fetch error in page: {e}")
+            for t in tasks:
+                t.cancel()
+            raise
+        return all_products
+
+
+# --- Documents ---
+
+async def get_documents(client, token, endpoint, start_date, end_date, page=1, date_param_name="date_start", priority=INTERACTIVE):
+    params = {
+        "page": page,
+        "page_size": PAGE_SIZE,
+        date_param_name: start_date,
+        date_param_name.replace("_start", "_end"): end_date,
+    }
+    try:
+        logging.info(f"Fetching {endpoint} page {page}. Params: {params}")
+        return await _get_json(client, f"{BASE_URL}/{endpoint}", _headers(token, "GCOPlatform"), params, 30, priority)
+    except Exception as e:
+        print(f"Error fetching {endpoint} page {page}: {e}")
+        return None
+
+
+async def iter_document_pages(token, endpoint, start_date, end_date, progress_callback=None, priority=INTERACTIVE,
+                              client=None, strict=False):
+    """
+    Async generator yielding the `results` list of each page as it arrives,
+    so callers can flatten and discard raw documents page by page. Failed
+    pages get one sequential rescue pass; the integrity check compares the
+    number of documents seen against pagination.total_results.
+
+    strict=True raises IncompleteFetchError (after yielding what arrived)
+    when the first page fails, a page cannot be rescued or the count does
+    not match, instead of only logging it.
+    """
+    date_param = "created_start" if endpoint == "journals" else "date_start"
+
+    async with siigo_client(client) as client:
+        first_page = await get_documents(client, token, endpoint, start_date, end_date, 1, date_param, priority)
+        if not first_page or "results" not in first_page:
+            if strict:
+                raise IncompleteFetchError(f"{endpoint}: first page failed")
+            return
+
+        total_results = first_page.get("pagination", {}).get("total_results", 0)
+        if total_results == 0:
+            return
+        total_pages = math.ceil(total_results / PAGE_SIZE)
+        seen = len(first_page["results"])
+        yield first_page["results"]
+        first_page = None
+
+        if total_pages > 1:
+            sem = asyncio.Semaphore(DOCUMENT_PAGE_CONCURRENCY)
+
+            async def fetch_page(p_num):
+                if progress_callback and p_num % 5 == 0:  # Throttle UI updates
+                    progress_callback(f"{endpoint}: Pag {p_num}/{total_pages}...")
+                async with sem:
+                    p_data = await get_documents(client, token, endpoint, start_date, end_date, p_num, date_param, priority)
+                return p_num, (p_data.get("results", []) if p_data else None)
+
+            failed_pages = []
+            tasks = [asyncio.create_task(fetch_page(p)) for p in range(2, total_pages + 1)]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    p_num, page_results = await next_done
+                    if page_results is None:
+                        print(f"WARNING: Page {p_num} failed to fetch. Adding to retry queue.")
+                        failed_pages.append(p_num)
+                        continue
+                    seen += len(page_results)
+                    yield page_results
+            finally:
+                for t in tasks:
+                    t.cancel()
+
+            # Sequential "rescue" of failed pages
+            lost_pages = []
+            if failed_pages:
+                print(f"Attempting to rescue {len(failed_pages)} failed pages...")
+                for p_num in failed_pages:
+                    await asyncio.sleep(1.0)  # Grace period
+                    p_data = await get_documents(client, token, endpoint, start_date, end_date, p_num, date_param, priority)
+                    if p_data and "results" in p_data:
+                        print(f"SUCCESS: Rescued page {p_num}.")
+                        seen += len(p_data["results"])
+                        yield p_data["results"]
+                    else:
+                        print(f"CRITICAL: Failed to rescue page {p_num} after retry.")
+                        lost_pages.append(p_num)
+            if strict and lost_pages:
+                raise IncompleteFetchError(f"{endpoint}: pages {sorted(lost_pages)} failed")
+
+        # Final integrity check (counts only, documents are already gone)
+        if seen != total_results:
+            print(f"INTEGRITY WARNING: Expected {total_results} documents for {endpoint}, but got {seen}. Some data may be missing.")
+            if strict:
+                raise IncompleteFetchError(f"{endpoint}: expected {total_results} documents, got {seen}")
+        else:
+            print(f"Integrity Check Passed: {seen}/{total_results} documents verified.")
+        logging.info(f"Total docs fetched for {endpoint}: {seen}")
+
+
+async def fetch_all_documents(token, endpoint, start_date, end_date, progress_callback=None, priority=INTERACTIVE, client=None):
+    """All documents of one endpoint in [start_date, end_date] (materialized iter_document_pages)."""
+    all_docs = []
+    async for page in iter_document_pages(token, endpoint, start_date, end_date, progress_callback, priority, client):
+        all_docs.extend(page)
+    return all_docs
+
+
+async def fetch_consolidated_movements(token, start_date, end_date, progress_callback=None, selected_types=None,
+                                       priority=INTERACTIVE, client=None, strict=False):
+    """
+    Async counterpart of movements.get_consolidated_movements.
+
+    A doc type that fails is logged and skipped; with strict=True the call
+    raises MovementFetchError instead, so an empty list always means "no
+    documents" and never "fetch failed".
+    """
+    from app.services.movements import select_doc_endpoints, movements_from_docs
+
+    start_dt = datetime.strptime(start_date, "%Y-%m-%d")
+    end_dt = datetime.strptime(end_date, "%Y-%m-%d")
+    # Siigo date_end is exclusive: query one extra day, filter strictly afterwards
+    api_end_str = (end_dt + timedelta(days=1)).strftime("%Y-%m-%d")
+
+    all_movements = []
+    failed, fetched = [], []
+    sem = asyncio.Semaphore(DOC_TYPE_CONCURRENCY)
+
+    async with siigo_client(client) as client:
+        async def fetch_doc_type(type_info):
+            endpoint, description, key = type_info
+            type_movs = []
+            try:
+                async with sem:
+                    # Each page is filtered and flattened on arrival; raw documents are dropped right away
+                    async for page in iter_document_pages(token, endpoint, start_date, api_end_str, priority=priority,
+                                                          client=client, strict=strict):
+                        type_movs.extend(movements_from_docs(page, endpoint, start_dt, end_dt))
+            except Exception as e:
+                print(f"ERROR: Failed to fetch {endpoint}: {str(e)}")
+                failed.append(endpoint)
+                return type_info, []
+            fetched.append(endpoint)
+            return type_info, type_movs
+
+        for next_done in asyncio.as_completed([fetch_doc_type(t) for t in select_doc_endpoints(selected_types)]):
+            type_info, result_movs = await next_done
+            all_movements.extend(result_movs)
+            if progress_callback:
+                progress_callback(f"Completado {type_info[1]} - {len(result_movs)} regs")
+
+    print(f"DEBUG: Total movements extracted: {len(all_movements)}")
+    if strict and failed:
+        raise MovementFetchError(failed, all_movements, fetched)
+    return all_movements
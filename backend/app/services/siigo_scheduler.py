@@ -0,0 +1,279 @@
+"""
+siigo_scheduler.py — Planificador global de peticiones a la API de Siigo.
+
+Every Siigo HTTP call (auth, products, documents) goes through one
+process-wide scheduler instead of relying on the width of the nested thread
+pools that issue it:
+  - token buckets: one per company credential plus a global one. Bearer
+    tokens issued by auth.py are registered to their username, so auth calls
+    and API calls of a company share one bucket across token rotations; idle
+    buckets are evicted
+  - priority classes: interactive endpoints go before cron/sync traffic
+  - adaptive concurrency (AIMD): the in-flight limit grows slowly while
+    responses are fast and halves on 429s or slow responses; a Retry-After
+    pauses the credential instead of letting tenacity retry blindly
+
+Usage:
+    with siigo_scheduler.slot(credential_key(token), priority) as ticket:
+        response = requests.get(...)
+        ticket.observe(response)
+
+    async with siigo_scheduler.aslot(credential_key(token), priority) as ticket:
+        response = await client.get(...)
+        ticket.observe(response)
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+INTERACTIVE = 0  # user waiting on an endpoint
+BACKGROUND = 1   # cron, /movements/sync, pre-warming
+
+GLOBAL_RATE = float(os.getenv("SIIGO_GLOBAL_RPS", "10"))        # requests/s, all companies
+GLOBAL_BURST = float(os.getenv("SIIGO_GLOBAL_BURST", "20"))
+CREDENTIAL_RATE = float(os.getenv("SIIGO_COMPANY_RPS", "2.5"))  # requests/s per credential
+CREDENTIAL_BURST = float(os.getenv("SIIGO_COMPANY_BURST", "5"))
+MIN_CONCURRENCY = int(os.getenv("SIIGO_MIN_CONCURRENCY", "2"))
+MAX_CONCURRENCY = int(os.getenv("SIIGO_MAX_CONCURRENCY", "24"))
+INITIAL_CONCURRENCY = int(os.getenv("SIIGO_INITIAL_CONCURRENCY", "8"))
+SLOW_RESPONSE_S = float(os.getenv("SIIGO_SLOW_RESPONSE_S", "8"))
+
+# Background traffic may only use this share of the in-flight limit
+BACKGROUND_SHARE = 0.6
+# Async waiters cannot be woken by the Condition; they poll at most this often
+ASYNC_POLL_S = 0.05
+# Buckets unused this long (and not paused) are dropped when a new one is created
+BUCKET_IDLE_S = 600
+
+_token_owners = {}  # bearer token -> username that obtained it
+_owners_lock = threading.Lock()
+
+
+def _strip_bearer(token) -> str:
+    token = str(token)
+    return token[len("Bearer "):] if token.startswith("Bearer ") else token
+
+
+def register_token(token, username):
+    """Pace calls made with `token` under `username` (its previous tokens are forgotten)."""
+    with _owners_lock:
+        for old in [t for t, owner in _token_owners.items() if owner == username]:
+            del _token_owners[old]
+        _token_owners[_strip_bearer(token)] = username
+
+
+def forget_token(token):
+    with _owners_lock:
+        _token_owners.pop(_strip_bearer(token), None)
+
+
+def credential_key(token_or_username) -> str:
+    """Stable, non-reversible bucket key for a bearer token (resolved to its username) or username."""
+    with _owners_lock:
+        owner = _token_owners.get(_strip_bearer(token_or_username))
+    if owner is not None:
+        token_or_username = owner
+    return hashlib.sha1(str(token_or_username).encode("utf-8")).hexdigest()[:12]
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until one token is available (0 = available now)."""
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class Ticket:
+    """Handle for one scheduled call; report the HTTP outcome with observe()."""
+    def __init__(self, key: str, priority: int):
+        self.key = key
+        self.priority = priority
+        self.status = None
+        self.retry_after = None
+
+    def observe(self, response):
+        self.status = response.status_code
+        if self.status == 429:
+            try:
+                self.retry_after = float(response.headers.get("Retry-After", ""))
+            except ValueError:
+                self.retry_after = None
+
+
+class SiigoScheduler:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._global = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self._buckets = {}
+        self._limit = float(INITIAL_CONCURRENCY)
+        self._in_flight = 0
+        self._waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._interactive_keys = {}  # credential -> interactive callers waiting on it
+        self._stats = {"requests": 0, "throttled": 0, "errors": 0, "slow": 0}
+
+    def _bucket(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._evict_idle(time.monotonic())
+            bucket = self._buckets[key] = TokenBucket(CREDENTIAL_RATE, CREDENTIAL_BURST)
+        return bucket
+
+    def _evict_idle(self, now: float):
+        # Caller holds the condition. An idle, unpaused bucket is full again: dropping it changes nothing
+        for key in [k for k, b in self._buckets.items() if now - b.updated > BUCKET_IDLE_S and now >= b.paused_until]:
+            del self._buckets[key]
+
+    def _concurrency_for(self, priority: int) -> int:
+        limit = int(self._limit)
+        if priority == BACKGROUND:
+            return max(1, int(limit * BACKGROUND_SHARE))
+        return limit
+
+    def _interactive_ahead(self, key: str, now: float) -> bool:
+        # Background only yields to interactive callers of its own credential, or of one
+        # whose bucket could start them now (a paused credential must not stall the rest)
+        for k in self._interactive_keys:
+            bucket = self._buckets.get(k)
+            if k == key or bucket is None or bucket.wait_time(now) == 0:
+                return True
+        return False
+
+    def _try_start(self, key: str, priority: int, now: float) -> float:
+        """Starts the call if allowed. Returns 0 on success, else seconds to wait."""
+        if priority == BACKGROUND and self._interactive_ahead(key, now):
+            return 0.05
+        if self._in_flight >= self._concurrency_for(priority):
+            return 0.25  # woken up early by release()
+        bucket = self._bucket(key)
+        wait = max(self._global.wait_time(now), bucket.wait_time(now))
+        if wait > 0:
+            return wait
+        self._global.take()
+        bucket.take()
+        self._in_flight += 1
+        return 0.0
+
+    def _enter(self, key: str, priority: int):
+        # Caller holds the condition
+        self._waiting[priority] += 1
+        if priority == INTERACTIVE:
+            self._interactive_keys[key] = self._interactive_keys.get(key, 0) + 1
+
+    def _leave(self, key: str, priority: int):
+        # Caller holds the condition
+        self._waiting[priority] -= 1
+        if priority == INTERACTIVE:
+            self._interactive_keys[key] -= 1
+            if not self._interactive_keys[key]:
+                del self._interactive_keys[key]
+
+    def acquire(self, key: str, priority: int = INTERACTIVE) -> Ticket:
+        with self._cond:
+            self._enter(key, priority)
+            try:
+                while True:
+                    wait = self._try_start(key, priority, time.monotonic())
+                    if wait == 0:
+                        return Ticket(key, priority)
+                    self._cond.wait(timeout=min(wait, 1.0))
+            finally:
+                self._leave(key, priority)
+
+    async def acquire_async(self, key: str, priority: int = INTERACTIVE) -> Ticket:
+        """Same as acquire() but sleeps on the event loop instead of blocking a thread."""
+        with self._cond:
+            self._enter(key, priority)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_start(key, priority, time.monotonic())
+                if wait == 0:
+                    return Ticket(key, priority)
+                await asyncio.sleep(min(wait, ASYNC_POLL_S))
+        finally:
+            with self._cond:
+                self._leave(key, priority)
+
+    def release(self, ticket: Ticket, elapsed: float, failed: bool = False):
+        with self._cond:
+            self._in_flight -= 1
+            self._stats["requests"] += 1
+            if ticket.status == 429:
+                # Multiplicative decrease + honour Retry-After on this credential
+                self._stats["throttled"] += 1
+                self._limit = max(MIN_CONCURRENCY, self._limit / 2)
+                pause = ticket.retry_after if ticket.retry_after else 2.0
+                self._bucket(ticket.key).paused_until = time.monotonic() + pause
+                logging.warning(f"Siigo 429: limit -> {self._limit:.1f}, pausing credential {ticket.key} {pause}s")
+            elif failed or (ticket.status and ticket.status >= 500):
+                self._stats["errors"] += 1
+            elif elapsed > SLOW_RESPONSE_S:
+                self._stats["slow"] += 1
+                self._limit = max(MIN_CONCURRENCY, self._limit * 0.8)
+            else:
+                # Additive increase: +1 per "window" of successful calls
+                self._limit = min(MAX_CONCURRENCY, self._limit + 1 / self._limit)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, key: str, priority: int = INTERACTIVE):
+        ticket = self.acquire(key, priority)
+        start = time.monotonic()
+        failed = False
+        try:
+            yield ticket
+        except Exception:
+            failed = ticket.status is None
+            raise
+        finally:
+            self.release(ticket, time.monotonic() - start, failed)
+
+    @asynccontextmanager
+    async def aslot(self, key: str, priority: int = INTERACTIVE):
+        ticket = await self.acquire_async(key, priority)
+        start = time.monotonic()
+        failed = False
+        try:
+            yield ticket
+        except Exception:
+            failed = ticket.status is None
+            raise
+        finally:
+            self.release(ticket, time.monotonic() - start, failed)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return dict(
+                self._stats,
+                concurrency_limit=round(self._limit, 2),
+                in_flight=self._in_flight,
+                waiting_interactive=self._waiting[INTERACTIVE],
+                waiting_background=self._waiting[BACKGROUND],
+                credential_buckets=len(self._buckets),
+            )
+
+
+# Singleton global
+siigo_scheduler = SiigoScheduler()
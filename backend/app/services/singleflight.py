@@ -0,0 +1,132 @@
+"""
+singleflight.py — Deduplicación de llamadas concurrentes.
+
+Concurrent callers asking for the same key share one in-flight execution:
+the first caller runs the function, the rest block until it finishes and
+receive the same result (or the same exception).
+
+Usage:
+    group = SingleFlight()
+    value = group.do(("user", "partner"), lambda: expensive_call())
+
+`Revalidator` builds on it for stale-while-revalidate caches: one
+background refresh per key, with backoff after failures.
+"""
+import logging
+import threading
+import time
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Runs fn() once per key at a time; concurrent callers wait and share the outcome."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def in_flight(self, key) -> bool:
+        with self._lock:
+            return key in self._calls
+
+
+def freshness_meta(stored_at: float, soft_ttl, refreshing: bool = False) -> dict:
+    """Metadatos de frescura para adjuntar a respuestas cacheadas."""
+    age = max(0.0, time.time() - stored_at)
+    return {
+        "cached_at": stored_at,
+        "age_s": int(age),
+        "stale": soft_ttl is not None and age >= soft_ttl,
+        "refreshing": refreshing,
+    }
+
+
+class Revalidator:
+    """
+    Background refreshes for stale-while-revalidate caches.
+
+    `refresh(key, fn)` starts fn() in a daemon thread unless a refresh of
+    that key is already running (shared SingleFlight with `run`) or the key
+    is backing off after a failed refresh. Failures back off exponentially
+    (BACKOFF_BASE_S doubling up to BACKOFF_MAX_S) so a broken source is not
+    hammered on every stale read.
+    """
+    BACKOFF_BASE_S = 15
+    BACKOFF_MAX_S = 600
+
+    def __init__(self, name: str = "revalidate"):
+        self.name = name
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._failures = {}  # key -> (consecutive failures, retry_at)
+
+    def run(self, key, fn):
+        """Synchronous (single-flight) refresh; records failures for the backoff."""
+        try:
+            result = self._flight.do(key, fn)
+        except Exception:
+            self._record_failure(key)
+            raise
+        with self._lock:
+            self._failures.pop(key, None)
+        return result
+
+    def refresh(self, key, fn) -> bool:
+        """Starts a background refresh; returns False when skipped (running or backing off)."""
+        if self._flight.in_flight(key) or self.backing_off(key):
+            return False
+        thread = threading.Thread(target=self._run_quietly, args=(key, fn), daemon=True,
+                                  name=f"{self.name}:{key}")
+        thread.start()
+        return True
+
+    def refreshing(self, key) -> bool:
+        return self._flight.in_flight(key)
+
+    def backing_off(self, key) -> bool:
+        with self._lock:
+            failure = self._failures.get(key)
+        return failure is not None and time.time() < failure[1]
+
+    def _run_quietly(self, key, fn):
+        try:
+            self.run(key, fn)
+        except Exception as e:
+            logging.warning(f"[{self.name}] Background refresh failed for {key}: {e}")
+
+    def _record_failure(self, key):
+        with self._lock:
+            count = self._failures.get(key, (0, 0))[0] + 1
+            delay = min(self.BACKOFF_BASE_S * 2 ** (count - 1), self.BACKOFF_MAX_S)
+            self._failures[key] = (count, time.time() + delay)
@@ -0,0 +1,165 @@
+"""
+sku_catalog.py — Catálogo canónico de SKUs.
+
+The single SKU normalizer for every module (movements, rollups, inventory,
+distribution, conciliación, juego de inventario). Raw codes resolve through
+an alias table precomputed from the Siigo product list each time inventory
+is fetched; codes not seen yet go through the rule once and are memoized in
+a bounded LRU, so hot loops pay a dict lookup instead of regex + replace
+chains per row.
+
+Also holds the per-SKU business data that used to be scattered in routers:
+packaging units (distribution) and the SKUs tracked by the inventory game.
+"""
+import re
+import threading
+from functools import lru_cache
+
+_LONG_DIGITS = re.compile(r"(\d{4,})")
+_ANY_DIGITS = re.compile(r"(\d+)")
+
+PREFIXES = ("EVO-", "EVO", "E-")
+# Order matters: longest first ("EXENTO" before "EX" avoids leaving "ENTO")
+SUFFIXES = ("EXENTO", "EX", ".1", "-1")
+# Codes whose letters are part of the identity (not a prefix to strip)
+PRESERVED_CODES = ("SD15",)
+
+ALIAS_LIMIT = 50000
+MEMO_SIZE = 65536
+
+# Unidades por caja (distribución); keys are canonical codes
+PACKAGING_UNITS = {
+    "3001": 68,
+    "3005": 50,
+    "3012": 84,
+    "7007": 50,
+    "7008": 50,
+    "7009": 50,
+    "7101": 100,
+    "7210": 50,
+    "7299": 70,
+    "7416": 100,
+    "7901": 100,
+    "7957": 100,
+    "7701": 25,
+    "7702": 100,
+    "7703": 150,
+}
+
+# SKUs base que audita el juego de inventario
+GAME_SKUS = frozenset({
+    "3001", "3005", "3012", "7701", "7702", "7703", "7901", "7957",
+    "7007", "7008", "7009", "7210", "7299", "7101", "7416",
+})
+
+
+def canonical_sku(code) -> str:
+    """
+    Normalizes SKU to extract the main numeric code.
+    Groups variations like 7007EX, EVO-7701, 7007EXENTO, 7210.0, etc. into
+    their base numeric ID. INSUMO products and PRESERVED_CODES keep their name.
+    """
+    if isinstance(code, float) and code.is_integer():
+        # Sheets/Excel read integer codes as floats (7210 -> 7210.0)
+        code = int(code)
+    if not code:
+        return "N/A"
+    code = str(code).strip().upper()
+
+    if "INSUMO" in code:
+        return code
+    for preserved in PRESERVED_CODES:
+        if preserved in code:
+            return preserved
+
+    for prefix in PREFIXES:
+        code = code.replace(prefix, "")
+    for suffix in SUFFIXES:
+        if code.endswith(suffix):
+            code = code[:-len(suffix)]
+            break
+
+    # 1. First 4+ digit sequence (main standard products): EVO-7701, 7701EXENTO, 7701.1
+    match = _LONG_DIGITS.search(code)
+    if match:
+        return match.group(1)
+    # 2. Fallback: any digit sequence (shorter products)
+    match = _ANY_DIGITS.search(code)
+    if match:
+        return match.group(1)
+    return code
+
+
+class SkuCatalog:
+    def __init__(self, packaging_units: dict = None, game_skus=None):
+        self.packaging_units = dict(packaging_units or {})
+        self.game_skus = frozenset(game_skus or ())
+        self._aliases = {}
+        self._lock = threading.Lock()
+        self._memo = lru_cache(maxsize=MEMO_SIZE)(canonical_sku)
+
+    def normalize(self, code) -> str:
+        """Canonical code of a raw SKU (alias table, then memoized rule)."""
+        try:
+            hit = self._aliases.get(code)
+        except TypeError:  # unhashable input
+            return canonical_sku(code)
+        if hit is not None:
+            return hit
+        return self._memo(code)
+
+    def register(self, codes) -> int:
+        """Precomputes aliases for raw codes (e.g. the Siigo product list). Returns how many were new."""
+        new = {}
+        for code in codes:
+            if code and code not in self._aliases and code not in new:
+                new[code] = canonical_sku(code)
+        if not new:
+            return 0
+        with self._lock:
+            room = ALIAS_LIMIT - len(self._aliases)
+            if room <= 0:
+                return 0
+            if len(new) > room:
+                new = dict(list(new.items())[:room])
+            # Copy-on-write: readers never see a dict being resized
+            aliases = dict(self._aliases)
+            aliases.update(new)
+            self._aliases = aliases
+        return len(new)
+
+    def normalize_many(self, codes) -> list:
+        """Batch version: each distinct code is resolved once."""
+        codes = list(codes)
+        resolved = {}
+        out = []
+        for code in codes:
+            try:
+                sku = resolved.get(code)
+                if sku is None:
+                    sku = resolved[code] = self.normalize(code)
+            except TypeError:
+                sku = canonical_sku(code)
+            out.append(sku)
+        return out
+
+    def normalize_series(self, series):
+        """pandas Series of raw codes -> Series of canonical codes (one lookup per distinct value)."""
+        series = series.fillna("")
+        return series.map({c: self.normalize(c) for c in series.unique()})
+
+    def packaging_unit(self, sku) -> int:
+        return self.packaging_units.get(self.normalize(sku), 1)
+
+    def stats(self) -> dict:
+        info = self._memo.cache_info()
+        return {
+            "aliases": len(self._aliases),
+            "memo_size": info.currsize,
+            "memo_hits": info.hits,
+            "memo_misses": info.misses,
+        }
+
+
+# Singleton global
+sku_catalog = SkuCatalog(PACKAGING_UNITS, GAME_SKUS)
@@ -1,109 +1,107 @@
+"""
+stock_history.py — Historial diario de stock y ventas por SKU.
+
+Built from the cached movement data instead of crawling Siigo per SKU: the
+FV coverage of the window is synced once (only missing days hit Siigo) and
+the daily sales come from the persisted `sales_rollup`. Every requested SKU
+becomes a row of a SKU x day matrix, and stock is reconstructed backwards
+from the current stock with one reverse cumulative sum, so ten SKUs cost
+the same as one.
+"""
 from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.services.config import get_config
+from app.services.movement_sync import sync_companies_async
+from app.services.sales_rollup import sales_rollup, SALES_DOC_TYPES
+from app.services.siigo_async import run_sync
 from app.services.utils import normalize_sku
 
-def get_product_history(target_sku: str, days: int, current_stock: float, movements_list: list):
+
+def _history_days(days: int) -> list:
+    """Dates of the chart: from today - days to today, inclusive."""
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=days)
+    return [(start_date + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days + 1)]
+
+
+def history_series(skus, dates, current_stocks, daily_sales) -> dict:
+    """
+    {sku: [{date, stock, sales}, ...]} ascending by date.
+
+    `daily_sales` is {day: {normalized_sku: qty}}; `current_stocks` maps each
+    requested SKU to its CURRENT stock. Sales are the only movements taken
+    into account (stock at the end of a day = current stock + sales after it).
+    """
+    skus = list(skus)
+    normalized = [normalize_sku(s) for s in skus]
+    row_of = {}
+    for i, n in enumerate(normalized):
+        row_of.setdefault(n, []).append(i)
+    day_index = {d: j for j, d in enumerate(dates)}
+
+    sales = np.zeros((len(skus), len(dates)))
+    for day, per_day in daily_sales.items():
+        j = day_index.get(day)
+        if j is None:
+            continue
+        for sku, qty in per_day.items():
+            for i in row_of.get(sku, ()):
+                sales[i, j] += qty
+
+    current = np.array([float(current_stocks.get(s) or 0) for s in skus]).reshape(-1, 1)
+    # Sales of the days AFTER each date: reverse cumsum minus the day itself
+    after = np.cumsum(sales[:, ::-1], axis=1)[:, ::-1] - sales
+    stock = np.maximum(0, current + after)  # No negative stock in chart
+
+    return {
+        sku: [
+            {"date": d, "stock": float(stock[i, j]), "sales": float(sales[i, j])}
+            for j, d in enumerate(dates)
+        ]
+        for i, sku in enumerate(skus)
+    }
+
+
+def get_products_history(skus, days: int = 30, current_stocks: dict = None) -> dict:
+    """
+    Daily stock vs sales for several SKUs at once, summed over all companies.
+
+    Returns {sku: [{date: 'YYYY-MM-DD', stock: N, sales: N}, ...]} sorted by date ASC.
+    """
+    current_stocks = current_stocks or {}
+    dates = _history_days(days)
+    start_str, end_str = dates[0], dates[-1]
+
+    companies = [c for c in get_config() if c.get("valid", False)]
+    sync_results = run_sync(sync_companies_async(
+        companies, start_str, end_str, doc_types=list(SALES_DOC_TYPES), read_result=False
+    ))
+
+    merged = {}
+    for company, (_, err) in zip(companies, sync_results):
+        name = company.get("name", "Unknown")
+        if err:
+            print(f"Error syncing history for {name}: {err} (using stored sales only)")
+        try:
+            daily = sales_rollup.daily_sales(name, start_str, end_str)
+        except Exception as e:
+            print(f"Error reading sales rollup for {name}: {e}")
+            continue
+        for day, per_day in daily.items():
+            bucket = merged.setdefault(day, {})
+            for sku, (qty, _) in per_day.items():
+                bucket[sku] = bucket.get(sku, 0.0) + qty
+
+    return history_series(skus, dates, current_stocks, merged)
+
+
+def get_product_history(target_sku: str, days: int, current_stock: float) -> list:
     """
     Reconstructs daily stock history and sales for a specific SKU.
-    
-    Args:
-        target_sku: Normalized SKU to analyze
-        days: Number of days to look back
-        current_stock: The CURRENT stock quantity in inventory
-        movements_list: List of movement objects (dicts) from the last N days
-        
+
     Returns:
         List of dicts: [{date: 'YYYY-MM-DD', stock: N, sales: N}, ...] sorted by date ASC
     """
-    target_sku = normalize_sku(target_sku)
-    
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=days)
-    
-    # 1. Bucket movements by date
-    # We need to distinguish IN (Purchases, Returns) vs OUT (Sales)
-    # Actually, we need to know the NET change per day to reconstruct stock.
-    
-    daily_changes = {} # Date -> Net Change
-    daily_sales = {}   # Date -> Sales Qty (Absolute)
-    
-    # Init buckets
-    curr = start_date
-    while curr <= end_date:
-        d_str = curr.strftime("%Y-%m-%d")
-        daily_changes[d_str] = 0.0
-        daily_sales[d_str] = 0.0
-        curr += timedelta(days=1)
-        
-    for mov in movements_list:
-        # Validate SKU
-        m_sku = normalize_sku(mov.get("code", ""))
-        # Also check product_code if code missing
-        if not m_sku: m_sku = normalize_sku(mov.get("product_code", ""))
-            
-        if m_sku != target_sku:
-            continue
-            
-        d_str = mov.get("date")
-        if not d_str or d_str not in daily_changes:
-            continue
-            
-        qty = float(mov.get("quantity", 0))
-        m_type = mov.get("type", "").upper() # ENTRADA / SALIDA
-        
-        # Determine strict impact on stock
-        # ENTRADA: Stock increases (+qty)
-        # SALIDA: Stock decreases (-qty)
-        
-        if m_type == "ENTRADA":
-            daily_changes[d_str] += qty
-        elif m_type == "SALIDA":
-            daily_changes[d_str] -= qty
-            
-            # Record strictly SALES (Invoice) for the green bars
-            # Assuming DocType FV is sales.
-            doc_type = mov.get("doc_type", "")
-            if doc_type in ["FV", "POS", "REM"]: # Add more sales types if needed
-                daily_sales[d_str] += qty
-
-    # 2. Reconstruct Backwards
-    # Stock[Today] is known.
-    # Stock[Yesterday] = Stock[Today] - Change[Today]
-    
-    # We need to iterate from Today -> Back to build the "Start of Day" stock?
-    # Or "End of Day" stock.
-    # Let's say the chart shows "End of Day" stock.
-    
-    # End Date (Today, or latest data point)
-    timeline = []
-    
-    # Sort dates desc
-    sorted_dates = sorted(daily_changes.keys(), reverse=True)
-    
-    running_stock = current_stock
-    
-    # We want to output Ascending.
-    # history[Last_Date].stock = current_stock
-    # history[Last_Date].sales = daily_sales[Last_Date]
-    # history[Last_Date-1].stock = current_stock - change[Last_Date]
-    
-    temp_history = []
-    
-    for d_str in sorted_dates:
-        # Snaphot at END of this day = running_stock
-        sales = daily_sales[d_str]
-        
-        temp_history.append({
-            "date": d_str,
-            "stock": max(0, running_stock), # No negative stock in chart
-            "sales": sales
-        })
-        
-        # To get Yesterday's End Stock, we SUBTRACT today's change.
-        # e.g. Today Start: 10. In: 5. Out: 3. Change: +2. End: 12.
-        # Yesterday End = Today Start = 10.
-        # Yesterday End = 12 - (+2) = 10. Correct.
-        change = daily_changes[d_str]
-        running_stock -= change
-        
-    # Reverse to get Chronological
-    return temp_history[::-1]
+    return get_products_history([target_sku], days, {target_sku: current_stock})[target_sku]
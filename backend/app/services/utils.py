@@ -1,44 +1,17 @@
 
 import pandas as pd
-import requests
 import io
+from app.services import http_client
+from app.services.sku_catalog import sku_catalog
 import re
 
 def normalize_sku(code):
     """
     Normalizes SKU to extract the main numeric code.
     Groups variations like 7007EX, EVO-7701, 7007EXENTO, etc. into their base numeric ID.
+    See sku_catalog for the rule and the alias table.
     """
-    if not code: return "N/A"
-    code = str(code).strip().upper()
-    
-    # Keep INSUMO products as is
-    if "INSUMO" in code: 
-        return code
-
-    # Remove common prefixes
-    code = code.replace("EVO-", "").replace("EVO", "").replace("E-", "")
-    
-    # Remove common suffixes (order matters: longest first)
-    # Removing "EXENTO" first avoids leaving "ENTO" if we removed "EX"
-    suffixes = ["EXENTO", "EX", ".1", "-1"]
-    for s in suffixes:
-        if code.endswith(s):
-             code = code[:-len(s)]
-             break
-
-    # 1. Try to find a 4+ digit sequence (Main standard products)
-    # This captures 7701 from 'EVO-7701', '7701EXENTO', '7701.1', etc.
-    match_long = re.search(r"(\d{4,})", code) # Find first sequence anywhere
-    if match_long:
-        return match_long.group(1)
-        
-    # 2. Fallback: Try to find any digit sequence (Shorter products)
-    match_any = re.search(r"(\d+)", code)
-    if match_any:
-        return match_any.group(1)
-        
-    return code
+    return sku_catalog.normalize(code)
 
 def fetch_google_sheet_inventory(sheet_url):
     try:
@@ -55,7 +28,9 @@ def fetch_google_sheet_inventory(sheet_url):
             clean_url = clean_url.replace("?&", "?").rstrip("?")
             
             try:
-                xl = pd.ExcelFile(clean_url)
+                response = http_client.get(clean_url, timeout=60)
+                response.raise_for_status()
+                xl = pd.ExcelFile(io.BytesIO(response.content))
                 
                 # Scan sheets for the best match
                 valid_df = None
@@ -100,7 +75,7 @@ def fetch_google_sheet_inventory(sheet_url):
                 raise ValueError(f"El link configurado no es un archivo válido de Google Sheets publicado o no tiene permisos de lectura: {str(e)}")
         else:
             # Fallback for CSV - dtype=str preserves '4.300' as text
-            response = requests.get(sheet_url)
+            response = http_client.get(sheet_url, timeout=60)
             response.raise_for_status()
             df = pd.read_csv(io.StringIO(response.content.decode("utf-8")), dtype=str)
             
@@ -0,0 +1,136 @@
+"""
+write_behind.py — Cola de escritura diferida (write-behind) para GCS.
+
+Uploads leave the request thread: `submit(key, job)` records the latest
+payload of a key and returns. Worker threads upload in arrival order with
+these rules:
+  - coalescing: several saves of a key before its upload starts become one
+    upload of the newest payload
+  - one upload per key at a time, so an older payload can never land after
+    a newer one (no last-writer-wins races between threads)
+  - bounded: with `max_pending` keys waiting, submit blocks (back-pressure)
+    instead of letting the backlog grow without limit
+  - failed uploads are retried with backoff; `flush()` waits for the backlog
+    (called on shutdown)
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+
+class WriteBehindQueue:
+    RETRIES = 3
+    RETRY_BACKOFF_S = 1.0
+
+    def __init__(self, upload, max_pending: int = 256, workers: int = 2, name: str = "write-behind"):
+        self._upload = upload  # upload(key, job)
+        self.max_pending = max_pending
+        self.name = name
+        self._pending = OrderedDict()  # key -> newest job, in first-submit order
+        self._active = set()           # keys being uploaded right now
+        self._cond = threading.Condition()
+        self._workers = workers
+        self._threads = []
+        self._stats = {"submitted": 0, "coalesced": 0, "uploaded": 0, "failed": 0, "blocked": 0}
+
+    def _ensure_workers(self):
+        # Caller holds the condition
+        if not self._threads:
+            for i in range(self._workers):
+                t = threading.Thread(target=self._run, daemon=True, name=f"{self.name}:{i}")
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, key: str, job, timeout: float = None) -> bool:
+        """Queues the newest payload of `key`. Blocks while the queue is full; False on timeout."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            self._ensure_workers()
+            self._stats["submitted"] += 1
+            if key in self._pending:
+                self._pending[key] = job  # coalesce: keep only the latest, same position
+                self._stats["coalesced"] += 1
+                return True
+            if len(self._pending) >= self.max_pending:
+                self._stats["blocked"] += 1
+            while len(self._pending) >= self.max_pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self._pending[key] = job
+            self._cond.notify_all()
+            return True
+
+    def _next(self):
+        # Caller holds the condition: oldest pending key not being uploaded
+        for key in self._pending:
+            if key not in self._active:
+                job = self._pending.pop(key)
+                self._active.add(key)
+                self._cond.notify_all()  # room for blocked submitters
+                return key, job
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                item = self._next()
+                while item is None:
+                    self._cond.wait()
+                    item = self._next()
+            key, job = item
+            try:
+                self._upload_with_retry(key, job)
+            finally:
+                with self._cond:
+                    self._active.discard(key)
+                    self._cond.notify_all()
+
+    def _upload_with_retry(self, key, job):
+        for attempt in range(1, self.RETRIES + 1):
+            try:
+                self._upload(key, job)
+                with self._cond:
+                    self._stats["uploaded"] += 1
+                return
+            except Exception as e:
+                if attempt == self.RETRIES:
+                    logging.error(f"[{self.name}] Upload failed for {key} after {attempt} attempts: {e}")
+                    with self._cond:
+                        self._stats["failed"] += 1
+                    return
+                time.sleep(self.RETRY_BACKOFF_S * attempt)
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Waits until every queued upload finished. False if `timeout` ran out first."""
+        deadline = time.time() + timeout
+        with self._cond:
+            while self._pending or self._active:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    logging.warning(f"[{self.name}] Flush timed out with {len(self._pending) + len(self._active)} uploads left")
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def wait(self, key: str, timeout: float = 30.0) -> bool:
+        """Waits until no upload of `key` is queued or running. False on timeout."""
+        deadline = time.time() + timeout
+        with self._cond:
+            while key in self._pending or key in self._active:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def has_pending(self, key: str) -> bool:
+        """True while an upload of `key` is queued or running (GCS still has an older copy)."""
+        with self._cond:
+            return key in self._pending or key in self._active
+
+    def stats(self) -> dict:
+        with self._cond:
+            return dict(self._stats, pending=len(self._pending), uploading=len(self._active))
@@ -0,0 +1,16 @@
+import pytest
+from app.services.cache import CacheService
+from app.services.movement_store import MovementStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """MovementStore over a local cache in tmp_path."""
+    monkeypatch.setenv("CACHE_MODE", "local")
+    monkeypatch.setenv("PERSISTENT_STORAGE_DIR", str(tmp_path))
+    return MovementStore(CacheService())
+
+
+def make_row(date, doc, code="7701", qty=1.0, doc_type="FV", **fields):
+    """Flat movement row as stored by MovementStore; extra columns go in `fields`."""
+    return {"date": date, "doc_type": doc_type, "doc_number": doc, "code": code, "quantity": qty, **fields}
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+from app.services import analytics
+
+
+class _FakeRollup:
+    def __init__(self, days):
+        self.days = days
+
+    def daily_sales(self, company, start, end):
+        return {d: v for d, v in self.days.get(company, {}).items() if start <= d <= end}
+
+
+def _ago(n):
+    return (datetime.now() - timedelta(days=n)).strftime("%Y-%m-%d")
+
+
+def test_windows_averages_and_trends_in_one_pass(monkeypatch):
+    async def fake_sync(companies, *a, **k):
+        return [([], None) for _ in companies]
+
+    monkeypatch.setattr(analytics, "get_config", lambda: [{"name": "A"}, {"name": "B", "valid": False}])
+    monkeypatch.setattr(analytics, "sync_companies_async", fake_sync)
+    monkeypatch.setattr(analytics, "sales_rollup", _FakeRollup({"A": {
+        _ago(1): {"7701": [6.0, 2]},    # inside every window, second half
+        _ago(4): {"3001": [5.0, 1]},    # 5-day window, first half
+        _ago(20): {"7701": [30.0, 3]},  # only the 30-day window, first half
+    }}))
+
+    res = analytics.calculate_sales_windows([5, 30], split_by_company=True)
+    avg5, trends5, audit5 = res[5]
+    avg30, trends30, audit30 = res[30]
+    assert avg5["A"] == {"7701": 1.2, "3001": 1.0}
+    assert trends5["A"] == {"7701": "up", "3001": "down"}
+    assert avg30["A"]["7701"] == 1.2 and trends30["A"]["7701"] == "down"
+    assert audit5["companies"] == {"A": 3, "B": "Skipped (Invalid Config)"} and audit30["total_movements"] == 6
+
+    averages, trends, _ = analytics.calculate_average_sales(days=30)
+    assert averages == {"7701": 1.2, "3001": round(5 / 30, 4)} and trends == {}
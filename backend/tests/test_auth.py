@@ -0,0 +1,63 @@
+import threading
+import time
+import pytest
+from app.services import auth
+
+
+@pytest.fixture
+def fake_auth(monkeypatch):
+    calls = []
+
+    def fake_request(data, headers):
+        calls.append(data["username"])
+        time.sleep(0.05)
+        return {"access_token": f"tok-{len(calls)}", "expires_in": 86400}
+
+    monkeypatch.setattr(auth, "_do_auth_request", fake_request)
+    monkeypatch.setattr(auth, "_token_cache", {})
+    return calls
+
+
+def test_token_is_cached_and_shared_by_concurrent_callers(fake_auth):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(auth.get_auth_token("u", "k"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["tok-1"] * 8
+    assert auth.get_auth_token("u", "k") == "tok-1"
+    assert fake_auth == ["u"]
+
+
+def test_expiring_token_is_refreshed_in_background(fake_auth):
+    assert auth.get_auth_token("u", "k") == "tok-1"
+    auth._token_cache[("u", "SiigoApi")]["expires_at"] = time.time() + 10
+    # Still served while the refresh runs
+    assert auth.get_auth_token("u", "k") == "tok-1"
+    time.sleep(0.2)
+    assert auth.get_auth_token("u", "k") == "tok-2"
+
+
+def test_invalidated_or_rotated_credentials_authenticate_again(fake_auth):
+    auth.get_auth_token("u", "k")
+    auth.invalidate_token("Bearer tok-1")
+    assert auth.get_auth_token("u", "k") == "tok-2"
+    assert auth.get_auth_token("u", "new-key") == "tok-3"
+
+
+def test_failed_background_refresh_backs_off(fake_auth, monkeypatch):
+    assert auth.get_auth_token("u", "k") == "tok-1"
+    monkeypatch.setattr(auth, "_refresher", auth.Revalidator("test-auth"))
+    failures = []
+
+    def failing_request(data, headers):
+        failures.append(data["username"])
+        raise RuntimeError("auth down")
+
+    monkeypatch.setattr(auth, "_do_auth_request", failing_request)
+    auth._token_cache[("u", "SiigoApi")]["expires_at"] = time.time() + 10
+    for _ in range(5):
+        assert auth.get_auth_token("u", "k") == "tok-1"
+        time.sleep(0.05)
+    assert failures == ["u"]
@@ -0,0 +1,64 @@
+import time
+
+from app.routers import auth_router
+from app.services import roles
+from app.services.cache import CacheService
+
+
+def test_verified_tokens_are_cached_until_exp(monkeypatch):
+    calls = []
+
+    def fake_verify(token):
+        calls.append(token)
+        return {"email": "ana@x.com", "exp": time.time() + 3600}
+
+    monkeypatch.setattr(auth_router.auth, "verify_id_token", fake_verify)
+    monkeypatch.setattr(auth_router, "_verified_tokens", auth_router.MemCache(sweep_interval=0))
+    monkeypatch.setattr(roles, "get_all_roles", lambda ttl=None: {"ana@x.com": "admin"})
+    monkeypatch.setattr(roles, "_role_map", {"version": -1, "loaded_at": 0.0, "roles": {}})
+
+    for _ in range(10):
+        assert auth_router.verify_token(None, "tok-1") == {"email": "ana@x.com", "role": "admin"}
+    assert calls == ["tok-1"]
+
+    # A token about to expire is verified but not cached
+    monkeypatch.setattr(auth_router.auth, "verify_id_token", lambda t: calls.append(t) or {"email": "ana@x.com", "exp": time.time() + 5})
+    auth_router.verify_token(None, "tok-2")
+    auth_router.verify_token(None, "tok-2")
+    assert calls.count("tok-2") == 2
+
+
+def test_role_map_is_invalidated_on_change(tmp_path, monkeypatch):
+    monkeypatch.setenv("CACHE_MODE", "local")
+    monkeypatch.setenv("PERSISTENT_STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(roles, "cache", CacheService())
+    monkeypatch.setattr(roles, "_role_map", {"version": -1, "loaded_at": 0.0, "roles": {}})
+
+    loads = []
+    get_all = roles.get_all_roles
+    monkeypatch.setattr(roles, "get_all_roles", lambda ttl=None: loads.append(1) or get_all(ttl))
+
+    assert roles.get_user_role("luis@x.com") == "viewer"
+    assert roles.get_user_role("luis@x.com") == "viewer" and len(loads) == 1
+    roles.set_user_role("luis@x.com", "admin")
+    assert roles.get_user_role("luis@x.com") == "admin"
+    roles.remove_user_role("luis@x.com")
+    assert roles.get_user_role("luis@x.com") == "viewer"
+
+
+def test_unverified_fallback_tokens_are_not_cached(monkeypatch):
+    import base64
+    import json
+
+    def reject(token):
+        raise ValueError("not a firebase token")
+
+    payload = base64.urlsafe_b64encode(json.dumps({"email": "eva@x.com", "exp": time.time() + 3600}).encode()).decode().rstrip("=")
+    token = f"h.{payload}.s"
+    monkeypatch.setattr(auth_router.auth, "verify_id_token", reject)
+    monkeypatch.setattr(auth_router, "_verified_tokens", auth_router.MemCache(sweep_interval=0))
+    monkeypatch.setattr(roles, "get_all_roles", lambda ttl=None: {})
+    monkeypatch.setattr(roles, "_role_map", {"version": -1, "loaded_at": 0.0, "roles": {}})
+
+    assert auth_router.verify_token(None, token)["email"] == "eva@x.com"
+    assert auth_router._verified_tokens.stats()["total_keys"] == 0
@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+
+from app.services.cache import CacheService
+
+
+def _service(tmp_path, monkeypatch):
+    monkeypatch.setenv("CACHE_MODE", "local")
+    monkeypatch.setenv("PERSISTENT_STORAGE_DIR", str(tmp_path))
+    return CacheService()
+
+
+def test_l1_serves_decoded_object_until_the_file_changes(tmp_path, monkeypatch):
+    svc = _service(tmp_path, monkeypatch)
+    svc.save("roles_v1.json", {"a@x.com": "admin"})
+
+    first = svc.load("roles_v1.json")
+    assert svc.load("roles_v1.json") is first  # no re-parse
+    assert svc.l1_stats()["prefixes"]["roles"]["hits"] == 1
+
+    # Another process rewrites the file: mtime/size change invalidates the L1 copy
+    path = os.path.join(str(tmp_path), "roles_v1.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"b@x.com": "viewer", "c@x.com": "viewer"}, f)
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 10**9,) * 2)
+    assert svc.load("roles_v1.json") == {"b@x.com": "viewer", "c@x.com": "viewer"}
+
+    svc.save("roles_v1.json", {"d@x.com": "admin"})
+    assert svc.load("roles_v1.json") == {"d@x.com": "admin"}
+
+    mutable = svc.load_mutable("roles_v1.json")
+    mutable["e@x.com"] = "viewer"
+    assert "e@x.com" not in svc.load("roles_v1.json")
+
+
+def test_l1_respects_ttl(tmp_path, monkeypatch):
+    svc = _service(tmp_path, monkeypatch)
+    svc.save("k.json", [1, 2])
+    assert svc.load("k.json") == [1, 2]
+    path = os.path.join(str(tmp_path), "k.json")
+    old = os.stat(path).st_mtime - 7200
+    os.utime(path, (old, old))
+    assert svc.load("k.json") is None and svc.load("k.json", ttl=None) == [1, 2]
+
+
+class _FakeBlob:
+    def __init__(self, bucket, key):
+        self.bucket, self.key = bucket, key
+        self.content_encoding = None
+        self.generation = bucket.objects.get(key, (None, None))[1]
+
+    def download_as_bytes(self, if_generation_not_match=None):
+        from google.api_core.exceptions import NotFound, NotModified
+        if self.key not in self.bucket.objects:
+            raise NotFound(self.key)
+        payload, generation = self.bucket.objects[self.key]
+        if if_generation_not_match == generation:
+            raise NotModified(self.key)
+        self.bucket.downloads += 1
+        self.generation = generation
+        return payload
+
+    def upload_from_string(self, payload, content_type=None, if_generation_match=None):
+        from google.api_core.exceptions import PreconditionFailed
+        current = self.bucket.objects.get(self.key, (None, 0))[1]
+        if if_generation_match is not None and if_generation_match != current:
+            raise PreconditionFailed(self.key)
+        self.bucket.counter += 1
+        self.generation = self.bucket.counter
+        self.bucket.objects[self.key] = (payload, self.generation)
+
+
+class _FakeBucket:
+    def __init__(self):
+        self.objects, self.counter, self.downloads = {}, 0, 0
+
+    def blob(self, key):
+        return _FakeBlob(self, key)
+
+
+def _cloud_service(tmp_path, monkeypatch, bucket):
+    import app.services.cache as cache_module
+    monkeypatch.setattr(cache_module, "WRITE_BEHIND", False)
+    svc = _service(tmp_path, monkeypatch)
+    svc.mode, svc.client, svc.bucket = "cloud", object(), bucket
+    return svc
+
+
+def test_expired_local_copy_is_revalidated_by_generation(tmp_path, monkeypatch):
+    bucket = _FakeBucket()
+    svc = _cloud_service(tmp_path, monkeypatch, bucket)
+    svc.save("k.json", {"v": 1})
+    svc.save_bytes("p.parquet", b"PAR1")
+
+    # Past the TTL but GCS still holds the generation we uploaded: no download
+    assert svc.load("k.json", ttl=0) == {"v": 1}
+    assert svc.load_bytes("p.parquet", ttl=0) == b"PAR1"
+    assert bucket.downloads == 0
+
+    # Another instance overwrites the object: the new generation is downloaded once
+    other = _cloud_service(tmp_path / "other", monkeypatch, bucket)
+    other.save("k.json", {"v": 2})
+    assert svc.load("k.json", ttl=0) == {"v": 2}
+    assert svc.load("k.json", ttl=0) == {"v": 2}
+    assert bucket.downloads == 1
+
+
+def test_generation_survives_restart(tmp_path, monkeypatch):
+    bucket = _FakeBucket()
+    _cloud_service(tmp_path, monkeypatch, bucket).save("k.json", [1])
+    restarted = _cloud_service(tmp_path, monkeypatch, bucket)
+    assert restarted.load("k.json", ttl=0) == [1]
+    assert bucket.downloads == 0
+
+
+def test_update_serializes_writers_in_process(tmp_path, monkeypatch):
+    svc = _service(tmp_path, monkeypatch)
+
+    def append(i):
+        svc.update("actas_history.json", lambda rows: rows + [i], default=[])
+
+    threads = [threading.Thread(target=append, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(svc.load("actas_history.json", ttl=None)) == list(range(20))
+    # None from the mutator leaves the key untouched
+    assert svc.update("actas_history.json", lambda rows: None) == svc.load("actas_history.json", ttl=None)
+
+
+def test_update_merges_and_retries_when_another_instance_wins(tmp_path, monkeypatch):
+    bucket = _FakeBucket()
+    svc = _cloud_service(tmp_path, monkeypatch, bucket)
+    other = _cloud_service(tmp_path / "other", monkeypatch, bucket)
+    svc.save("roles_v1.json", {"a@x.com": "admin"})
+    calls = []
+
+    def add_viewer(roles):
+        calls.append(dict(roles))
+        if len(calls) == 1:
+            # Another instance writes between our read and our upload
+            other.update("roles_v1.json", lambda r: {**r, "b@x.com": "admin"})
+        roles["c@x.com"] = "viewer"
+        return roles
+
+    expected = {"a@x.com": "admin", "b@x.com": "admin", "c@x.com": "viewer"}
+    assert svc.update("roles_v1.json", add_viewer) == expected
+    assert calls == [{"a@x.com": "admin"}, {"a@x.com": "admin", "b@x.com": "admin"}]
+    assert svc._decode_json(bucket.objects["roles_v1.json"][0]) == expected
+    assert svc.load("roles_v1.json") == expected
@@ -0,0 +1,30 @@
+import time
+
+from app.routers import distribution_router
+from app.services.cache import CacheService
+
+
+def test_split_averages_refresh_both_windows_once(tmp_path, monkeypatch):
+    monkeypatch.setenv("CACHE_MODE", "local")
+    monkeypatch.setenv("PERSISTENT_STORAGE_DIR", str(tmp_path))
+    svc = CacheService()
+    monkeypatch.setattr(distribution_router, "cache", svc)
+    calls = []
+
+    def fake_windows(windows, split_by_company=False):
+        calls.append(tuple(windows))
+        time.sleep(0.05)
+        return {w: ({"ACME": {"7701": w}}, None) for w in windows}
+
+    monkeypatch.setattr(distribution_router, "calculate_sales_windows", fake_windows)
+    assert distribution_router.get_split_averages(30) == ({"ACME": {"7701": 30}}, {"ACME": {"7701": 5}})
+    assert calls == [(5, 30)]
+
+    # Both windows stale: served from cache while ONE background pass recomputes the pair
+    key = distribution_router._split_averages_key([5, 30])
+    entry = dict(svc.load(key, ttl=None), timestamp=time.time() - distribution_router.SPLIT_AVERAGES_TTL_S - 1)
+    svc.save(key, entry)
+    for _ in range(3):
+        assert distribution_router.get_split_averages(30)[0] == {"ACME": {"7701": 30}}
+    time.sleep(0.2)
+    assert calls == [(5, 30), (5, 30)]
@@ -0,0 +1,32 @@
+import email.message
+import urllib.request
+from app.services import http_client
+
+
+def test_one_session_per_host_with_pool_and_gzip():
+    a = http_client.get_session("https://api.siigo.com/v1/products")
+    b = http_client.get_session("https://API.siigo.com/auth")
+    c = http_client.get_session("https://docs.google.com/spreadsheets/d/x")
+    assert a is b and a is not c
+    assert "gzip" in a.headers["Accept-Encoding"]
+    assert a.get_adapter("https://api.siigo.com")._pool_maxsize == http_client.POOL_SIZE
+
+
+def test_timeout_keeps_read_part_and_caps_connect():
+    assert http_client._timeout(30) == (http_client.CONNECT_TIMEOUT, 30)
+    assert http_client._timeout(2) == (2, 2)
+    assert http_client._timeout((1, 9)) == (1, 9)
+
+
+
+class _SetCookieResponse:
+    def info(self):
+        msg = email.message.Message()
+        msg["Set-Cookie"] = "sid=acme; Path=/"
+        return msg
+
+
+def test_sessions_do_not_keep_cookies_between_companies():
+    session = http_client.get_session("https://api.siigo.com/v1/products")
+    session.cookies.extract_cookies(_SetCookieResponse(), urllib.request.Request("https://api.siigo.com/v1/products"))
+    assert len(session.cookies) == 0
@@ -0,0 +1,47 @@
+import threading
+import time
+
+from app.routers import inventory_router
+
+
+def test_concurrent_callers_share_one_rebuild(monkeypatch):
+    calls = []
+    release = threading.Event()
+    saved = {}
+
+    def fake_rebuild(force_refresh, priority):
+        calls.append(force_refresh)
+        release.wait(2)
+        return {"count": 1, "data": [{"code": "7701"}], "errors": [], "timestamp": time.time()}
+
+    monkeypatch.setattr(inventory_router, "_rebuild_inventory_snapshot", fake_rebuild)
+    monkeypatch.setattr(inventory_router.cache, "load", lambda key, ttl=3600: saved.get(key))
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(inventory_router.refresh_inventory_snapshot())) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.2)
+    release.set()
+    for t in threads:
+        t.join()
+    assert calls == [False] and len(results) == 5 and all(r is results[0] for r in results)
+
+    # Stale snapshot: served immediately while one background rebuild runs
+    saved[inventory_router.SNAPSHOT_KEY] = {"count": 0, "data": [], "errors": [], "timestamp": time.time() - 1000}
+    release.clear()
+    stale = [inventory_router.get_consolidated_inventory(user={"role": "admin"}, force_refresh=False) for _ in range(3)]
+    assert all(r["count"] == 0 and r["freshness"]["stale"] for r in stale)
+    release.set()
+    for _ in range(50):
+        if len(calls) == 2 and not inventory_router.cache._revalidator.refreshing(inventory_router.SNAPSHOT_KEY):
+            break
+        time.sleep(0.02)
+    assert calls == [False, False]
+
+
+def test_forced_sales_averages_carry_fresh_metadata(monkeypatch):
+    monkeypatch.setattr(inventory_router, "_compute_sales_averages",
+                        lambda days: {"days": days, "averages": {}, "timestamp": time.time()})
+    res = inventory_router.get_sales_averages(user={}, days=30, force_refresh=True)
+    assert res["freshness"]["age_s"] == 0 and res["freshness"]["stale"] is False
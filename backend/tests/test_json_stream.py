@@ -0,0 +1,22 @@
+import json
+import math
+from app.services import json_stream
+from app.services.movement_records import MovementDoc, MovementLine
+
+
+def _decode(rows, **fields):
+    return json.loads(b"".join(json_stream.iter_rows_json(rows, chunk_rows=2, **fields)))
+
+
+def test_chunked_payload_is_valid_json_with_nan_as_null():
+    rows = [{"code": str(i), "price": math.nan if i == 3 else float(i)} for i in range(5)]
+    out = _decode(rows, count=5, errors=[])
+    assert out["count"] == 5 and out["errors"] == []
+    assert [r["code"] for r in out["data"]] == ["0", "1", "2", "3", "4"]
+    assert out["data"][3]["price"] is None
+
+
+def test_empty_rows_and_compact_lines():
+    assert _decode([]) == {"data": []}
+    line = MovementLine(MovementDoc(date="2024-01-01", doc_type="FV", doc_number="FV-1"), code="7701", quantity=1.0)
+    assert _decode([line], count=1)["data"][0]["doc_number"] == "FV-1"
@@ -0,0 +1,115 @@
+import threading
+import time
+
+from app.services.mem_cache import MemCache
+
+
+def _wait(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_stale_value_is_served_while_one_refresh_runs():
+    mc = MemCache()
+    loads = []
+    gate = threading.Event()
+
+    def loader():
+        loads.append(1)
+        if len(loads) > 1:
+            gate.wait(2)
+        return len(loads)
+
+    assert mc.get_or_set("k", loader, ttl=0.05, stale_ttl=10) == 1
+    time.sleep(0.1)
+    assert mc.get("k") is None and mc.get_stale("k") == 1
+    value, meta = mc.get_or_set_meta("k", loader, ttl=0.05, stale_ttl=10)
+    assert value == 1 and meta["stale"] and meta["refreshing"]
+    assert [mc.get_or_set("k", loader, ttl=0.05, stale_ttl=10) for _ in range(3)] == [1, 1, 1]
+    gate.set()
+    _wait(lambda: mc.get("k") == 2)
+    assert len(loads) == 2 and mc.get("k") == 2
+
+
+def test_hard_miss_is_single_flight_and_delete_drops_inflight_refresh():
+    mc = MemCache()
+    gate = threading.Event()
+    loads = []
+
+    def slow():
+        loads.append(1)
+        gate.wait(2)
+        return "old"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(mc.get_or_set("k", slow, ttl=60))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    _wait(lambda: len(loads) == 1)
+    mc.delete("k")  # a write happened while loading
+    gate.set()
+    for t in threads:
+        t.join()
+    assert results == ["old"] * 4 and len(loads) == 1
+    assert mc.get("k") is None
+
+
+def test_failed_refresh_backs_off():
+    mc = MemCache()
+    mc.set("k", "v", ttl=0, stale_ttl=60)
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise RuntimeError("firestore down")
+
+    assert mc.get_or_set("k", broken, ttl=0, stale_ttl=60) == "v"
+    _wait(lambda: mc._revalidator.backing_off("k"))
+    assert mc.get_or_set("k", broken, ttl=0, stale_ttl=60) == "v"
+    time.sleep(0.05)
+    assert len(calls) == 1
+
+
+def test_lru_bounds_bytes_and_prefix_metrics():
+    mc = MemCache(max_entries=3, max_bytes=10_000, sweep_interval=0)
+    for i in range(4):
+        mc.set(f"insumos:{i}", i, ttl=60)
+    assert mc.get("insumos:0") is None  # evicted (least recently used)
+    assert mc.get("insumos:1") == 1     # touch: now most recent
+    mc.set("ordenes:all", "x" * 100, ttl=60)
+    assert mc.get("insumos:2") is None and mc.get("insumos:1") == 1
+
+    mc.set("big:all", "x" * 20_000, ttl=60)  # larger than the budget: not cached
+    assert mc.get("big:all") is None
+
+    stats = mc.stats()
+    assert stats["total_keys"] == 3 and stats["bytes"] <= 10_000
+    ins = stats["prefixes"]["insumos"]
+    assert ins["evictions"] == 2 and ins["hits"] == 2 and ins["misses"] == 2 and ins["keys"] == 2
+    assert stats["prefixes"]["ordenes"]["bytes"] > 100
+
+
+def test_sweep_and_delete_all():
+    mc = MemCache(sweep_interval=0)
+    mc.set("a:1", 1, ttl=0)
+    mc.set("a:2", 2, ttl=60)
+    time.sleep(0.01)
+    assert mc.sweep() == 1 and mc.stats()["prefixes"]["a"]["expirations"] == 1
+    mc.delete_all()
+    assert mc.get("a:2") is None and mc.stats()["bytes"] == 0
+
+
+def test_metric_groups_are_bounded(monkeypatch):
+    from app.services import mem_cache as mod
+
+    monkeypatch.setattr(mod, "MAX_METRIC_GROUPS", 3)
+    mc = MemCache(sweep_interval=0)
+    mc.set("sales_rollup_A.json", 1, 60)
+    mc.set("sales_rollup_B.json", 1, 60)
+    assert mc.get("sales_rollup_A.json") == 1 and mc.get("sales_rollup_B.json") == 1
+    for i in range(10):
+        mc.get(f"key{i}.json")
+    prefixes = mc.stats()["prefixes"]
+    assert prefixes["sales"]["hits"] == 2 and prefixes["sales"]["keys"] == 2
+    assert prefixes[mod.OTHER_GROUP]["misses"] == 8 and len(prefixes) == 4
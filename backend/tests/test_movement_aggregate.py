@@ -0,0 +1,38 @@
+import pytest
+from app.services import movement_aggregate
+from app.services.mem_cache import MemCache
+from conftest import make_row
+
+
+@pytest.fixture
+def store(store, monkeypatch):
+    monkeypatch.setattr(movement_aggregate, "movement_store", store)
+    monkeypatch.setattr(movement_aggregate, "mem_cache", MemCache())
+    return store
+
+
+def test_group_by_sku_and_month(store):
+    store.replace_range("A", "2024-01-01", "2024-02-29", [
+        make_row("2024-01-02", "FV-1", "EVO-7701", 2, total=20), make_row("2024-01-02", "FV-1", "7701EX", 1, total=10),
+        make_row("2024-02-10", "FV-2", "7701", 4, total=40),
+    ])
+    store.replace_range("B", "2024-01-01", "2024-01-31", [make_row("2024-01-05", "FV-1", "3001", 1, total=5)])
+
+    res = movement_aggregate.aggregate_movements(["A", "B"], "2024-01-01", "2024-02-29", ["sku", "month"])
+    groups = {(g["sku"], g["month"]): g for g in res["groups"]}
+    assert groups[("7701", "2024-01")]["quantity"] == 3 and groups[("7701", "2024-01")]["documents"] == 1
+    assert groups[("7701", "2024-02")]["value"] == 40
+    assert res["totals"] == {"quantity": 8.0, "value": 75.0, "lines": 4, "documents": 3}
+
+
+def test_cache_is_invalidated_when_partition_changes(store):
+    store.replace_range("A", "2024-01-01", "2024-01-31", [make_row("2024-01-02", "FV-1", "7701", 1, total=10)])
+    first = movement_aggregate.aggregate_movements(["A"], "2024-01-01", "2024-01-31", ["week"])
+    assert first["groups"][0]["week"] == "2024-01-01"
+
+    store.replace_range("A", "2024-01-01", "2024-01-31", [make_row("2024-01-02", "FV-1", "7701", 5, total=50)])
+    second = movement_aggregate.aggregate_movements(["A"], "2024-01-01", "2024-01-31", ["week"])
+    assert second["totals"]["quantity"] == 5
+
+    with pytest.raises(movement_aggregate.AggregateError):
+        movement_aggregate.aggregate_movements(["A"], "2024-01-01", "2024-01-31", ["nope"])
@@ -0,0 +1,41 @@
+import pytest
+from app.services import movement_query
+from conftest import make_row
+
+
+@pytest.fixture
+def store(store, monkeypatch):
+    monkeypatch.setattr(movement_query, "movement_store", store)
+    return store
+
+
+def _row(company, date, doc, code, warehouse="Bodega Principal Rionegro"):
+    return make_row(date, doc, code, warehouse=warehouse, company=company, client="Cliente " + company)
+
+
+def test_cursor_pages_merge_companies_in_order(store):
+    store.replace_range("A", "2024-01-01", "2024-01-31", [
+        _row("A", "2024-01-02", "FV-1", "7701"), _row("A", "2024-01-02", "FV-1", "7702"), _row("A", "2024-01-05", "FV-2", "7701"),
+    ])
+    store.replace_range("B", "2024-01-01", "2024-01-31", [_row("B", "2024-01-03", "FV-9", "7701")])
+
+    seen, cursor = [], None
+    while True:
+        page = movement_query.query_movements(["A", "B"], "2024-01-01", "2024-01-31", limit=2, cursor=cursor,
+                                              fields=["company", "doc_number", "code"])
+        seen.extend((r["company"], r["doc_number"], r["code"]) for r in page["data"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == [("A", "FV-1", "7701"), ("A", "FV-1", "7702"), ("B", "FV-9", "7701"), ("A", "FV-2", "7701")]
+
+
+def test_predicates_and_projection(store):
+    store.replace_range("A", "2024-01-01", "2024-01-31", [
+        _row("A", "2024-01-02", "FV-1", "EVO-7701"), _row("A", "2024-01-03", "FV-2", "3001", warehouse="Bodega Libre"),
+    ])
+    page = movement_query.query_movements(["A"], "2024-01-01", "2024-01-31", skus=["7701"], warehouses=["rionegro"])
+    assert [r["doc_number"] for r in page["data"]] == ["FV-1"] and page["next_cursor"] is None
+
+    with pytest.raises(movement_query.QueryError):
+        movement_query.query_movements(["A"], "2024-01-01", "2024-01-31", fields=["nope"])
@@ -0,0 +1,23 @@
+from app.services.movement_records import MovementDoc, MovementLine, lines_from_rows, rows_from_lines, set_company
+
+
+def test_lines_share_document_fields_and_flatten_on_output():
+    doc = MovementDoc(date="2024-01-10", doc_type="FV", doc_number="FV-1", seller="Ana", type="SALIDA")
+    lines = [MovementLine(doc, code="7701", quantity=2.0), MovementLine(doc, code="7702", quantity=1.0)]
+    set_company(lines, "ACME")
+
+    assert lines[1].doc_type == "FV" and lines[1].company == "ACME"
+    rows = rows_from_lines(lines)
+    assert rows[0]["seller"] == "Ana" and rows[1]["code"] == "7702"
+    assert list(rows[0])[:4] == ["date", "doc_type", "doc_number", "provider_doc"]
+
+
+def test_rows_round_trip_dedupes_documents():
+    rows = [
+        {"date": "2024-01-10", "doc_type": "FV", "doc_number": "FV-1", "code": "7701", "quantity": 1.0, "company": "ACME"},
+        {"date": "2024-01-10", "doc_type": "FV", "doc_number": "FV-1", "code": "7702", "quantity": 3.0, "company": "ACME"},
+        {"date": "2024-01-11", "doc_type": "NC", "doc_number": "NC-1", "code": "7701", "quantity": 1.0, "company": "ACME"},
+    ]
+    lines = lines_from_rows(rows)
+    assert lines[0].doc is lines[1].doc and lines[2].doc is not lines[0].doc
+    assert [r["quantity"] for r in rows_from_lines(lines)] == [1.0, 3.0, 1.0]
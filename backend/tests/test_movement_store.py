@@ -0,0 +1,107 @@
+from app.services.movement_store import MovementStore
+from conftest import make_row
+
+
+def test_replace_range_only_rewrites_touched_months(store):
+    store.replace_range("ACME", "2024-01-01", "2024-02-29", [make_row("2024-01-10", "FV-1"), make_row("2024-02-03", "FV-2")])
+    manifest = store.load_manifest("ACME")
+    assert set(manifest["months"]) == {"2024-01", "2024-02"}
+
+    store.replace_range("ACME", "2024-02-01", "2024-02-29", [make_row("2024-02-20", "FV-3")])
+    rows = store.read_range("ACME", "2024-01-01", "2024-02-29")
+    assert [r["doc_number"] for r in rows] == ["FV-1", "FV-3"]
+    assert rows[0]["quantity"] == 1.0
+
+
+def test_read_range_filters_dates_and_doc_types(store):
+    store.replace_range("ACME", "2024-03-01", "2024-03-31", [
+        make_row("2024-03-01", "FV-1"), make_row("2024-03-15", "NC-1", doc_type="NC"), make_row("2024-03-31", "FV-2"),
+    ])
+    assert len(store.read_range("ACME", "2024-03-02", "2024-03-31")) == 2
+    assert [r["doc_number"] for r in store.read_range("ACME", "2024-03-01", "2024-03-31", ["NC"])] == ["NC-1"]
+    summary = store.summary("ACME")
+    assert (summary["min_date"], summary["max_date"], summary["count"]) == ("2024-03-01", "2024-03-31", 3)
+
+
+def test_legacy_history_is_migrated(store):
+    store.cache.save("history_ACME.json", [make_row("2023-12-01", "FV-9"), make_row("2024-01-02", "FV-10")])
+    assert set(store.load_manifest("ACME")["months"]) == {"2023-12", "2024-01"}
+    assert len(store.read_range("ACME", "2023-01-01", "2024-12-31")) == 2
+
+
+def test_plan_gaps_respects_doc_type_coverage(store):
+    assert store.plan_gaps("ACME", "2024-01-15", "2024-03-10") == [("2024-01-01", "2024-03-31")]
+
+    store.replace_range("ACME", "2024-01-01", "2024-02-29", [make_row("2024-01-10", "FV-1")], doc_types=["FV"])
+    # FV is complete for Jan-Feb, NC is not
+    assert store.plan_gaps("ACME", "2024-01-01", "2024-02-29", ["FV"]) == []
+    assert store.plan_gaps("ACME", "2024-01-01", "2024-02-29", ["NC"]) == [("2024-01-01", "2024-02-29")]
+
+    # Fetching NC must not drop the FV rows of the same month
+    store.replace_range("ACME", "2024-01-01", "2024-01-31", [make_row("2024-01-20", "NC-1", doc_type="NC")], doc_types=["NC"])
+    assert [r["doc_number"] for r in store.read_range("ACME", "2024-01-01", "2024-01-31")] == ["FV-1", "NC-1"]
+    assert store.plan_gaps("ACME", "2024-01-01", "2024-02-29", ["FV", "NC"]) == [("2024-02-01", "2024-02-29")]
+
+
+def test_plan_gaps_resumes_partial_month(store):
+    store.replace_range("ACME", "2024-05-01", "2024-05-12", [make_row("2024-05-02", "FV-1")])
+    assert store.plan_gaps("ACME", "2024-05-01", "2024-05-20") == [("2024-05-13", "2024-05-31")]
+
+
+def test_sync_ending_today_keeps_today_as_gap(store, monkeypatch):
+    from app.services import movement_store as ms
+    monkeypatch.setattr(ms, "_today", lambda: "2024-07-15")
+    store.replace_range("ACME", "2024-07-01", "2024-07-15", [make_row("2024-07-15", "FV-1")])
+    assert store.plan_gaps("ACME", "2024-07-01", "2024-07-15") == [("2024-07-15", "2024-07-15")]
+
+    # A fetch of today alone on the 1st covers nothing
+    monkeypatch.setattr(ms, "_today", lambda: "2024-08-01")
+    store.replace_range("ACME", "2024-08-01", "2024-08-01", [])
+    assert store.plan_gaps("ACME", "2024-08-01", "2024-08-01") == [("2024-08-01", "2024-08-01")]
+
+
+def test_secondary_index_lookups_skip_unmatched_months(store, monkeypatch):
+    store.replace_range("ACME", "2024-01-01", "2024-02-29", [
+        dict(make_row("2024-01-05", "FV-1", code="EVO-7701"), nit="900"),
+        dict(make_row("2024-01-06", "FV-2", code="3001"), nit="800"),
+        dict(make_row("2024-02-07", "FV-3", code="3001"), nit="900"),
+    ])
+    assert [r["doc_number"] for r in store.lookup("ACME", skus=["7701EX"])] == ["FV-1"]
+    assert [r["doc_number"] for r in store.lookup("ACME", nits=["900"])] == ["FV-1", "FV-3"]
+    assert [r["doc_number"] for r in store.lookup("ACME", skus=["3001"], nits=["900"])] == ["FV-3"]
+
+    opened = []
+    load_bytes = store.cache.load_bytes
+    monkeypatch.setattr(store.cache, "load_bytes", lambda key, ttl=3600: opened.append(key) or load_bytes(key, ttl))
+    assert [r["doc_number"] for r in store.lookup("ACME", doc_numbers=["FV-2"])] == ["FV-2"]
+    assert all("2024-02" not in key for key in opened)
+
+
+def test_stale_index_is_rebuilt(store):
+    store.replace_range("ACME", "2024-03-01", "2024-03-31", [make_row("2024-03-01", "FV-1")])
+    store.cache.save("movements_ACME_2024-03_index.json", {"version": 1, "checksum": "old", "sku": {}, "doc_number": {}, "nit": {}})
+    assert store.positions("ACME", "2024-03", skus=["7701"]) == [0]
+
+
+def test_concurrent_instances_keep_each_others_rows_and_coverage(tmp_path, monkeypatch):
+    from test_cache import _FakeBucket, _cloud_service
+
+    bucket = _FakeBucket()
+    a = MovementStore(_cloud_service(tmp_path / "a", monkeypatch, bucket))
+    b = MovementStore(_cloud_service(tmp_path / "b", monkeypatch, bucket))
+    original = a.cache.update_bytes
+    raced = []
+
+    def update_bytes(key, mutator, *args):
+        if not raced:
+            # Instance B writes the same month after A loaded its manifest, before A's partition lands
+            raced.append(b.replace_range("ACME", "2024-09-01", "2024-09-30", [make_row("2024-09-15", "NC-B", doc_type="NC")], ["NC"]))
+        return original(key, mutator, *args)
+
+    monkeypatch.setattr(a.cache, "update_bytes", update_bytes)
+    a.replace_range("ACME", "2024-09-01", "2024-09-10", [make_row("2024-09-05", "FV-A")], ["FV"])
+
+    c = MovementStore(_cloud_service(tmp_path / "c", monkeypatch, bucket))
+    assert [r["doc_number"] for r in c.read_range("ACME", "2024-09-01", "2024-09-30")] == ["FV-A", "NC-B"]
+    coverage = c.load_manifest("ACME")["months"]["2024-09"]["coverage"]
+    assert coverage["FV"] == "2024-09-10" and coverage["NC"] == "2024-09-30"
@@ -0,0 +1,93 @@
+import pytest
+from app.services import movement_sync
+from app.services.movement_records import MovementDoc, MovementLine
+from app.services.sales_rollup import SalesRollup
+from app.services.siigo_async import MovementFetchError
+
+
+@pytest.fixture
+def store(store, monkeypatch):
+    monkeypatch.setattr(movement_sync, "movement_store", store)
+    monkeypatch.setattr(movement_sync, "sales_rollup", SalesRollup(store, store.cache))
+    monkeypatch.setattr(movement_sync, "get_auth_token", lambda *a, **k: "token")
+    return store
+
+
+def test_sync_company_fills_only_missing_months(store, monkeypatch):
+    calls = []
+
+    async def fake_fetch(token, start, end, selected_types=None, priority=None, client=None, **k):
+        calls.append((start, end))
+        return [MovementLine(MovementDoc(date=start, doc_type="FV", doc_number=f"FV-{start}"), code="7701", quantity=1)]
+
+    monkeypatch.setattr(movement_sync, "fetch_consolidated_movements", fake_fetch)
+    company = {"name": "ACME", "username": "u", "access_key": "k"}
+    events = []
+
+    rows, err = movement_sync.sync_company(company, "2024-01-01", "2024-02-29", progress_callback=events.append)
+    assert err is None
+    assert calls == [("2024-01-01", "2024-02-29")]
+    assert [r["doc_number"] for r in rows] == ["FV-2024-01-01"]
+    assert events[-1]["stage"] == "done"
+
+    # Second call is fully answered from the store
+    calls.clear()
+    rows, err = movement_sync.sync_company(company, "2024-01-01", "2024-03-31")
+    assert calls == [("2024-03-01", "2024-03-31")]
+    assert len(rows) == 2
+    assert all(r["company"] == "ACME" for r in rows)
+
+
+def test_sync_updates_sales_rollup(store, monkeypatch):
+    async def fake_fetch(token, start, end, selected_types=None, priority=None, client=None, **k):
+        doc = MovementDoc(date="2024-04-02", doc_type="FV", doc_number="FV-1")
+        return [MovementLine(doc, code="EVO-7701", quantity=2), MovementLine(doc, code="7701EX", quantity=-1)]
+
+    monkeypatch.setattr(movement_sync, "fetch_consolidated_movements", fake_fetch)
+    movement_sync.sync_company({"name": "ACME", "username": "u", "access_key": "k"}, "2024-04-01", "2024-04-30",
+                               doc_types=["FV"], read_result=False)
+    assert movement_sync.sales_rollup.load("ACME")["days"] == {"2024-04-02": {"7701": [3.0, 2]}}
+
+
+def test_empty_gap_is_recorded_as_covered_but_failed_fetch_is_not(store, monkeypatch):
+    calls = []
+    fail = {"on": True}
+
+    async def fake_fetch(token, start, end, selected_types=None, priority=None, client=None, strict=False):
+        calls.append((start, end))
+        if fail["on"]:
+            raise MovementFetchError(["invoices"], [], [])
+        return []
+
+    monkeypatch.setattr(movement_sync, "fetch_consolidated_movements", fake_fetch)
+    company = {"name": "ACME", "username": "u", "access_key": "k"}
+
+    rows, err = movement_sync.sync_company(company, "2024-05-01", "2024-05-31", doc_types=["FV"])
+    assert rows == [] and "2024-05-01" in err
+    assert store.plan_gaps("ACME", "2024-05-01", "2024-05-31", ["FV"]) == [("2024-05-01", "2024-05-31")]
+
+    fail["on"] = False
+    rows, err = movement_sync.sync_company(company, "2024-05-01", "2024-05-31", doc_types=["FV"])
+    assert rows == [] and err is None
+    assert store.plan_gaps("ACME", "2024-05-01", "2024-05-31", ["FV"]) == []
+    calls.clear()
+    movement_sync.sync_company(company, "2024-05-01", "2024-05-31", doc_types=["FV"])
+    assert calls == []
+
+
+def test_failed_first_page_leaves_gap_uncovered(store, monkeypatch):
+    from app.services import siigo_async
+
+    async def no_page(*a, **k):
+        return None
+
+    monkeypatch.setattr(siigo_async, "get_documents", no_page)
+    company = {"name": "ACME", "username": "u", "access_key": "k"}
+    events = []
+
+    rows, err = movement_sync.sync_company(company, "2024-06-01", "2024-06-30", doc_types=["FV"],
+                                           progress_callback=events.append)
+    assert rows == [] and "invoices" in err
+    stages = [e["stage"] for e in events]
+    assert "gap_error" in stages and "gap_empty" not in stages
+    assert store.plan_gaps("ACME", "2024-06-01", "2024-06-30", ["FV"]) == [("2024-06-01", "2024-06-30")]
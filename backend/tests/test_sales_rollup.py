@@ -0,0 +1,38 @@
+import pytest
+from app.services.sales_rollup import SalesRollup
+from conftest import make_row
+
+
+@pytest.fixture
+def rollup(store):
+    return SalesRollup(store, store.cache)
+
+
+def test_update_range_only_touches_its_days(rollup):
+    store = rollup.store
+    store.replace_range("A", "2024-01-01", "2024-01-31", [
+        make_row("2024-01-02", "FV-1", "7701", 2), make_row("2024-01-20", "FV-2", "7701", 1), make_row("2024-01-20", "NC-1", "7701", 5, "NC"),
+    ])
+    rollup.update_range("A", "2024-01-01", "2024-01-31")
+    assert rollup.daily_sales("A", "2024-01-01", "2024-01-31") == {"2024-01-02": {"7701": [2.0, 1]}, "2024-01-20": {"7701": [1.0, 1]}}
+
+    store.replace_range("A", "2024-01-20", "2024-01-31", [make_row("2024-01-21", "FV-3", "3001", 4)], doc_types=["FV"])
+    rollup.update_range("A", "2024-01-20", "2024-01-31")
+    days = rollup.daily_sales("A", "2024-01-01", "2024-01-31")
+    assert set(days) == {"2024-01-02", "2024-01-21"}
+
+
+def test_ensure_rebuilds_months_written_without_rollup(rollup):
+    rollup.store.replace_range("A", "2024-02-01", "2024-02-29", [make_row("2024-02-10", "FV-1", "EVO-7702", 3)])
+    assert rollup.daily_sales("A", "2024-02-01", "2024-02-29") == {"2024-02-10": {"7702": [3.0, 1]}}
+
+
+def test_partial_update_of_a_month_never_rolled_up_widens_to_the_month(rollup):
+    store = rollup.store
+    store.replace_range("A", "2026-09-01", "2026-09-10", [make_row("2026-09-03", "FV-1", "7701", 2)])
+    # Sync tail gap: only the last days are fetched and rolled up
+    store.replace_range("A", "2026-09-11", "2026-09-20", [make_row("2026-09-15", "FV-2", "7701", 1)])
+    rollup.update_range("A", "2026-09-11", "2026-09-20")
+    assert rollup.daily_sales("A", "2026-09-01", "2026-09-30") == {
+        "2026-09-03": {"7701": [2.0, 1]}, "2026-09-15": {"7701": [1.0, 1]},
+    }
@@ -0,0 +1,94 @@
+import asyncio
+import httpx
+import pytest
+from app.services import siigo_async
+
+
+def _client(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_documents_paginate_and_rescue_failed_pages(monkeypatch):
+    monkeypatch.setattr(siigo_async.asyncio, "sleep", _no_sleep)
+    failures = {"page3": 0}
+
+    def handler(request):
+        page = int(request.url.params["page"])
+        if page == 3 and failures["page3"] < 5:
+            # Fails through the whole tenacity budget once, then succeeds in the rescue pass
+            failures["page3"] += 1
+            return httpx.Response(503)
+        results = [{"id": f"{page}-{i}"} for i in range(100 if page < 3 else 50)]
+        return httpx.Response(200, json={"results": results, "pagination": {"total_results": 250}})
+
+    async def run():
+        async with _client(handler) as client:
+            return await siigo_async.fetch_all_documents("tok-docs", "invoices", "2024-01-01", "2024-01-31", client=client)
+
+    monkeypatch.setattr(siigo_async._get_json.retry, "wait", lambda *a, **k: 0)
+    docs = asyncio.run(run())
+    assert len(docs) == 250
+    assert failures["page3"] == 5
+
+
+def test_products_fail_whole_company_on_bad_page(monkeypatch):
+    def handler(request):
+        page = int(request.url.params["page"])
+        if page == 2:
+            return httpx.Response(404)
+        return httpx.Response(200, json={"results": [{"code": "1"}] * 100, "pagination": {"total_results": 300}})
+
+    async def run():
+        async with _client(handler) as client:
+            return await siigo_async.fetch_all_products("tok-products", client=client)
+
+    with pytest.raises(Exception, match="Failed to fetch page 2"):
+        asyncio.run(run())
+
+
+_real_sleep = asyncio.sleep
+
+
+async def _no_sleep(delay, *args):
+    await _real_sleep(0)
+
+
+def test_consolidated_movements_are_flattened_per_page():
+    def handler(request):
+        page = int(request.url.params["page"])
+        docs = [{
+            "date": "2024-01-31" if page == 1 else "2024-02-01",  # page 2 is outside the range
+            "name": f"FV-{page}-{i}",
+            "items": [{"code": "7701", "quantity": 1, "price": 10, "total": 10}],
+        } for i in range(100 if page == 1 else 20)]
+        return httpx.Response(200, json={"results": docs, "pagination": {"total_results": 120}})
+
+    async def run():
+        async with _client(handler) as client:
+            return await siigo_async.fetch_consolidated_movements(
+                "tok-movs", "2024-01-01", "2024-01-31", selected_types=["FV"], client=client)
+
+    movs = asyncio.run(run())
+    assert len(movs) == 100
+    assert {m.doc_type for m in movs} == {"FV"}
+
+
+def test_sync_calls_share_one_loop_and_client_and_report_http_stats():
+    from app.services import http_client
+
+    async def grab():
+        async with siigo_async.siigo_client() as client:
+            return asyncio.get_running_loop(), client
+
+    assert siigo_async.run_sync(grab()) == siigo_async.run_sync(grab())
+
+    def handler(request):
+        return httpx.Response(200, json={"results": []})
+
+    async def call():
+        async with _client(handler) as client:
+            return await siigo_async._get_json(client, "https://stats.siigo.test/v1/x", {"Authorization": "Bearer t"}, {}, 5, 0)
+
+    before = http_client.stats().get("stats.siigo.test", {}).get("requests", 0)
+    siigo_async.run_sync(call())
+    assert http_client.stats()["stats.siigo.test"]["requests"] == before + 1
@@ -0,0 +1,85 @@
+import threading
+import time
+from app.services.siigo_scheduler import SiigoScheduler, INTERACTIVE, BACKGROUND, MIN_CONCURRENCY
+
+
+class _Resp:
+    def __init__(self, status, headers=None):
+        self.status_code = status
+        self.headers = headers or {}
+
+
+def test_429_halves_limit_and_pauses_credential():
+    sched = SiigoScheduler()
+    before = sched.stats()["concurrency_limit"]
+    with sched.slot("acme") as ticket:
+        ticket.observe(_Resp(429, {"Retry-After": "0.3"}))
+    assert sched.stats()["concurrency_limit"] == max(MIN_CONCURRENCY, before / 2)
+    assert sched.stats()["throttled"] == 1
+
+    start = time.monotonic()
+    with sched.slot("acme"):
+        pass
+    assert time.monotonic() - start >= 0.25
+    # Other credentials are not paused
+    start = time.monotonic()
+    with sched.slot("other"):
+        pass
+    assert time.monotonic() - start < 0.2
+
+
+def test_background_yields_to_interactive():
+    sched = SiigoScheduler()
+    sched._limit = 1.0
+    order = []
+    blocker = sched.acquire("a", INTERACTIVE)
+
+    def run(priority, name):
+        with sched.slot(name, priority):
+            order.append(priority)
+
+    bg = threading.Thread(target=run, args=(BACKGROUND, "b"))
+    bg.start()
+    time.sleep(0.1)
+    fg = threading.Thread(target=run, args=(INTERACTIVE, "c"))
+    fg.start()
+    time.sleep(0.1)
+    sched.release(blocker, 0.01)
+    fg.join(5)
+    bg.join(5)
+    assert order == [INTERACTIVE, BACKGROUND]
+
+
+def test_tokens_share_their_company_bucket_and_idle_buckets_are_evicted(monkeypatch):
+    from app.services import siigo_scheduler as mod
+
+    mod.register_token("tok-1", "acme@x.com")
+    assert mod.credential_key("Bearer tok-1") == mod.credential_key("acme@x.com")
+    mod.register_token("tok-2", "acme@x.com")  # rotation
+    assert mod.credential_key("Bearer tok-2") == mod.credential_key("acme@x.com")
+    assert mod.credential_key("Bearer tok-1") != mod.credential_key("acme@x.com")
+    mod.forget_token("tok-2")
+
+    sched = SiigoScheduler()
+    with sched.slot("old"):
+        pass
+    monkeypatch.setattr(mod, "BUCKET_IDLE_S", 0)
+    with sched.slot("new"):
+        pass
+    assert sched.stats()["credential_buckets"] == 1
+
+
+def test_background_is_not_stalled_by_paused_interactive_credential():
+    sched = SiigoScheduler()
+    with sched.slot("paused") as ticket:
+        ticket.observe(_Resp(429, {"Retry-After": "1.5"}))
+    fg = threading.Thread(target=lambda: sched.release(sched.acquire("paused", INTERACTIVE), 0.01))
+    fg.start()
+    time.sleep(0.1)
+    assert sched.stats()["waiting_interactive"] == 1
+
+    start = time.monotonic()
+    with sched.slot("other", BACKGROUND):
+        pass
+    assert time.monotonic() - start < 0.5
+    fg.join(5)
@@ -0,0 +1,36 @@
+import pandas as pd
+
+from app.services.sku_catalog import SkuCatalog, canonical_sku, sku_catalog
+from app.services.utils import normalize_sku
+from app.services import conciliacion
+
+
+def test_canonical_rule_covers_every_former_normalizer():
+    assert canonical_sku("EVO-7701") == "7701"
+    assert canonical_sku("7007EXENTO") == "7007"
+    assert canonical_sku(" 7701.1 ") == "7701"
+    assert canonical_sku(7210.0) == "7210"       # sheets floats (conciliación)
+    assert canonical_sku("SD15") == "SD15"       # kept as is (conciliación)
+    assert canonical_sku("INSUMO tapa") == "INSUMO TAPA"
+    assert canonical_sku(None) == "N/A"
+    assert normalize_sku("evo7702") == "7702"
+    assert conciliacion.normalize_sku("") == "" and conciliacion.normalize_sku("7703EX") == "7703"
+
+
+def test_aliases_batch_and_business_data():
+    catalog = SkuCatalog({"7701": 25}, {"7701"})
+    assert catalog.register(["EVO-7701", "7701", "EVO-7701", None]) == 2
+    assert catalog.register(["7701"]) == 0
+    assert catalog.normalize_many(["EVO-7701", "3001X", "EVO-7701"]) == ["7701", "3001", "7701"]
+    assert catalog.stats()["aliases"] == 2
+
+    codes = pd.Series(["E-7701", None, "7701"])
+    assert list(catalog.normalize_series(codes)) == ["7701", "N/A", "7701"]
+    assert catalog.packaging_unit("EVO-7701") == 25 and catalog.packaging_unit("9999") == 1
+    assert "7701" in sku_catalog.game_skus and sku_catalog.packaging_unit("EVO-7703") == 150
+
+
+def test_conciliacion_matches_codes_with_leading_zeros():
+    assert conciliacion.normalize_sku("0123") == conciliacion.normalize_sku(123) == conciliacion.normalize_sku(123.0) == "123"
+    assert conciliacion.normalize_sku("EVO-0701") == "701"
+    assert conciliacion.normalize_sku("SD15") == "SD15"
@@ -0,0 +1,59 @@
+from app.services import stock_history
+
+
+def test_history_series_reconstructs_stock_backwards():
+    dates = ["2024-01-01", "2024-01-02", "2024-01-03"]
+    daily = {
+        "2024-01-02": {"7701": 3.0, "3001": 1.0},
+        "2024-01-03": {"7701": 2.0},
+        "2023-12-31": {"7701": 50.0},  # outside the chart
+    }
+    res = stock_history.history_series(["7701", "3001", "9999"], dates, {"7701": 10, "3001": 0}, daily)
+
+    assert [p["stock"] for p in res["7701"]] == [15.0, 12.0, 10.0]
+    assert [p["sales"] for p in res["7701"]] == [0.0, 3.0, 2.0]
+    assert [p["stock"] for p in res["3001"]] == [1.0, 0.0, 0.0]
+    assert all(p["stock"] == 0 and p["sales"] == 0 for p in res["9999"])
+
+
+def test_products_history_reads_rollup_after_one_sync(monkeypatch):
+    syncs = []
+
+    async def fake_sync(companies, start, end, doc_types=None, **k):
+        syncs.append((tuple(c["name"] for c in companies), doc_types))
+        return [([], None) for _ in companies]
+
+    class FakeRollup:
+        def daily_sales(self, company, start, end):
+            return {end: {"7701": [2.0, 1]}}
+
+    monkeypatch.setattr(stock_history, "get_config", lambda: [
+        {"name": "A", "valid": True}, {"name": "B", "valid": True}, {"name": "C"},
+    ])
+    monkeypatch.setattr(stock_history, "sync_companies_async", fake_sync)
+    monkeypatch.setattr(stock_history, "sales_rollup", FakeRollup())
+
+    res = stock_history.get_products_history(["7701", "3001"], days=5, current_stocks={"7701": 1})
+    assert syncs == [(("A", "B"), ["FV"])]
+    assert len(res["7701"]) == 6
+    assert res["7701"][-1]["sales"] == 4.0 and res["7701"][0]["stock"] == 5.0
+    assert stock_history.get_product_history("7701", 5, 1) == res["7701"]
+
+
+def test_history_endpoints_reject_out_of_range_days(monkeypatch):
+    import pytest
+    from fastapi import HTTPException
+    from app.routers import inventory_router
+
+    body = {"items": [{"sku": "7701", "current_stock": 1}]}
+    for days in (0, -3, inventory_router.MAX_HISTORY_DAYS + 1):
+        with pytest.raises(HTTPException) as exc:
+            inventory_router.get_inventory_history_batch(dict(body, days=days), user={})
+        assert exc.value.status_code == 400
+    for days in (0, -3):
+        with pytest.raises(HTTPException) as exc:
+            inventory_router.get_inventory_history("7701", days, 1.0, user={})
+        assert exc.value.status_code == 400
+    # The single-SKU endpoint keeps accepting long ranges
+    monkeypatch.setattr(inventory_router, "get_product_history", lambda sku, days, stock: {"days": days})
+    assert inventory_router.get_inventory_history("7701", 400, 1.0, user={}) == {"days": 400}
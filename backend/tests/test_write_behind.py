@@ -0,0 +1,52 @@
+import threading
+import time
+
+from app.services.write_behind import WriteBehindQueue
+
+
+def test_bursts_coalesce_and_uploads_per_key_are_ordered():
+    gate = threading.Event()
+    uploaded = []
+
+    def upload(key, job):
+        gate.wait(2)
+        uploaded.append((key, job))
+
+    q = WriteBehindQueue(upload, max_pending=10, workers=2)
+    q.submit("a", 1)
+    time.sleep(0.05)             # "a"=1 is uploading (blocked on the gate)
+    for v in (2, 3, 4):
+        q.submit("a", v)         # queued behind it, coalesced to the newest
+    q.submit("b", 1)
+    assert q.has_pending("a")
+    gate.set()
+    assert q.flush(timeout=2)
+    assert [j for k, j in uploaded if k == "a"] == [1, 4]
+    stats = q.stats()
+    assert stats["coalesced"] == 2 and stats["uploaded"] == 3 and stats["pending"] == 0
+
+
+def test_full_queue_applies_back_pressure():
+    gate = threading.Event()
+    q = WriteBehindQueue(lambda k, j: gate.wait(2), max_pending=1, workers=1)
+    q.submit("a", 1)
+    time.sleep(0.05)
+    q.submit("b", 1)             # fills the only slot
+    assert q.submit("c", 1, timeout=0.1) is False
+    gate.set()
+    assert q.submit("c", 1, timeout=2) and q.flush(timeout=2)
+    assert q.stats()["blocked"] == 2
+
+
+def test_failed_uploads_are_retried(monkeypatch):
+    monkeypatch.setattr(WriteBehindQueue, "RETRY_BACKOFF_S", 0)
+    attempts = []
+
+    def flaky(key, job):
+        attempts.append(key)
+        if len(attempts) < 2:
+            raise IOError("503")
+
+    q = WriteBehindQueue(flaky, workers=1)
+    q.submit("k", 1)
+    assert q.flush(timeout=2) and attempts == ["k", "k"] and q.stats()["failed"] == 0